@@ -0,0 +1,55 @@
+import gzip
+import logging
+from bson import json_util
+from constants import *
+from message_codec import compress, decompress, default_codec
+from datetime import datetime
+from storage import StorageBackend, get_default_backend
+
+logging.basicConfig(filename='message_chat.log', level=logging.DEBUG, format = LOG_FORMAT)
+
+class MessageArchive():
+    """ Class for keeping the messages that expired out of their rooms.
+        Every call to store() keeps one compressed batch, either as an archive batch in the storage backend or,
+            if an archive_file is given, as a gzip member appended to that file (one JSON message per line).
+        NOTE: the batches are kept in the storage backend given, or the default one (mongo unless configured otherwise)
+    """
+    def __init__(self, archive_file: str = None, backend: StorageBackend = None) -> None:
+        self.__archive_file = archive_file
+        self.__backend = None
+        if self.__archive_file is None:
+            # Set up the storage backend (mongo unless configured otherwise) for the archive
+            self.__backend = backend if backend is not None else get_default_backend()
+
+    def store(self, room_name: str, messages: list) -> int:
+        ''' This method will store a batch of ChatMessages of room_name in the archive and return how many were stored
+        '''
+        if len(messages) is EMPTY:
+            return EMPTY
+        serialized = [json_util.dumps(current_message.to_dict()) for current_message in messages]
+        if self.__archive_file is not None:
+            with gzip.open(self.__archive_file, 'ab') as archive_file:
+                archive_file.write(('\n'.join(serialized) + '\n').encode(BYTE_to_STRING))
+            logging.debug(f'{len(messages)} messages of {room_name} were appended to {self.__archive_file}.')
+            return len(messages)
+        sequence_numbers = [current_message.message_properties.sequence_number for current_message in messages]
+        codec = default_codec()
+        self.__backend.insert_archive_batch({ 'room_name': room_name,
+                                              'first_sequence_num': min(sequence_numbers),
+                                              'last_sequence_num': max(sequence_numbers),
+                                              'num_messages': len(messages),
+                                              'codec': codec,
+                                              'archive_time': datetime.now(),
+                                              'payload': compress('\n'.join(serialized).encode(BYTE_to_STRING), codec) })
+        logging.debug(f'{len(messages)} messages of {room_name} were archived to {type(self.__backend).__name__}.')
+        return len(messages)
+
+    def load(self, room_name: str) -> list:
+        ''' This method will return the archived messages of room_name as dictionaries, oldest batch first
+            NOTE: this only reads the storage backend, archive files can be read with gzip directly
+        '''
+        archived_messages = list()
+        for current_batch in self.__backend.load_archive_batches(room_name):
+            for current_line in decompress(current_batch['payload'], current_batch.get('codec', CODEC_ZLIB)).decode(BYTE_to_STRING).split('\n'):
+                archived_messages.append(json_util.loads(current_line))
+        return archived_messages
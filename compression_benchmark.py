@@ -0,0 +1,76 @@
+import time
+import random
+import orjson
+from constants import *
+from room import ChatMessage, MessageProperties
+from message_codec import available_codecs, compress, decompress, pack_message
+
+''' Benchmark of the bandwidth and CPU tradeoff of compressing message histories, no mongo or server needed.
+        - The first table is a /messages/ response of each size compressed with each codec and level (wire bytes)
+        - The second table is the message bodies of a room stored with each compression threshold (storage bytes)
+    NOTE: run it with python compression_benchmark.py, install zstandard to include zstd
+'''
+BENCHMARK_HISTORY_SIZES = (100, 1000, 10000)
+BENCHMARK_LEVELS = { CODEC_ZSTD: (1, 3, 9), CODEC_GZIP: (1, 6, 9), CODEC_ZLIB: (1, 6, 9) }
+BENCHMARK_THRESHOLDS = (256, 1024, 4096)
+BENCHMARK_REPEATS = 5
+BENCHMARK_WORDS = ('hello', 'room', 'message', 'kevin', 'chat', 'the', 'a', 'meeting', 'tomorrow', 'at', 'noon', 'thanks', 'see', 'you', 'ok', 'sure')
+
+def build_history(num_messages: int, seed: int = 313) -> list:
+    ''' This function will build num_messages ChatMessages with bodies of mostly short and a few long texts
+    '''
+    generator = random.Random(seed)
+    history = list()
+    for sequence_num in range(1, num_messages + 1):
+        num_words = generator.choice((4, 8, 12, 20, 400))
+        history.append(ChatMessage(message = ' '.join(generator.choice(BENCHMARK_WORDS) for _ in range(num_words)),
+                                   mess_props = MessageProperties(room_name = DEFAULT_PUBLIC_ROOM,
+                                                                  to_user = TEST_MEMBER_ALIAS,
+                                                                  from_user = TEST_OWNER_ALIAS,
+                                                                  mess_type = PUBLIC_MESSAGE,
+                                                                  sequence_num = sequence_num)))
+    return history
+
+def time_ms(function, *arguments) -> float:
+    ''' This function will return the best time of BENCHMARK_REPEATS calls of function in milliseconds
+    '''
+    best_time = None
+    for _ in range(BENCHMARK_REPEATS):
+        start = time.perf_counter()
+        function(*arguments)
+        elapsed = (time.perf_counter() - start) * 1000
+        best_time = elapsed if best_time is None else min(best_time, elapsed)
+    return best_time
+
+def benchmark_responses() -> None:
+    ''' This function will print the wire size and CPU time of history responses for every codec and level
+    '''
+    print(f'{"messages":>8} {"codec":>5} {"level":>5} {"bytes":>10} {"ratio":>6} {"comp ms":>8} {"decomp ms":>9}')
+    for num_messages in BENCHMARK_HISTORY_SIZES:
+        history = build_history(num_messages)
+        body = orjson.dumps({ 'message': { 'data': { 'message_texts': [current_message.message for current_message in history],
+                                                     'message_objects': [current_message.to_dict() for current_message in history],
+                                                     'num_messages': len(history) }}})
+        print(f'{num_messages:>8} {"none":>5} {"-":>5} {len(body):>10} {1:>6.2f} {0:>8.2f} {0:>9.2f}')
+        for codec in available_codecs():
+            for level in BENCHMARK_LEVELS[codec]:
+                compressed = compress(body, codec, level)
+                print(f'{num_messages:>8} {codec:>5} {level:>5} {len(compressed):>10} {len(body) / len(compressed):>6.2f} '
+                      f'{time_ms(compress, body, codec, level):>8.2f} {time_ms(decompress, compressed, codec):>9.2f}')
+
+def benchmark_storage() -> None:
+    ''' This function will print the stored size of the message bodies of a room for every compression threshold
+    '''
+    history = build_history(BENCHMARK_HISTORY_SIZES[-1])
+    raw_bytes = sum(len(current_message.message.encode(BYTE_to_STRING)) for current_message in history)
+    print(f'\n{"threshold":>9} {"stored bytes":>12} {"ratio":>6} {"compressed":>10} {"pack ms":>8}')
+    print(f'{"none":>9} {raw_bytes:>12} {1:>6.2f} {0:>10} {0:>8.2f}')
+    for threshold in BENCHMARK_THRESHOLDS:
+        packed = [pack_message(current_message.message, threshold) for current_message in history]
+        stored_bytes = sum(len(stored_message) if codec is not None else len(stored_message.encode(BYTE_to_STRING)) for stored_message, codec in packed)
+        pack_time = time_ms(lambda: [pack_message(current_message.message, threshold) for current_message in history])
+        print(f'{threshold:>9} {stored_bytes:>12} {raw_bytes / stored_bytes:>6.2f} {sum(codec is not None for _, codec in packed):>10} {pack_time:>8.2f}')
+
+if __name__ == '__main__':
+    benchmark_responses()
+    benchmark_storage()
@@ -6,6 +6,17 @@ MONGO_DB_AUTH_SOURCE = 'cpsc313'
 MONGO_DB_CLASS_DB = 'cpsc313'
 MONGO_DB_CLASS_ROOM_LIST = 'rooms'
 MONGO_DB_CLASS_USERS = 'users'
+MONGO_DB_READ_CURSORS = 'read_cursors'
+MONGO_DB_ARCHIVE = 'archive'
+CODEC_ZLIB = 'zlib'
+CODEC_GZIP = 'gzip'
+CODEC_ZSTD = 'zstd'
+PROFILE_TOKEN_ENV = 'CHAT_PROFILE_TOKEN'
+PROFILE_HEADER = 'X-Profile-Token'
+PROFILE_ID_HEADER = 'X-Profile-Id'
+PROFILE_DIR = 'profiles'
+PROFILE_SUFFIX = '.prof'
+PROBE_PATHS = ('/', '/healthz', '/readyz')
 MONGO_DB_AUTH_MECHANISM = 'SCRAM-SHA-256'
 DEFAULT_PUBLIC_ROOM = 'general'
 DEFAULT_PRIVATE_ROOM = 'kevin_private'
@@ -14,11 +25,35 @@ DEFAULT_USER_LIST_NAME = 'global'
 DEFAULT_OWNER_ALIAS = 'kevin'
 MONGO_DB_TEST = 'detest'
 MONGO_DB = 'cpsc313'
+MONGO_DB_LIST_DB = 'MONGO_DB'
+STORAGE_BACKEND_ENV = 'CHAT_STORAGE_BACKEND'
+STORAGE_PATH_ENV = 'CHAT_STORAGE_PATH'
+STORAGE_BACKEND_MONGO = 'mongo'
+STORAGE_BACKEND_SEGMENT = 'segment'
+DEFAULT_SEGMENT_PATH = 'chat_data'
+SEGMENT_SUFFIX = '.seg'
+SEQUENCE_FILE = 'sequence'
+ROOM_DOCUMENT_FILE = 'room.json'
+CATALOG_SUFFIX = '_catalog'
+SPOOL_DIR = 'spool'
+SPOOL_SUFFIX = '.spool'
+BREAKER_CLOSED = 'closed'
+BREAKER_OPEN = 'open'
+BREAKER_HALF_OPEN = 'half_open'
+MEDIA_TYPE_JSON = 'application/json'
+MEDIA_TYPE_MSGPACK = 'application/msgpack'
+MSGPACK_MEDIA_TYPES = ('application/msgpack', 'application/x-msgpack', 'application/vnd.msgpack')
+MEDIA_TYPE_NDJSON = 'application/x-ndjson'
+MEDIA_TYPE_HTML = 'text/html'
+PAGE_TEMPLATE_DIR = 'templates'
+SEND_PAGE_TEMPLATE = 'send.html'
+MESSAGES_PAGE_TEMPLATE = 'messages.html'
 
 # integer constants
 MONGO_DB_PORT = 27017
 ROOM_TYPE_PUBLIC = 100
 ROOM_TYPE_PRIVATE = 200
+ROOM_TYPE_EPHEMERAL = 300
 GET_ALL_MESSAGES = -1
 CHAT_ROOM_INDEX_NOT_FOUND = -1
 RIGHT_SIDE_OF_DEQUE = -1
@@ -26,6 +61,51 @@ RANGE_STEP = -1
 PRIVATE_MESSAGE = 200
 PUBLIC_MESSAGE = 100
 EMPTY = 0
+MARK_ALL_READ = -1
+READ_CURSOR_BATCH_SIZE = 100
+READ_CURSOR_FLUSH_SECONDS = 5
+INBOX_PAGE_SIZE = 50
+FEED_PAGE_SIZE = 50
+FEED_READ_CHUNK = 64
+ARCHIVE_INTERVAL_SECONDS = 60
+PERSIST_BATCH_SIZE = 500
+MAX_PENDING_WRITES = 1000
+ALIAS_SEND_RATE = 5
+ALIAS_SEND_BURST = 20
+ROOM_SEND_RATE = 50
+ROOM_SEND_BURST = 200
+EPHEMERAL_ROOM_SEND_RATE = 500
+EPHEMERAL_ROOM_SEND_BURST = 2000
+RATE_LIMIT_MAX_KEYS = 10000
+EPHEMERAL_BUFFER_SIZE = 1000
+ROOM_RESTORE_WORKERS = 8
+DEDUPE_CACHE_SIZE = 1000
+DEDUPE_TTL_SECONDS = 600
+DUPLICATE_KEY_ERROR = 11000
+CATALOG_UPDATE_RETRIES = 5
+STORAGE_FAILURE_THRESHOLD = 3
+STORAGE_RESET_SECONDS = 5
+STORAGE_TIMEOUT_MS = 5000
+COMPRESS_LEVEL = 6
+ZSTD_LEVEL = 3
+MESSAGE_COMPRESS_THRESHOLD = 1024
+RESPONSE_COMPRESS_MIN_BYTES = 1024
+RESPONSE_COMPRESS_LEVEL = 1
+SLOW_REQUEST_SECONDS = 0.5
+SLOW_REQUEST_LOG_SIZE = 100
+PROFILE_STATS_LINES = 40
+SEGMENT_MAX_BYTES = 8 * 1024 * 1024
+SPARSE_INDEX_INTERVAL = 64
+SEQUENCE_NUM_MAX = 2 ** 62
+RECORD_MESSAGE = 1
+RECORD_TOMBSTONE = 2
+RECORD_UPDATE = 3
+EXPORT_CHUNK_BYTES = 64 * 1024
+IMPORT_BATCH_SIZE = 1000
+STATS_MINUTES = 60
+STATS_HOURS = 48
+STATS_SAVE_SECONDS = 10
+PAGE_RENDER_BUFFER = 100
 
 # possibly unused constants
 LOG_FORMAT = '%(levelname)s -- %(message)s'
@@ -38,6 +118,9 @@ CREATE_ROOM_URL = 'http://127.0.0.1:8000/room'
 GET_USERS_URL = 'http://127.0.0.1:8000/users/'
 REGISTER_CLIENT_URL = 'http://127.0.0.1:8000/alias'
 GET_MESSAGES_URL = 'http://127.0.0.1:8000/messages/'
+ROOM_MEMBER_URL = 'http://127.0.0.1:8000/room/member'
+HEALTH_URL = 'http://127.0.0.1:8000/healthz'
+READY_URL = 'http://127.0.0.1:8000/readyz'
 STARTUP_TEST_DICTIONARY = { 'from' : 'kevin', 'to' : 'you :)' }
 TEST_API_ROOM = 'kevin_api_test_room'
 DEFAULT_TEST_API_MESSAGE = 'Kevin has sent this message through FastAPI!'
@@ -45,8 +128,13 @@ DEFAULT_TEST_API_MESSAGE = 'Kevin has sent this message through FastAPI!'
 # User/Room Test Constants
 TEST_USER_ALIAS = 'kevin'
 TEST_OWNER_ALIAS = 'kevin'
+TEST_MEMBER_ALIAS = 'kevin_member'
+TEST_CLIENT_MESSAGE_ID = 'kevin_client_message_1'
 TEST_USER_LIST = 'test_users_kevin'
 TEST_LIST_NAME = 'kevin_test_room_list'
+EPHEMERAL_TEST_ROOM = 'kevin_ephemeral_test_room'
+IMPORTED_TEST_ROOM = 'kevin_imported_test_room'
+ESCAPING_TEST_ROOM = '../kevin_escaping_test_room'
 DEFAULT_TEST_ROOM = 'kevin_test_room'
 DEFAULT_PUBLIC_TEST_MESSAGE = 'Kevin has sent this message publicly.'
 DEFAULT_PRIVATE_TEST_MESSAGE = 'Kevin has sent this message privately.'
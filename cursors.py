@@ -0,0 +1,96 @@
+import logging
+import threading
+import time
+from constants import *
+from storage import StorageBackend, get_default_backend
+
+logging.basicConfig(filename='message_chat.log', level=logging.DEBUG, format = LOG_FORMAT)
+
+class ReadCursors():
+    """ Class for keeping the last read sequence number of every (user alias, room name) pair.
+        NOTE: cursors of an alias are loaded from storage the first time that alias is used
+        NOTE: changed cursors are written in batches, either when enough are pending or when enough time has passed
+                (the app also calls persist() every flush_seconds, so the last batch of a burst is not left waiting for another mark)
+        NOTE: the cursors are used from worker threads, a lock guards them
+        NOTE: the cursors are kept in the storage backend given, or the default one (mongo unless configured otherwise)
+    """
+    def __init__(self, batch_size: int = READ_CURSOR_BATCH_SIZE, flush_seconds: float = READ_CURSOR_FLUSH_SECONDS, backend: StorageBackend = None) -> None:
+        self.__cursors = dict()
+        self.__loaded_aliases = set()
+        self.__pending = set()
+        self.__batch_size = batch_size
+        self.__flush_seconds = flush_seconds
+        self.__last_flush = time.monotonic()
+        self.__lock = threading.RLock()
+        # Set up the storage backend (mongo unless configured otherwise) for the cursors
+        self.__backend = backend if backend is not None else get_default_backend()
+
+    # property to get the number of cursors waiting to be written
+    @property
+    def num_pending(self):
+        return len(self.__pending)
+
+    # property to get how often the pending cursors should be written
+    @property
+    def flush_seconds(self):
+        return self.__flush_seconds
+
+    def __restore(self, alias: str) -> None:
+        ''' This is a helper method to load the cursors of one alias from storage, only once per alias
+        '''
+        with self.__lock:
+            if alias in self.__loaded_aliases:
+                return
+            for current_cursor in self.__backend.load_read_cursors(alias):
+                cursor_key = (alias, current_cursor['room_name'])
+                self.__cursors[cursor_key] = max(self.__cursors.get(cursor_key, EMPTY), current_cursor['last_read'])
+            self.__loaded_aliases.add(alias)
+        logging.debug(f'Read cursors for {alias} were restored.')
+
+    def get(self, alias: str, room_name: str) -> int:
+        ''' This method will return the last sequence number alias has read in room_name (0 if nothing was read)
+        '''
+        self.__restore(alias)
+        with self.__lock:
+            return self.__cursors.get((alias, room_name), EMPTY)
+
+    def mark_read(self, alias: str, room_name: str, sequence_num: int) -> bool:
+        ''' This method will move the cursor of alias in room_name forward to sequence_num
+            NOTE: cursors never move backwards, a lower sequence number is ignored and False is returned
+        '''
+        with self.__lock:
+            if sequence_num <= self.get(alias = alias, room_name = room_name):
+                logging.debug(f'Cursor of {alias} in {room_name} is already at or past {sequence_num}.')
+                return False
+            self.__cursors[(alias, room_name)] = sequence_num
+            self.__pending.add((alias, room_name))
+            logging.debug(f'Cursor of {alias} in {room_name} moved to {sequence_num}.')
+            flush_due = len(self.__pending) >= self.__batch_size or time.monotonic() - self.__last_flush >= self.__flush_seconds
+        if flush_due is True:
+            self.persist()
+        return True
+
+    def unread_count(self, alias: str, room_name: str, last_sequence_num: int) -> int:
+        ''' This method will return how many messages up to last_sequence_num alias has not read in room_name
+        '''
+        return max(EMPTY, last_sequence_num - self.get(alias = alias, room_name = room_name))
+
+    def persist(self) -> int:
+        ''' This method will write all pending cursors to storage in a single write
+            NOTE: storage keeps the highest cursor, so a slower writer can never move a stored cursor backwards
+            NOTE: the cursors are taken out of the pending ones under the lock and written without it, they are pending again if the write fails
+        '''
+        with self.__lock:
+            self.__last_flush = time.monotonic()
+            if len(self.__pending) is EMPTY:
+                return EMPTY
+            cursor_updates = [{ 'alias': alias, 'room_name': room_name, 'last_read': self.__cursors[(alias, room_name)] } for alias, room_name in self.__pending]
+            self.__pending.clear()
+        try:
+            self.__backend.save_read_cursors(cursor_updates)
+        except:
+            with self.__lock:
+                self.__pending.update((current_cursor['alias'], current_cursor['room_name']) for current_cursor in cursor_updates)
+            raise
+        logging.info(f'{len(cursor_updates)} read cursors were persisted.')
+        return len(cursor_updates)
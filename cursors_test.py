@@ -0,0 +1,27 @@
+import unittest
+from constants import *
+from cursors import ReadCursors
+
+class ReadCursorsTest(unittest.TestCase):
+    """ This test environment will test the read cursors of users in rooms
+    """
+    def setUp(self) -> None:
+        ''' This setup method will make a ReadCursors instance that writes on every change
+        '''
+        self.__read_cursors = ReadCursors(batch_size = 1)
+
+    def test_mark_read(self):
+        ''' Marking a room as read should move the cursor forward but never backwards
+        '''
+        current_cursor = self.__read_cursors.get(alias = TEST_OWNER_ALIAS, room_name = DEFAULT_TEST_ROOM)
+        self.assertTrue(self.__read_cursors.mark_read(alias = TEST_OWNER_ALIAS, room_name = DEFAULT_TEST_ROOM, sequence_num = current_cursor + 1))
+        self.assertFalse(self.__read_cursors.mark_read(alias = TEST_OWNER_ALIAS, room_name = DEFAULT_TEST_ROOM, sequence_num = current_cursor))
+        self.assertEqual(self.__read_cursors.num_pending, EMPTY)
+        self.assertEqual(ReadCursors().get(alias = TEST_OWNER_ALIAS, room_name = DEFAULT_TEST_ROOM), current_cursor + 1)
+
+    def test_unread_count(self):
+        ''' The unread count should be the distance between the cursor and the last sequence number of the room
+        '''
+        current_cursor = self.__read_cursors.get(alias = TEST_OWNER_ALIAS, room_name = DEFAULT_TEST_ROOM)
+        self.assertEqual(self.__read_cursors.unread_count(alias = TEST_OWNER_ALIAS, room_name = DEFAULT_TEST_ROOM, last_sequence_num = current_cursor + 3), 3)
+        self.assertEqual(self.__read_cursors.unread_count(alias = TEST_OWNER_ALIAS, room_name = DEFAULT_TEST_ROOM, last_sequence_num = current_cursor), EMPTY)
@@ -0,0 +1,60 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+from constants import *
+
+logging.basicConfig(filename='message_chat.log', level=logging.DEBUG, format = LOG_FORMAT)
+
+class DedupeCache():
+    """ Class for remembering what was done for the most recent keys (client message ids), for at most ttl_seconds each.
+        NOTE: it is a bounded LRU, the least recently used key is forgotten once there are more than max_entries keys
+        NOTE: every method takes the lock of the cache, lookups reorder the entries so even they are not read-only
+    """
+    def __init__(self, max_entries: int = DEDUPE_CACHE_SIZE, ttl_seconds: float = DEDUPE_TTL_SECONDS) -> None:
+        self.__max_entries = max_entries
+        self.__ttl_seconds = ttl_seconds
+        self.__entries = OrderedDict()
+        self.__hits = EMPTY
+        self.__lock = threading.Lock()
+
+    # property to get the number of keys remembered
+    @property
+    def num_entries(self):
+        return len(self.__entries)
+
+    # property to get how many lookups found a remembered key
+    @property
+    def hits(self):
+        return self.__hits
+
+    def get(self, key):
+        ''' This method will return the value remembered for key, or None if it is unknown or too old
+        '''
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is None:
+                return None
+            value, expire_time = entry
+            if expire_time < time.monotonic():
+                del self.__entries[key]
+                return None
+            self.__entries.move_to_end(key)
+            self.__hits += 1
+            return value
+
+    def put(self, key, value) -> None:
+        ''' This method will remember value for key, forgetting the least recently used keys when the cache is full
+        '''
+        with self.__lock:
+            self.__entries[key] = (value, time.monotonic() + self.__ttl_seconds)
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.__max_entries:
+                forgotten_key, _ = self.__entries.popitem(last = False)
+                logging.debug(f'{forgotten_key} was forgotten by the dedupe cache.')
+
+    def discard(self, key) -> None:
+        ''' This method will forget key, if it is remembered
+        '''
+        with self.__lock:
+            self.__entries.pop(key, None)
@@ -0,0 +1,28 @@
+import time
+import unittest
+from constants import *
+from dedupe import DedupeCache
+
+class DedupeTest(unittest.TestCase):
+    """ This test environment will test the cache used to answer retried sends without sending them again
+    """
+    def test_least_recently_used(self):
+        ''' The cache should forget the least recently used key once it is full
+        '''
+        test_cache = DedupeCache(max_entries = 2, ttl_seconds = 60)
+        test_cache.put(TEST_CLIENT_MESSAGE_ID, DEFAULT_PUBLIC_TEST_MESSAGE)
+        test_cache.put(TEST_OWNER_ALIAS, DEFAULT_PRIVATE_TEST_MESSAGE)
+        self.assertEqual(test_cache.get(TEST_CLIENT_MESSAGE_ID), DEFAULT_PUBLIC_TEST_MESSAGE)
+        test_cache.put(TEST_MEMBER_ALIAS, DEFAULT_FULL_CASE_TEST_MESSAGE)
+        self.assertIsNone(test_cache.get(TEST_OWNER_ALIAS))
+        self.assertEqual(test_cache.num_entries, 2)
+        self.assertEqual(test_cache.hits, 1)
+
+    def test_time_to_live(self):
+        ''' A key should be forgotten once it is older than the time to live
+        '''
+        test_cache = DedupeCache(max_entries = 2, ttl_seconds = 0.01)
+        test_cache.put(TEST_CLIENT_MESSAGE_ID, DEFAULT_PUBLIC_TEST_MESSAGE)
+        time.sleep(0.02)
+        self.assertIsNone(test_cache.get(TEST_CLIENT_MESSAGE_ID))
+        self.assertEqual(test_cache.num_entries, EMPTY)
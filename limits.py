@@ -0,0 +1,87 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+from constants import *
+
+logging.basicConfig(filename='message_chat.log', level=logging.DEBUG, format = LOG_FORMAT)
+
+class TokenBucket():
+    """ Class for a single token bucket: it holds up to burst tokens and refills rate tokens every second.
+    """
+    def __init__(self, rate: float, burst: int) -> None:
+        self.__rate = rate
+        self.__burst = burst
+        self.__tokens = float(burst)
+        self.__last_refill = time.monotonic()
+
+    # property to get the tokens left in the bucket
+    @property
+    def tokens(self):
+        return self.__tokens
+
+    def try_acquire(self):
+        ''' This method will take one token out of the bucket if there is one
+            NOTE: returns whether a token was taken and how many seconds to wait for the next one (0 if it was taken)
+        '''
+        now = time.monotonic()
+        self.__tokens = min(float(self.__burst), self.__tokens + (now - self.__last_refill) * self.__rate)
+        self.__last_refill = now
+        if self.__tokens >= 1:
+            self.__tokens -= 1
+            return True, 0.0
+        return False, (1 - self.__tokens) / self.__rate
+
+    def refund(self) -> None:
+        ''' This method will put back a token taken for a request that was rejected by a later check
+        '''
+        self.__tokens = min(float(self.__burst), self.__tokens + 1)
+
+class RateLimiter():
+    """ Class for keeping a TokenBucket per key (an alias or a room name) and counting the rejections of each kind.
+        NOTE: at most max_keys buckets are kept, the least recently used one is dropped first (it has most likely refilled to burst,
+                and a dropped key simply gets a full bucket again)
+        NOTE: the limiter is shared by every request, a lock guards the buckets
+    """
+    def __init__(self, rate: float, burst: int, max_keys: int = RATE_LIMIT_MAX_KEYS) -> None:
+        self.__rate = rate
+        self.__burst = burst
+        self.__max_keys = max_keys
+        self.__buckets = OrderedDict()
+        self.__rejections = EMPTY
+        self.__lock = threading.Lock()
+
+    # property to get how many requests were rejected by this limiter
+    @property
+    def rejections(self):
+        return self.__rejections
+
+    # property to get how many keys have a bucket
+    @property
+    def num_keys(self):
+        return len(self.__buckets)
+
+    def try_acquire(self, key: str):
+        ''' This method will take a token from the bucket of key, creating a full bucket the first time key is seen
+            NOTE: returns whether the request can go ahead and how many seconds to wait before retrying
+        '''
+        with self.__lock:
+            if key in self.__buckets:
+                self.__buckets.move_to_end(key)
+            else:
+                while len(self.__buckets) >= self.__max_keys:
+                    self.__buckets.popitem(last = False)
+                self.__buckets[key] = TokenBucket(rate = self.__rate, burst = self.__burst)
+            acquired, retry_after = self.__buckets[key].try_acquire()
+            if acquired is False:
+                self.__rejections += 1
+        if acquired is False:
+            logging.debug(f'{key} is over its rate limit, retry after {retry_after:.2f} seconds.')
+        return acquired, retry_after
+
+    def refund(self, key: str) -> None:
+        ''' This method will put back the token taken for key, when the request was rejected by a later check
+        '''
+        with self.__lock:
+            if key in self.__buckets:
+                self.__buckets[key].refund()
@@ -0,0 +1,56 @@
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from constants import *
+from limits import TokenBucket, RateLimiter
+
+class LimitsTest(unittest.TestCase):
+    """ This test environment will test the token buckets used to rate limit sending messages
+    """
+    def test_bucket(self):
+        ''' A bucket should let burst requests through and then ask the caller to wait
+        '''
+        test_bucket = TokenBucket(rate = 1, burst = 2)
+        self.assertTrue(test_bucket.try_acquire()[0])
+        self.assertTrue(test_bucket.try_acquire()[0])
+        acquired, retry_after = test_bucket.try_acquire()
+        self.assertFalse(acquired)
+        self.assertGreater(retry_after, 0)
+
+    def test_limiter(self):
+        ''' Every key should get its own bucket and rejections should be counted
+        '''
+        test_limiter = RateLimiter(rate = 1, burst = 1)
+        self.assertTrue(test_limiter.try_acquire(TEST_OWNER_ALIAS)[0])
+        self.assertFalse(test_limiter.try_acquire(TEST_OWNER_ALIAS)[0])
+        self.assertTrue(test_limiter.try_acquire(TEST_MEMBER_ALIAS)[0])
+        self.assertEqual(test_limiter.rejections, 1)
+
+    def test_bounded_keys(self):
+        ''' The limiter should keep at most max_keys buckets, dropping the least recently used key first
+        '''
+        test_limiter = RateLimiter(rate = 1, burst = 1, max_keys = 2)
+        self.assertTrue(test_limiter.try_acquire(TEST_OWNER_ALIAS)[0])
+        self.assertTrue(test_limiter.try_acquire(TEST_MEMBER_ALIAS)[0])
+        self.assertFalse(test_limiter.try_acquire(TEST_OWNER_ALIAS)[0])
+        for current_key in range(10):
+            test_limiter.try_acquire(f'{TEST_MEMBER_ALIAS} {current_key}')
+        self.assertEqual(test_limiter.num_keys, 2)
+
+    def test_refund(self):
+        ''' A refunded token should be usable again, without going over burst
+        '''
+        test_limiter = RateLimiter(rate = 0.001, burst = 1)
+        self.assertTrue(test_limiter.try_acquire(TEST_OWNER_ALIAS)[0])
+        test_limiter.refund(TEST_OWNER_ALIAS)
+        test_limiter.refund(TEST_OWNER_ALIAS)
+        self.assertTrue(test_limiter.try_acquire(TEST_OWNER_ALIAS)[0])
+        self.assertFalse(test_limiter.try_acquire(TEST_OWNER_ALIAS)[0])
+
+    def test_concurrent_acquire(self):
+        ''' Requests from many threads should never take more than burst tokens of one key
+        '''
+        test_limiter = RateLimiter(rate = 0.001, burst = 50)
+        with ThreadPoolExecutor(max_workers = 8) as executor:
+            acquired = list(executor.map(lambda _: test_limiter.try_acquire(TEST_OWNER_ALIAS)[0], range(400)))
+        self.assertEqual(acquired.count(True), 50)
+        self.assertEqual(test_limiter.rejections, 350)
@@ -0,0 +1,113 @@
+import gzip
+import zlib
+import logging
+from constants import *
+
+logging.basicConfig(filename='message_chat.log', level=logging.DEBUG, format = LOG_FORMAT)
+
+''' zstandard is optional, without it only the zlib and gzip codecs are available
+'''
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+def available_codecs() -> tuple:
+    ''' This function will return the codecs that can be used here, best first
+    '''
+    if zstandard is not None:
+        return (CODEC_ZSTD, CODEC_GZIP, CODEC_ZLIB)
+    return (CODEC_GZIP, CODEC_ZLIB)
+
+def default_codec() -> str:
+    ''' This function will return the codec used to store message bodies and archive batches (zstd if it is installed, zlib if not)
+    '''
+    return CODEC_ZSTD if zstandard is not None else CODEC_ZLIB
+
+def compress(data: bytes, codec: str, level: int = None) -> bytes:
+    ''' This function will compress data with codec, at level if one is given
+    '''
+    if codec == CODEC_ZSTD and zstandard is not None:
+        return zstandard.ZstdCompressor(level = ZSTD_LEVEL if level is None else level).compress(data)
+    if codec == CODEC_GZIP:
+        return gzip.compress(data, compresslevel = COMPRESS_LEVEL if level is None else level)
+    if codec == CODEC_ZLIB:
+        return zlib.compress(data, COMPRESS_LEVEL if level is None else level)
+    raise ValueError(f'Unknown codec {codec}.')
+
+def decompress(data: bytes, codec: str) -> bytes:
+    ''' This function will decompress data that was compressed with codec
+        NOTE: zstd goes through a decompressobj, streamed frames do not have their content size in the header
+    '''
+    if codec == CODEC_ZSTD and zstandard is not None:
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    if codec == CODEC_GZIP:
+        return gzip.decompress(data)
+    if codec == CODEC_ZLIB:
+        return zlib.decompress(data)
+    raise ValueError(f'Unknown codec {codec}.')
+
+class StreamCompressor():
+    """ Class for compressing a body that is sent a chunk at a time (streamed exports and pages) with codec.
+        NOTE: every chunk is flushed, so the client can decode what it has received without waiting for the end of the body
+    """
+    def __init__(self, codec: str, level: int = None) -> None:
+        if codec == CODEC_ZSTD and zstandard is not None:
+            self.__compressor = zstandard.ZstdCompressor(level = ZSTD_LEVEL if level is None else level).compressobj()
+            self.__chunk_flush = zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        elif codec in (CODEC_GZIP, CODEC_ZLIB):
+            # 16 more window bits makes zlib write a gzip header and trailer
+            self.__compressor = zlib.compressobj(COMPRESS_LEVEL if level is None else level, zlib.DEFLATED, zlib.MAX_WBITS + (16 if codec == CODEC_GZIP else EMPTY))
+            self.__chunk_flush = zlib.Z_SYNC_FLUSH
+        else:
+            raise ValueError(f'Unknown codec {codec}.')
+
+    def compress(self, chunk: bytes) -> bytes:
+        ''' This method will return the compressed bytes of chunk, flushed
+        '''
+        return self.__compressor.compress(chunk) + self.__compressor.flush(self.__chunk_flush)
+
+    def finish(self) -> bytes:
+        ''' This method will return the end of the compressed body
+        '''
+        return self.__compressor.flush()
+
+def negotiate_encoding(accept_encoding: str) -> str:
+    ''' This function will pick the best codec of available_codecs() that an Accept-Encoding header allows, or None
+        NOTE: codecs with q=0 are refused, the other quality values are not ranked, the server order wins
+    '''
+    accepted = set()
+    for current_coding in accept_encoding.lower().split(','):
+        coding, _, quality = current_coding.strip().partition(';')
+        quality = quality.replace(' ', '')
+        if quality.startswith('q='):
+            try:
+                if float(quality[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(coding.strip())
+    for current_codec in available_codecs():
+        if current_codec in accepted and current_codec != CODEC_ZLIB:
+            return current_codec
+    return None
+
+def pack_message(message: str, threshold: int = MESSAGE_COMPRESS_THRESHOLD):
+    ''' This function will return (stored message, codec) for a message body, compressing it only when it is at least threshold bytes
+        NOTE: the codec is None when the body is kept as text, small bodies grow when they are compressed
+    '''
+    encoded = message.encode(BYTE_to_STRING)
+    if len(encoded) < threshold:
+        return message, None
+    codec = default_codec()
+    compressed = compress(encoded, codec)
+    if len(compressed) >= len(encoded):
+        return message, None
+    return compressed, codec
+
+def unpack_message(stored_message, codec: str = None) -> str:
+    ''' This function will return the text of a message body stored by pack_message
+    '''
+    if codec is None:
+        return stored_message
+    return decompress(bytes(stored_message), codec).decode(BYTE_to_STRING)
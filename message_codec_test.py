@@ -0,0 +1,40 @@
+import unittest
+from constants import *
+from message_codec import StreamCompressor, available_codecs, compress, decompress, negotiate_encoding, pack_message, unpack_message
+
+class MessageCodecTest(unittest.TestCase):
+    """ This test environment will test the codecs used to compress message bodies, archive batches and responses
+    """
+    def test_round_trip(self):
+        ''' Every available codec should give back what it compressed
+        '''
+        data = DEFAULT_FULL_CASE_TEST_MESSAGE.encode(BYTE_to_STRING) * 10
+        for codec in available_codecs():
+            self.assertEqual(decompress(compress(data, codec), codec), data)
+
+    def test_stream_compressor(self):
+        ''' A body compressed a chunk at a time should decompress to every chunk in order, with any codec
+        '''
+        chunks = [DEFAULT_FULL_CASE_TEST_MESSAGE.encode(BYTE_to_STRING) * chunk_num for chunk_num in range(1, 6)]
+        for codec in available_codecs():
+            stream_compressor = StreamCompressor(codec)
+            compressed = b''.join(stream_compressor.compress(current_chunk) for current_chunk in chunks) + stream_compressor.finish()
+            self.assertEqual(decompress(compressed, codec), b''.join(chunks))
+
+    def test_pack_message(self):
+        ''' Only bodies of at least the threshold should be compressed
+        '''
+        self.assertEqual(pack_message(DEFAULT_PUBLIC_TEST_MESSAGE), (DEFAULT_PUBLIC_TEST_MESSAGE, None))
+        long_message = DEFAULT_PUBLIC_TEST_MESSAGE * 100
+        stored_message, codec = pack_message(long_message)
+        self.assertIsNotNone(codec)
+        self.assertLess(len(stored_message), len(long_message))
+        self.assertEqual(unpack_message(stored_message, codec), long_message)
+
+    def test_negotiate_encoding(self):
+        ''' The best accepted codec should be picked, and codecs refused with q=0 should not be
+        '''
+        self.assertEqual(negotiate_encoding('gzip, deflate'), CODEC_GZIP)
+        self.assertIsNone(negotiate_encoding('gzip;q=0, identity'))
+        self.assertIsNone(negotiate_encoding(''))
+        self.assertEqual(negotiate_encoding(f'{CODEC_GZIP}, {CODEC_ZSTD}'), available_codecs()[0])
@@ -0,0 +1,144 @@
+import io
+import os
+import re
+import time
+import hmac
+import uuid
+import pstats
+import cProfile
+import logging
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from constants import *
+
+logging.basicConfig(filename='message_chat.log', level=logging.DEBUG, format = LOG_FORMAT)
+
+''' The RequestTimer of the request being handled, None outside of a request (and in background tasks)
+    NOTE: asyncio.to_thread copies the context, so stages timed in worker threads still reach the timer of their request
+'''
+request_timer = contextvars.ContextVar('request_timer', default = None)
+
+class RequestTimer():
+    """ Class for the total time of one request and the time spent in each of its stages (lookup, auth, persist, sequence, serialization).
+        NOTE: stages can be nested (sequence happens inside persist), so the stages do not add up to the total
+    """
+    def __init__(self, method: str, path: str) -> None:
+        self.__method = method
+        self.__path = path
+        self.__start = time.perf_counter()
+        self.__stages = dict()
+
+    # property to get the seconds since the request started
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.__start
+
+    # property to get a copy of the seconds spent in each stage
+    @property
+    def stages(self):
+        return dict(self.__stages)
+
+    def add(self, stage_name: str, seconds: float) -> None:
+        ''' This method will add seconds to the time spent in stage_name
+        '''
+        self.__stages[stage_name] = self.__stages.get(stage_name, 0.0) + seconds
+
+    def to_dict(self):
+        return {'method': self.__method,
+                'path': self.__path,
+                'elapsed_ms': round(self.elapsed * 1000, 3),
+                'stages_ms': { stage_name: round(seconds * 1000, 3) for stage_name, seconds in self.__stages.items() }}
+
+@contextmanager
+def timed_stage(stage_name: str):
+    ''' This function will time the block it wraps as stage_name of the current request
+        NOTE: outside of a request this does nothing, so the classes can be timed without knowing about requests
+    '''
+    timer = request_timer.get()
+    if timer is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer.add(stage_name, time.perf_counter() - start)
+
+class SlowRequestLog():
+    """ Class for logging the requests slower than threshold_seconds with their stage timings, and keeping the latest ones.
+    """
+    def __init__(self, threshold_seconds: float = SLOW_REQUEST_SECONDS, max_entries: int = SLOW_REQUEST_LOG_SIZE) -> None:
+        self.__threshold_seconds = threshold_seconds
+        self.__entries = deque(maxlen = max_entries)
+
+    # property to get the latest slow requests, oldest first
+    @property
+    def entries(self):
+        return list(self.__entries)
+
+    def record(self, timer: RequestTimer, status_code: int) -> bool:
+        ''' This method will keep and log the timings of a finished request if it was slow, and return True if it was
+        '''
+        if timer.elapsed < self.__threshold_seconds:
+            return False
+        slow_request = timer.to_dict()
+        slow_request['status_code'] = status_code
+        self.__entries.append(slow_request)
+        logging.warning(f'Slow request: {slow_request}')
+        return True
+
+class RequestProfiler():
+    """ Class for running single requests under cProfile on demand and keeping their profiles on disk.
+        NOTE: profiling is off unless a token is set (CHAT_PROFILE_TOKEN), and only requests sending that token are profiled
+        NOTE: one request is profiled at a time, cProfile sees everything the event loop runs meanwhile
+    """
+    def __init__(self, token: str = None, profile_dir: str = PROFILE_DIR) -> None:
+        self.__token = token if token is not None else os.environ.get(PROFILE_TOKEN_ENV)
+        self.__profile_dir = profile_dir
+        self.__lock = threading.Lock()
+
+    # property to get if profiling is turned on
+    @property
+    def enabled(self):
+        return bool(self.__token)
+
+    def authorized(self, token: str) -> bool:
+        ''' This method will check a token sent by a client against the profiling token
+        '''
+        return self.enabled and token is not None and hmac.compare_digest(token.encode(BYTE_to_STRING), self.__token.encode(BYTE_to_STRING))
+
+    async def run(self, call_next, request):
+        ''' This method will await call_next(request) under cProfile, store the profile and return (response, profile id)
+            NOTE: the profile id is None when another request is being profiled, the request is then run without profiling
+        '''
+        if self.__lock.acquire(blocking = False) is False:
+            logging.debug('Another request is being profiled, not profiling this one.')
+            return await call_next(request), None
+        try:
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                response = await call_next(request)
+            finally:
+                profiler.disable()
+            profile_id = uuid.uuid4().hex
+            os.makedirs(self.__profile_dir, exist_ok = True)
+            profiler.dump_stats(os.path.join(self.__profile_dir, profile_id + PROFILE_SUFFIX))
+            logging.info(f'{request.method} {request.url.path} was profiled as {profile_id}.')
+            return response, profile_id
+        finally:
+            self.__lock.release()
+
+    def load(self, profile_id: str, num_lines: int = PROFILE_STATS_LINES) -> str:
+        ''' This method will return the top num_lines functions of a stored profile by cumulative time, or None if there is no such profile
+        '''
+        if re.fullmatch('[0-9a-f]{32}', profile_id) is None:
+            return None
+        profile_path = os.path.join(self.__profile_dir, profile_id + PROFILE_SUFFIX)
+        if not os.path.isfile(profile_path):
+            return None
+        stats_text = io.StringIO()
+        pstats.Stats(profile_path, stream = stats_text).sort_stats(pstats.SortKey.CUMULATIVE).print_stats(num_lines)
+        return stats_text.getvalue()
@@ -0,0 +1,42 @@
+import unittest
+from constants import *
+from profiling import RequestTimer, RequestProfiler, SlowRequestLog, request_timer, timed_stage
+
+class ProfilingTest(unittest.TestCase):
+    """ This test environment will test the stage timings, the slow request log and the guard of the request profiler
+    """
+    def test_timed_stage(self):
+        ''' A stage should be timed into the timer of the current request, and do nothing outside of a request
+        '''
+        with timed_stage('lookup'):
+            pass
+        test_timer = RequestTimer(method = 'GET', path = '/messages/')
+        context_token = request_timer.set(test_timer)
+        try:
+            with timed_stage('lookup'):
+                pass
+            with timed_stage('lookup'):
+                pass
+        finally:
+            request_timer.reset(context_token)
+        self.assertEqual(list(test_timer.stages), ['lookup'])
+        self.assertIn('lookup', test_timer.to_dict()['stages_ms'])
+
+    def test_slow_request_log(self):
+        ''' Only requests slower than the threshold should be kept
+        '''
+        self.assertFalse(SlowRequestLog(threshold_seconds = 60).record(RequestTimer(method = 'GET', path = '/'), 200))
+        test_log = SlowRequestLog(threshold_seconds = 0, max_entries = 1)
+        self.assertTrue(test_log.record(RequestTimer(method = 'GET', path = '/'), 200))
+        self.assertTrue(test_log.record(RequestTimer(method = 'POST', path = '/message/'), 201))
+        self.assertEqual([current_entry['path'] for current_entry in test_log.entries], ['/message/'])
+
+    def test_profiler_guard(self):
+        ''' The profiler should only accept its own token, and none at all when it has no token
+        '''
+        self.assertFalse(RequestProfiler(token = '').authorized(''))
+        test_profiler = RequestProfiler(token = TEST_USER_ALIAS)
+        self.assertTrue(test_profiler.authorized(TEST_USER_ALIAS))
+        self.assertFalse(test_profiler.authorized(TEST_MEMBER_ALIAS))
+        self.assertFalse(test_profiler.authorized(None))
+        self.assertIsNone(test_profiler.load('../' + TEST_USER_ALIAS))
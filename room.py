@@ -1,12 +1,25 @@
+import os
+import time
 import pika
 import json
+import threading
+import heapq
+import base64
 import pika.exceptions
 import logging
 from users import *
 from constants import *
 from datetime import date, datetime
-from pymongo import MongoClient, ReturnDocument
+from storage import StorageBackend, get_default_backend
+from dedupe import DedupeCache
+from message_codec import pack_message, unpack_message
+from profiling import timed_stage
+from spool import CircuitBreaker, StorageUnavailable, WriteAheadSpool
+from room_stats import RoomStats
 from collections import deque
+from urllib.parse import quote
+from itertools import dropwhile, islice
+from concurrent.futures import ThreadPoolExecutor
 from constants import *
 
 logging.basicConfig(filename='message_chat.log', level=logging.DEBUG, format = LOG_FORMAT)
@@ -14,18 +27,22 @@ logging.basicConfig(filename='message_chat.log', level=logging.DEBUG, format = L
 class MessageProperties():
     """ Class for holding the properties of a message: type, sent_to, sent_from, rec_time, send_time
         NOTE: The sequence number is defaulted to -1
+        NOTE: the sent and received times default to the time the properties are made, the room sets the received time again when it accepts the message
     """
-    def __init__(self, room_name: str, to_user: str, from_user: str, mess_type: int, sequence_num: int = -1, sent_time: datetime = datetime.now(), rec_time: datetime = datetime.now()) -> None:
+    def __init__(self, room_name: str, to_user: str, from_user: str, mess_type: int, sequence_num: int = -1, sent_time: datetime = None, rec_time: datetime = None, client_message_id: str = None) -> None:
         self.__mess_type = mess_type
         self.__room_name = room_name
         self.__to_user = to_user
         self.__from_user = from_user
-        self.__sent_time = sent_time
-        self.__rec_time = rec_time     
+        self.__sent_time = sent_time if sent_time is not None else datetime.now()
+        self.__rec_time = rec_time if rec_time is not None else datetime.now()
         self.__sequence_num = sequence_num
+        self.__client_message_id = client_message_id
 
     def to_dict(self):
-        return {'room_name': self.__room_name, 
+        ''' NOTE: client_message_id is left out when there is none, so the unique index on it only covers the messages that have one
+        '''
+        mess_props_dict = {'room_name': self.__room_name, 
             'mess_type': self.__mess_type,
             'to_user': self.__to_user, 
             'from_user': self.__from_user,
@@ -33,6 +50,9 @@ class MessageProperties():
             'rec_time': self.__rec_time, 
             'sequence_num': self.__sequence_num,
         } 
+        if self.__client_message_id is not None:
+            mess_props_dict['client_message_id'] = self.__client_message_id
+        return mess_props_dict
 
     # the following properties are to get functions to get message properties
     @property
@@ -59,6 +79,11 @@ class MessageProperties():
     def rec_time(self):
         return self.__rec_time
 
+    # the room sets the received time when it accepts the message, so the messages of a room are in received time order
+    @rec_time.setter
+    def rec_time(self, new_value: datetime):
+        self.__rec_time = new_value
+
     @property
     def sequence_number(self):
         return self.__sequence_num
@@ -67,6 +92,11 @@ class MessageProperties():
     def sequence_number(self, new_value: int):
         self.__sequence_num = new_value
 
+    # property to get the id the client gave the message so a retried send is not stored twice (None if it gave none)
+    @property
+    def client_message_id(self):
+        return self.__client_message_id
+
     def __str__(self):
         return str(self.to_dict())
 
@@ -74,11 +104,14 @@ class ChatMessage():
     """ Class for holding individual messages in a chat thread/queue. Each message a message, rabbitmq properties, sequence number, timestamp and type
         NOTE: message id is autogenerated by mongodb
     """
-    def __init__(self, message: str, mess_id = None, mess_props: MessageProperties = None) -> None:
+    def __init__(self, message: str, mess_id = None, mess_props: MessageProperties = None, deleted: bool = False, edit_time: datetime = None) -> None:
         self.__message = message
         self.__mess_props = mess_props
         self.__mess_id = mess_id
         self.__dirty = True
+        self.__expired = False
+        self.__deleted = deleted
+        self.__edit_time = edit_time
 
     # the following 4 properties are set so information about a ChatMessage instance can be obtained
     @property
@@ -97,63 +130,280 @@ class ChatMessage():
     def message_id(self):
         return self.__mess_id
 
+    @message_id.setter
+    def message_id(self, new_value):
+        self.__mess_id = new_value
+
     @dirty.setter
     def dirty(self, new_value: bool):
         self.__dirty = new_value
 
-    def to_dict(self):
+    # property to see if the message was moved out of its room by the retention policy
+    @property
+    def expired(self):
+        return self.__expired
+
+    @expired.setter
+    def expired(self, new_value: bool):
+        self.__expired = new_value
+
+    # property to see if the message was deleted (it stays in its room as a tombstone with no text)
+    @property
+    def deleted(self):
+        return self.__deleted
+
+    # property to get when the message was last edited or deleted (None if it never was)
+    @property
+    def edit_time(self):
+        return self.__edit_time
+
+    def edit(self, new_message: str, edit_time: datetime = None) -> None:
+        ''' This method will replace the text of the message, edited at edit_time (now if it is None)
+        '''
+        self.__message = new_message
+        self.__edit_time = edit_time if edit_time is not None else datetime.now()
+
+    def delete(self, edit_time: datetime = None) -> None:
+        ''' This method will turn the message into a tombstone: the text is dropped, the properties and sequence number are kept
+        '''
+        self.__message = ''
+        self.__deleted = True
+        self.__edit_time = edit_time if edit_time is not None else datetime.now()
+
+    def to_dict(self, compress_body: bool = False):
+        ''' NOTE: with compress_body, a body of at least MESSAGE_COMPRESS_THRESHOLD bytes is compressed and its codec is recorded next to it
+            NOTE: edit_time and deleted are only there for messages that were edited or deleted
+        '''
         mess_props_dict = self.__mess_props.to_dict()
-        return {'message': self.__message, 'mess_props': mess_props_dict}
+        if compress_body is False:
+            message_dict = {'message': self.__message, 'mess_props': mess_props_dict}
+        else:
+            stored_message, codec = pack_message(self.__message)
+            message_dict = {'message': stored_message, 'mess_props': mess_props_dict}
+            if codec is not None:
+                message_dict['codec'] = codec
+        if self.__edit_time is not None:
+            message_dict['edit_time'] = self.__edit_time
+        if self.__deleted is True:
+            message_dict['deleted'] = True
+        return message_dict
 
     def __str__(self):
         return f'Chat Message: {self.__message} - message props: {self.__mess_props}'
 
+class MemberIndex():
+    """ Process-wide reverse index of member alias -> names of the rooms that alias belongs to.
+        NOTE: every ChatRoom registers its members here so finding the rooms of a user does not scan every room
+        NOTE: the rooms of every thread share the index, so it has its own lock
+    """
+    def __init__(self) -> None:
+        self.__rooms_by_alias = dict()
+        self.__lock = threading.Lock()
+
+    def add(self, member_alias: str, room_name: str) -> None:
+        ''' This method will record that member_alias is a member of room_name
+        '''
+        with self.__lock:
+            self.__rooms_by_alias.setdefault(member_alias, set()).add(room_name)
+
+    def discard(self, member_alias: str, room_name: str) -> None:
+        ''' This method will remove room_name from the rooms of member_alias, if it is there
+        '''
+        with self.__lock:
+            member_rooms = self.__rooms_by_alias.get(member_alias)
+            if member_rooms is None:
+                return
+            member_rooms.discard(room_name)
+            if len(member_rooms) is EMPTY:
+                del self.__rooms_by_alias[member_alias]
+
+    def rooms_for(self, member_alias: str) -> set:
+        ''' This method will return the set of room names member_alias belongs to (empty if none)
+            NOTE: a copy is returned so callers can not change the index by accident
+        '''
+        with self.__lock:
+            return set(self.__rooms_by_alias.get(member_alias, ()))
+
+member_index = MemberIndex()
+
+
+class InboxIndex():
+    """ Process-wide index of recipient alias -> private messages sent to that alias, in the order they were indexed.
+        NOTE: every entry gets an inbox position that never changes, pages are asked for with the position to stop before
+        NOTE: expired messages are skipped and dropped from the front of the inbox, which keeps the positions of the others
+        NOTE: private messages of ephemeral rooms are not indexed, their ring buffer drops them in any order and the inbox would keep them
+        NOTE: the rooms of every thread share the index, so it has its own lock
+    """
+    def __init__(self) -> None:
+        self.__inboxes = dict()
+        self.__first_positions = dict()
+        self.__lock = threading.RLock()
+
+    def add(self, message: ChatMessage) -> None:
+        ''' This method will put a private message into the inbox of its recipient
+            NOTE: public messages are not indexed
+        '''
+        if message.message_properties.message_type != PRIVATE_MESSAGE:
+            return
+        to_alias = message.message_properties.to_user
+        with self.__lock:
+            self.__first_positions.setdefault(to_alias, EMPTY)
+            self.__inboxes.setdefault(to_alias, deque()).append(message)
+
+    def num_messages(self, to_alias: str) -> int:
+        ''' This method will return the position after the newest message in the inbox of to_alias
+        '''
+        with self.__lock:
+            return self.__first_positions.get(to_alias, EMPTY) + len(self.__inboxes.get(to_alias, ()))
+
+    def prune(self, to_alias: str) -> None:
+        ''' This method will drop expired messages from the front of the inbox of to_alias
+        '''
+        with self.__lock:
+            inbox = self.__inboxes.get(to_alias)
+            while inbox and inbox[0].expired is True:
+                inbox.popleft()
+                self.__first_positions[to_alias] += 1
+
+    def get_page(self, to_alias: str, before: int = None, page_size: int = INBOX_PAGE_SIZE):
+        ''' This method will return up to page_size messages of the inbox of to_alias, newest first, and the position to ask for the next page
+            NOTE: before is an inbox position, only messages before it are returned (the newest messages if it is None)
+            NOTE: the next position is None when there are no older messages
+        '''
+        with self.__lock:
+            self.prune(to_alias)
+            inbox = self.__inboxes.get(to_alias, deque())
+            first_position = self.__first_positions.get(to_alias, EMPTY)
+            current_position = self.num_messages(to_alias) if before is None else min(before, self.num_messages(to_alias))
+            page_messages = list()
+            while current_position > first_position and len(page_messages) < page_size:
+                current_position -= 1
+                if inbox[current_position - first_position].expired is False:
+                    page_messages.append(inbox[current_position - first_position])
+            next_before = current_position if current_position > first_position else None
+            return page_messages, next_before
+
+    def sort(self) -> None:
+        ''' This method will put every inbox in feed order (sent time, then room name, then sequence number), oldest first
+            NOTE: rooms are restored in parallel and index their messages as each one finishes, so this is called once every room is restored
+            NOTE: the positions of the messages change, so it is only called before any page was handed out
+        '''
+        with self.__lock:
+            for to_alias, inbox in self.__inboxes.items():
+                self.__inboxes[to_alias] = deque(sorted(inbox, key = feed_key))
+
+inbox_index = InboxIndex()
+
+''' The circuit breaker shared by every room, all of them persist to the same storage
+'''
+storage_breaker = CircuitBreaker()
+
+def local_time(when: datetime) -> datetime:
+    ''' This function will turn a time with a time zone into the local time without one, the way the times of the messages are kept
+    '''
+    if when is None or when.tzinfo is None:
+        return when
+    return when.astimezone().replace(tzinfo = None)
+
+def feed_key(message: ChatMessage) -> tuple:
+    ''' This function will return the key messages of a feed are ordered by: sent time, then room name, then sequence number
+    '''
+    return (message.message_properties.sent_time, message.message_properties.room_name, message.message_properties.sequence_number)
+
+def encode_feed_cursor(key: tuple) -> str:
+    ''' This function will turn the feed key of the last message of a page into the cursor of the next page
+    '''
+    sent_time, room_name, sequence_num = key
+    return base64.urlsafe_b64encode(json.dumps([sent_time.isoformat(), room_name, sequence_num]).encode(BYTE_to_STRING)).decode(BYTE_to_STRING)
+
+def decode_feed_cursor(cursor: str) -> tuple:
+    ''' This function will turn a feed cursor back into a feed key
+        NOTE: a cursor that was not made by encode_feed_cursor raises a ValueError
+    '''
+    try:
+        sent_time, room_name, sequence_num = json.loads(base64.urlsafe_b64decode(cursor.encode(BYTE_to_STRING)))
+        return (datetime.fromisoformat(sent_time), room_name, int(sequence_num))
+    except Exception as cursor_error:
+        raise ValueError(f'{cursor} is not a feed cursor.') from cursor_error
+
 class ChatRoom(deque):
     """ We reuse the constructor for creating new or grabbing an existing instance. If owner_alias is empty and user_alias is not, 
             this is assuming an existing instance. The opposite (owner_alias set and user_alias empty) means we're creating new
             members is always optional, and room_type is only relevant if we're creating new.
+        NOTE: an ephemeral room (ROOM_TYPE_EPHEMERAL) only persists its metadata, its messages live in a ring buffer of EPHEMERAL_BUFFER_SIZE
+        NOTE: an ephemeral room is open like a public room, anyone can send messages to it and read them, and its messages are not in the inbox index
+        NOTE: messages that could not be persisted are kept in a spool file in spool_dir until they are, and replayed from it on restore
+        NOTE: a room can be used from many threads, it has its own locks so different rooms never wait on each other
     """
-    def __init__(self, room_name: str, member_list: list = None, owner_alias: str = "", room_type: int = ROOM_TYPE_PRIVATE, create_new: bool = False) -> None:
+    def __init__(self, room_name: str, member_list: list = None, owner_alias: str = "", room_type: int = ROOM_TYPE_PRIVATE, create_new: bool = False, backend: StorageBackend = None, spool_dir: str = SPOOL_DIR) -> None:
         super(ChatRoom, self).__init__()
         self.__room_name = room_name
-        self.__user_list = UserList()
+        self.__user_list = None
         self.__dirty = False
         self.__owner_alias = owner_alias
-        # Set up mongo - client, db, collection, sequence_collection
-        self.__mongo_client = MongoClient(host = MONGO_DB_HOST, port = MONGO_DB_PORT, username = MONGO_DB_USER, password = MONGO_DB_PASS, authSource = MONGO_DB_AUTH_SOURCE, authMechanism = MONGO_DB_AUTH_MECHANISM)
-        self.__mongo_db = self.__mongo_client.detest
-        self.__mongo_collection = self.__mongo_db.get_collection(self.__room_name) 
-        self.__mongo_seq_collection = self.__mongo_db.get_collection("sequence")
-        if self.__mongo_collection is None:
-            self.__mongo_collection = self.__mongo_db.create_collection(self.__room_name)
-        # Restore from mongo if possible, if not (or we're creating new) then setup ChatRoom properties
+        self.__last_sequence_num = EMPTY
+        self.__retention_count = None
+        self.__retention_seconds = None
+        self.__archive_sample_every = None
+        self.__archive_samples = list()
+        self.__pending_writes = deque()
+        self.__sent_messages = DedupeCache()
+        self.__messages_by_sequence = dict()
+        # the room name is quoted like the segment backend does, so a name with path separators stays in spool_dir
+        self.__spool = WriteAheadSpool(spool_path = os.path.join(spool_dir, quote(room_name, safe = '') + SPOOL_SUFFIX))
+        self.__num_spooled = EMPTY
+        # The activity counters, with the highest sequence number they had when they were last saved and when that was
+        self.__stats = RoomStats()
+        self.__stats_saved_num = EMPTY
+        self.__stats_saved_at = None
+        # The last received time given to a message, and whether every message of the room is in received time order
+        self.__last_rec_time = None
+        self.__time_ordered = True
+        # Counts the changes to the messages of the room (sent, stored, edited, deleted, expired) so readers can tell if anything changed
+        self.__version = EMPTY
+        # Counts the messages ever put on the left side of the deque, so a reader can tell how far the messages it read moved
+        self.__num_put = EMPTY
+        # The lock guards the messages and metadata in memory, the persist lock keeps one persist of the room running at a time
+        self.__lock = threading.RLock()
+        self.__persist_lock = threading.Lock()
+        # The change lock keeps one targeted change (edit, delete, member, retention, sampling) going at a time, so storage and memory get them in the same order
+        self.__change_lock = threading.Lock()
+        # Set up the storage backend (mongo unless configured otherwise) for the room
+        self.__backend = backend if backend is not None else get_default_backend()
+        self.__backend.open_room(self.__room_name)
+        # Restore from storage if possible, if not (or we're creating new) then setup ChatRoom properties
         if create_new is True or self.restore() is False:
             self.__create_time = datetime.now()
             self.__modify_time = datetime.now()
             self.__room_type = room_type
-            if member_list is not None:
-                self.__member_list = member_list
-                if owner_alias not in member_list:
-                    member_list.append(owner_alias)
-            else:
-                self.__member_list = list()
-                self.__member_list.append(owner_alias)
+            self.__member_set = set(member_list) if member_list is not None else set()
+            self.__member_set.add(owner_alias)
             self.__dirty = True
+        for current_member in self.__member_set:
+            member_index.add(current_member, self.__room_name)
 
     # property to get the name of a room
     @property
     def room_name(self):
         return self.__room_name
 
-    # property to get the list of users for a room
+    # property to get the list of users for a room (only restored the first time it is asked for)
     @property
     def room_user_list(self):
+        if self.__user_list is None:
+            self.__user_list = UserList()
         return self.__user_list
 
-    # property to get the members list for a room
+    # property to get the members list for a room (a copy of the member set, used for persistence)
     @property
     def member_list(self):
-        return self.__member_list
+        with self.__lock:
+            return list(self.__member_set)
+
+    # property to get the number of members in a room
+    @property
+    def num_members(self):
+        return len(self.__member_set)
 
     # property to get the owner_alias of the 
     @property
@@ -175,16 +425,298 @@ class ChatRoom(deque):
     def dirty(self):
         return self.__dirty
 
-    def __get_next_sequence_num(self):
-        """ This is the method that you need for managing the sequence. Note that there is a separate collection for just this one document
+    # property to get the most messages the room keeps (None keeps every message)
+    @property
+    def retention_count(self):
+        return self.__retention_count
+
+    # property to get the oldest a message in the room can be in seconds (None keeps every message)
+    @property
+    def retention_seconds(self):
+        return self.__retention_seconds
+
+    # property to get if the room only keeps its messages in memory
+    @property
+    def ephemeral(self):
+        return self.__room_type == ROOM_TYPE_EPHEMERAL
+
+    # property to get one in how many messages of an ephemeral room are sampled to the archive (None samples nothing)
+    @property
+    def archive_sample_every(self):
+        return self.__archive_sample_every
+
+    # property to get the number of sent messages that are waiting to be persisted
+    @property
+    def num_pending(self):
+        return len(self.__pending_writes)
+
+    # property to get the number of pending messages that are kept in the spool file
+    @property
+    def num_spooled(self):
+        return self.__num_spooled
+
+    # property to get how many times the messages of the room changed since it was made or restored
+    @property
+    def version(self):
+        return self.__version
+
+    # property to get the highest sequence number assigned in the room (0 if nothing was sent yet)
+    @property
+    def last_sequence_num(self):
+        return self.__last_sequence_num
+
+    def get_message(self, sequence_num: int) -> ChatMessage:
+        ''' This method will return the message of the room with sequence_num in constant time, or None
+            NOTE: messages only have a sequence number once they are persisted, deleted messages are returned as tombstones
+        '''
+        return self.__messages_by_sequence.get(sequence_num)
+
+    def edit_message(self, sequence_num: int, new_message: str, editor_alias: str) -> bool:
+        ''' This method will replace the text of the message with sequence_num, if editor_alias sent it
+            NOTE: only the text and edit time of that one message document are updated in storage
+            NOTE: the message is only changed in memory once storage has it, StorageUnavailable is raised if storage is failing
+        '''
+        with self.__change_lock:
+            with self.__lock:
+                found_message = self.get_message(sequence_num)
+                if found_message is None or found_message.deleted is True or found_message.message_properties.from_user != editor_alias:
+                    logging.debug(f'{editor_alias} can not edit message {sequence_num} of {self.__room_name}.')
+                    return False
+            edit_time = datetime.now()
+            if self.ephemeral is False:
+                stored_message, codec = pack_message(new_message)
+                self.__write_through_breaker(self.__backend.update_message, self.__room_name, sequence_num, { 'message': stored_message, 'codec': codec, 'edit_time': edit_time })
+            with self.__lock:
+                found_message.edit(new_message, edit_time = edit_time)
+                self.__version += 1
+        logging.debug(f'Message {sequence_num} of {self.__room_name} was edited by {editor_alias}.')
+        return True
+
+    def delete_message(self, sequence_num: int, deleter_alias: str) -> bool:
+        ''' This method will turn the message with sequence_num into a tombstone, if deleter_alias sent it or owns the room
+            NOTE: the tombstone keeps its place and sequence number, only that one message document is updated in storage
+            NOTE: the message is only changed in memory once storage has it, StorageUnavailable is raised if storage is failing
+        '''
+        with self.__change_lock:
+            with self.__lock:
+                found_message = self.get_message(sequence_num)
+                if found_message is None or found_message.deleted is True or deleter_alias not in (found_message.message_properties.from_user, self.__owner_alias):
+                    logging.debug(f'{deleter_alias} can not delete message {sequence_num} of {self.__room_name}.')
+                    return False
+            edit_time = datetime.now()
+            if self.ephemeral is False:
+                self.__write_through_breaker(self.__backend.update_message, self.__room_name, sequence_num, { 'message': '', 'codec': None, 'deleted': True, 'edit_time': edit_time })
+            with self.__lock:
+                found_message.delete(edit_time = edit_time)
+                self.__version += 1
+        logging.debug(f'Message {sequence_num} of {self.__room_name} was deleted by {deleter_alias}.')
+        return True
+
+    def find_sent_message(self, client_message_id: str) -> ChatMessage:
+        ''' This method will return the message recently sent to the room with client_message_id, or None
+            NOTE: only the dedupe cache of the room is checked, the unique index in storage catches the rest when persisting
+        '''
+        if client_message_id is None:
+            return None
+        return self.__sent_messages.get(client_message_id)
+
+    def is_member(self, member_alias: str) -> bool:
+        ''' This method will check if member_alias is a member of the room in constant time
+        '''
+        return member_alias in self.__member_set
+
+    def add_member(self, member_alias: str) -> bool:
+        ''' This method will add member_alias to the members of the room
+            NOTE: only the member_list of the room metadata document is updated, the rest of the metadata is not rewritten
+            NOTE: the member is only added in memory once storage has it, StorageUnavailable is raised if storage is failing
+        '''
+        with self.__change_lock:
+            if member_alias in self.__member_set:
+                logging.debug(f'{member_alias} is already a member of {self.__room_name}.')
+                return False
+            modify_time = datetime.now()
+            self.__write_through_breaker(self.__backend.update_room, self.__room_name, set_fields = { 'modify_time': modify_time }, add_members = [member_alias])
+            with self.__lock:
+                self.__member_set.add(member_alias)
+                member_index.add(member_alias, self.__room_name)
+                self.__modify_time = modify_time
+        logging.debug(f'{member_alias} was added to the members of {self.__room_name}.')
+        return True
+
+    def remove_member(self, member_alias: str) -> bool:
+        ''' This method will remove member_alias from the members of the room
+            NOTE: the owner of the room can not be removed
+            NOTE: the member is only removed in memory once storage has it, StorageUnavailable is raised if storage is failing
+        '''
+        with self.__change_lock:
+            if member_alias not in self.__member_set or member_alias == self.__owner_alias:
+                logging.debug(f'{member_alias} is not a removable member of {self.__room_name}.')
+                return False
+            modify_time = datetime.now()
+            self.__write_through_breaker(self.__backend.update_room, self.__room_name, set_fields = { 'modify_time': modify_time }, remove_members = [member_alias])
+            with self.__lock:
+                self.__member_set.discard(member_alias)
+                member_index.discard(member_alias, self.__room_name)
+                self.__modify_time = modify_time
+        logging.debug(f'{member_alias} was removed from the members of {self.__room_name}.')
+        return True
+
+    def set_retention(self, max_messages: int = None, max_age_seconds: int = None) -> None:
+        ''' This method will set the retention policy of the room, either limit can be None to turn it off
+            NOTE: only the retention fields of the room metadata document are updated
+            NOTE: the policy is only changed in memory once storage has it, StorageUnavailable is raised if storage is failing
+        '''
+        with self.__change_lock:
+            modify_time = datetime.now()
+            self.__write_through_breaker(self.__backend.update_room, self.__room_name, set_fields = { 'retention_count': max_messages,
+                                                                                                      'retention_seconds': max_age_seconds,
+                                                                                                      'modify_time': modify_time })
+            with self.__lock:
+                self.__retention_count = max_messages
+                self.__retention_seconds = max_age_seconds
+                self.__modify_time = modify_time
+        logging.debug(f'Retention of {self.__room_name} set to {max_messages} messages and {max_age_seconds} seconds.')
+
+    def set_archive_sampling(self, sample_every: int = None) -> None:
+        ''' This method will set one in how many messages of an ephemeral room are kept in the archive once the ring buffer drops them
+            NOTE: None turns sampling off, only the sampling field of the room metadata document is updated
+            NOTE: the sampling is only changed in memory once storage has it, StorageUnavailable is raised if storage is failing
+        '''
+        with self.__change_lock:
+            modify_time = datetime.now()
+            self.__write_through_breaker(self.__backend.update_room, self.__room_name, set_fields = { 'archive_sample_every': sample_every,
+                                                                                                      'modify_time': modify_time })
+            with self.__lock:
+                self.__archive_sample_every = sample_every
+                self.__modify_time = modify_time
+        logging.debug(f'Archive sampling of {self.__room_name} set to one in {sample_every} messages.')
+
+    def find_expired(self, now: datetime = None) -> list:
+        ''' This method will return the messages that are past the retention policy, oldest first, without taking them off the deque
+            NOTE: the right side of the deque holds the oldest message
+            NOTE: messages that were not persisted yet are never expired
+        '''
+        if self.__retention_count is None and self.__retention_seconds is None:
+            return []
+        now = datetime.now() if now is None else now
+        expired_messages = list()
+        with self.__lock:
+            for oldest_message in reversed(self):
+                if oldest_message.dirty is True:
+                    break
+                too_many = self.__retention_count is not None and len(self) - len(expired_messages) > self.__retention_count
+                too_old = self.__retention_seconds is not None and (now - oldest_message.message_properties.sent_time).total_seconds() > self.__retention_seconds
+                if too_many is False and too_old is False:
+                    break
+                expired_messages.append(oldest_message)
+        logging.debug(f'{len(expired_messages)} messages expired in {self.__room_name}.')
+        return expired_messages
+
+    def __remove_expired(self, expired_messages: list) -> None:
+        ''' This is a helper method to take archived messages off the right side of the deque, oldest first
+            NOTE: only the archive job takes persisted messages off the right side, so they are still there in the same order
+        '''
+        with self.__lock:
+            for expired_message in expired_messages:
+                if len(self) is EMPTY or self[RIGHT_SIDE_OF_DEQUE] is not expired_message:
+                    logging.warning(f'Expired message {expired_message.message_properties.sequence_number} was not the oldest of {self.__room_name} anymore.')
+                    break
+                self.pop()
+                self.__messages_by_sequence.pop(expired_message.message_properties.sequence_number, None)
+                expired_message.expired = True
+                self.__version += 1
+
+    def __evict_overflow(self) -> None:
+        ''' This is a helper method to drop the oldest messages of an ephemeral room once its ring buffer is full
+            NOTE: one in archive_sample_every of the dropped messages is kept for the archive, the rest are gone
+        '''
+        while len(self) > EPHEMERAL_BUFFER_SIZE:
+            oldest_message = self.pop()
+            self.__messages_by_sequence.pop(oldest_message.message_properties.sequence_number, None)
+            oldest_message.expired = True
+            if self.__archive_sample_every is not None and oldest_message.message_properties.sequence_number % self.__archive_sample_every == EMPTY:
+                self.__archive_samples.append(oldest_message)
+
+    def archive_expired(self, archive, now: datetime = None) -> int:
+        ''' This method will move the expired messages of the room into archive and delete them from the room collection
+            NOTE: archive is a MessageArchive, the messages are only deleted (from storage, then from the deque) once the archive has stored them
+            NOTE: if anything fails the error is raised and the messages stay in the room, the next pass archives them again
+            NOTE: the activity counters are saved first, a restore could not count the deleted messages again
+        '''
+        if self.ephemeral is True:
+            return self.__archive_sampled(archive)
+        expired_messages = self.find_expired(now = now)
+        if len(expired_messages) is EMPTY:
+            return EMPTY
+        archive.store(room_name = self.__room_name, messages = expired_messages)
+        self.__write_through_breaker(self.__save_stats, force = True)
+        self.__write_through_breaker(self.__backend.delete_messages, self.__room_name, [current_message.message_properties.sequence_number for current_message in expired_messages])
+        self.__remove_expired(expired_messages)
+        for current_message in expired_messages:
+            if current_message.message_properties.message_type == PRIVATE_MESSAGE:
+                inbox_index.prune(current_message.message_properties.to_user)
+        logging.info(f'{len(expired_messages)} messages of {self.__room_name} were archived.')
+        return len(expired_messages)
+
+    def __archive_sampled(self, archive) -> int:
+        ''' This is a helper method to move the sampled messages of an ephemeral room into archive
+            NOTE: ephemeral messages were never stored in the room collection, so there is nothing to delete there
+            NOTE: if the archive fails the samples are put back in front of the ones taken since, and the error is raised
+        '''
+        with self.__lock:
+            sampled_messages, self.__archive_samples = self.__archive_samples, list()
+        if len(sampled_messages) is EMPTY:
+            return EMPTY
+        try:
+            archive.store(room_name = self.__room_name, messages = sampled_messages)
+        except:
+            with self.__lock:
+                self.__archive_samples = sampled_messages + self.__archive_samples
+            raise
+        logging.info(f'{len(sampled_messages)} sampled messages of {self.__room_name} were archived.')
+        return len(sampled_messages)
+
+    def __write_through_breaker(self, storage_write, *args, **kwargs):
+        ''' This is a helper method to make one storage write outside of persist() through the circuit breaker, and return what it returns
+            NOTE: StorageUnavailable is raised if the breaker is open or the write failed, callers change the room in memory only after it worked
+        '''
+        if storage_breaker.allow() is False:
+            raise StorageUnavailable(f'Storage is unavailable, {self.__room_name} was not changed.')
+        try:
+            write_result = storage_write(*args, **kwargs)
+        except Exception as storage_error:
+            storage_breaker.record_failure()
+            logging.error(f'Writing a change of {self.__room_name} to storage failed.')
+            raise StorageUnavailable(f'Storage failed, {self.__room_name} was not changed.') from storage_error
+        storage_breaker.record_success()
+        return write_result
+
+    def __get_next_sequence_num(self, count: int = 1):
+        """ This is the method that you need for managing the sequence. The storage backend keeps a counter per room
+            NOTE: count sequence numbers are reserved at once, the last one of them is returned
         """
-        sequence_num = self.__mongo_seq_collection.find_one_and_update(
-                                                        {'_id': 'userid'},
-                                                        {'$inc': {self.__room_name: 1}},
-                                                        projection={self.__room_name: True, '_id': False},
-                                                        upsert=True,
-                                                        return_document=ReturnDocument.AFTER)
-        return sequence_num
+        with timed_stage('sequence'):
+            return self.__backend.next_sequence_num(self.__room_name, count = count)
+
+    def __receive_time(self) -> datetime:
+        ''' This is a helper method to give the received time to a message accepted by the room
+            NOTE: it is called with the room locked, and never goes back in time (even if the clock does) so the deque stays in received time order
+            NOTE: it is cut to milliseconds, the precision storage keeps, so a restored room answers time ranges the same way
+        '''
+        received_time = datetime.now()
+        received_time = received_time.replace(microsecond = received_time.microsecond // 1000 * 1000)
+        if self.__last_rec_time is not None and received_time < self.__last_rec_time:
+            received_time = self.__last_rec_time
+        self.__last_rec_time = received_time
+        return received_time
+
+    def __restored_receive_time(self, rec_time: datetime) -> None:
+        ''' This is a helper method to keep track of the received time order of the messages put back in the room on restore
+        '''
+        if self.__last_rec_time is not None and rec_time < self.__last_rec_time:
+            self.__time_ordered = False
+        else:
+            self.__last_rec_time = rec_time
 
     #Overriding the queue type put and get operations to add type hints for the ChatMessage type
     def put(self, message: ChatMessage = None) -> None:
@@ -194,6 +726,7 @@ class ChatRoom(deque):
         logging.info(f'Calling the put() method with current message being {message} appending to the left of the deque.')
         if message is not None:
             super().appendleft(message)
+            self.__num_put += 1
             logging.info(f'{message} was appended to the left of the queue.')
 
     # overriding parent and setting block to false so we don't wait for messages if there are none
@@ -202,7 +735,7 @@ class ChatRoom(deque):
             NOTE: the method pop() to take a value from the right of the deque
         '''
         try:
-            message_right = super()[-1]
+            message_right = self[RIGHT_SIDE_OF_DEQUE]
         except:
             logging.debug(f'There is no message in the deque for room {self.__room_name}')
             return None
@@ -210,6 +743,32 @@ class ChatRoom(deque):
             logging.debug(f'Message {message_right} was found on the deque.')
             return message_right
 
+    def iter_newest(self):
+        ''' This method will iterate over the messages the room had when it started, newest first, FEED_READ_CHUNK messages at a time
+            NOTE: each chunk is copied with the room locked, messages sent since the last chunk push the position of the next one further
+            NOTE: if the last message read is not where it should be (it was dropped as a duplicate) it is looked up again,
+                    if it is not in the room anymore it expired, and so did every older message
+        '''
+        position = EMPTY
+        last_message = None
+        with self.__lock:
+            num_put = self.__num_put
+        while True:
+            with self.__lock:
+                position += self.__num_put - num_put
+                num_put = self.__num_put
+                if last_message is not None and (position > len(self) or self[position - 1] is not last_message):
+                    try:
+                        position = self.index(last_message) + 1
+                    except ValueError:
+                        return
+                message_chunk = list(islice(self, position, position + FEED_READ_CHUNK))
+            if len(message_chunk) is EMPTY:
+                return
+            yield from message_chunk
+            position += len(message_chunk)
+            last_message = message_chunk[RIGHT_SIDE_OF_DEQUE]
+
     def find_message(self, message_text: str) -> ChatMessage:
         ''' Traverse through the deque of the Chatroom and find the ChatMessage 
                 with the message_text input from the user.
@@ -217,71 +776,139 @@ class ChatRoom(deque):
             NOTE: To traverse through the deque, we can use list(self) as an iterable to find the message
             NOTE: an example would be (for current_message in list(self))
         '''
-        for current_message in list(self):
+        with self.__lock:
+            room_messages = list(self)
+        for current_message in room_messages:
             if current_message.message == message_text:
                 logging.debug(f'found {message_text} in deque.')
                 return current_message
         logging.debug(f'{message_text} was not found in the deque.')
         return None
             
-    def get_messages(self, user_alias: str, num_messages: int = GET_ALL_MESSAGES, return_objects: bool = True):
+    def get_messages(self, user_alias: str, num_messages: int = GET_ALL_MESSAGES, return_objects: bool = True, since: datetime = None, until: datetime = None):
         ''' This method will get num_messages from the deque and get their text, objects and a total count of the messages
             NOTE: total # of messages seems to just be num messages, but if getting all then just return the length of the list
             NOTE: indecies 0 and 1 is to access the values in the tuple for the objects and the number of objects
-            NOTE: If room_type is public, the user may get messages from the chat
+            NOTE: If room_type is public (or ephemeral), the user may get messages from the chat
+            NOTE: the room is locked while the messages are read, so the texts and objects match
+            NOTE: with since and/or until, only the messages received from since (included) to until (not included) are read
         '''
         # return message texts, full message objects, and total # of messages
-        if user_alias not in self.__member_list and self.__room_type is ROOM_TYPE_PRIVATE:
+        if user_alias not in self.__member_set and self.__room_type is ROOM_TYPE_PRIVATE:
             logging.warning(f'User with alias {user_alias} is not a member of {self.__room_name}.')
             return [], [], 0
-        if return_objects is True:
-            logging.debug('Returning messages with the message objects.')
-            message_objects = self.__get_message_objects(num_messages = num_messages)
-            if num_messages == GET_ALL_MESSAGES:
-                return [current_message.message for current_message in list(self)], message_objects[0], message_objects[1]
-            else:
-                message_texts = list()
-                for current_message_index in range(RIGHT_SIDE_OF_DEQUE, RIGHT_SIDE_OF_DEQUE - num_messages, RANGE_STEP):
-                    message_texts.append(super()[current_message_index].message)
-                return message_texts, message_objects[0], message_objects[1]
-        else:
-            logging.debug('Returning messages without the message objects.')
-            if num_messages == GET_ALL_MESSAGES:
-                return [current_message.message for current_message in list(self)], len(self)
+        with self.__lock:
+            room_messages = self if since is None and until is None else self.__messages_between(since = since, until = until)
+            if return_objects is True:
+                logging.debug('Returning messages with the message objects.')
+                message_objects = self.__get_message_objects(num_messages = num_messages, room_messages = room_messages)
+                if num_messages == GET_ALL_MESSAGES:
+                    return [current_message.message for current_message in list(room_messages)], message_objects[0], message_objects[1]
+                else:
+                    message_texts = list()
+                    for current_message_index in range(RIGHT_SIDE_OF_DEQUE, RIGHT_SIDE_OF_DEQUE - min(num_messages, len(room_messages)), RANGE_STEP):
+                        message_texts.append(room_messages[current_message_index].message)
+                    return message_texts, message_objects[0], message_objects[1]
             else:
-                message_texts = list()
-                for current_message_index in range(RIGHT_SIDE_OF_DEQUE, RIGHT_SIDE_OF_DEQUE - num_messages, RANGE_STEP):
-                    message_texts.append(super()[current_message_index].message)
-                return message_texts, len(message_texts)
+                logging.debug('Returning messages without the message objects.')
+                if num_messages == GET_ALL_MESSAGES:
+                    return [current_message.message for current_message in list(room_messages)], len(room_messages)
+                else:
+                    message_texts = list()
+                    for current_message_index in range(RIGHT_SIDE_OF_DEQUE, RIGHT_SIDE_OF_DEQUE - min(num_messages, len(room_messages)), RANGE_STEP):
+                        message_texts.append(room_messages[current_message_index].message)
+                    return message_texts, len(message_texts)
 
-    def __get_message_objects(self, num_messages: int = GET_ALL_MESSAGES):
+    def __get_message_objects(self, num_messages: int = GET_ALL_MESSAGES, room_messages = None):
         ''' This is a helper method to get the actual message objects rather than just the message from the object
+            NOTE: room_messages is the deque by default, or the messages of a time range
         '''
         logging.info(f'Attempting to get message objects in {self.__room_name}.')
-        if num_messages == GET_ALL_MESSAGES:
-            logging.debug('Returning all message objects in the deque.')
-            return list(self), len(self)
-        message_objects = list()
-        for current_message_object in range(RIGHT_SIDE_OF_DEQUE, RIGHT_SIDE_OF_DEQUE - num_messages, RANGE_STEP):
-            message_objects.append(super()[current_message_object])
+        with self.__lock:
+            room_messages = self if room_messages is None else room_messages
+            if num_messages == GET_ALL_MESSAGES:
+                logging.debug('Returning all message objects in the deque.')
+                return list(room_messages), len(room_messages)
+            message_objects = list()
+            for current_message_object in range(RIGHT_SIDE_OF_DEQUE, RIGHT_SIDE_OF_DEQUE - min(num_messages, len(room_messages)), RANGE_STEP):
+                message_objects.append(room_messages[current_message_object])
         logging.debug(f'Returning {num_messages} message objects from the deque.')
         return message_objects, len(message_objects)
 
-    def send_message(self, message: str, from_alias: str, mess_props: MessageProperties = None) -> bool:
+    def __messages_between(self, since: datetime = None, until: datetime = None) -> list:
+        ''' This is a helper method to return the messages received from since to until, newest first like the deque
+            NOTE: the deque is in received time order, so the range is found with two binary searches instead of reading every message
+            NOTE: it is called with the room locked, times with a time zone are compared in local time like the received times
+        '''
+        since = local_time(since)
+        until = local_time(until)
+        if self.__time_ordered is False:
+            return [current_message for current_message in self if (since is None or current_message.message_properties.rec_time >= since)
+                                                                and (until is None or current_message.message_properties.rec_time < until)]
+        first_position = EMPTY if until is None else self.__first_position_before(until)
+        last_position = len(self) if since is None else self.__first_position_before(since)
+        return list(islice(self, first_position, last_position))
+
+    def __first_position_before(self, when: datetime) -> int:
+        ''' This is a helper method to binary search the first position of the deque (newest first) with a message received before when
+        '''
+        low_position, high_position = EMPTY, len(self)
+        while low_position < high_position:
+            middle_position = (low_position + high_position) // 2
+            if self[middle_position].message_properties.rec_time < when:
+                high_position = middle_position
+            else:
+                low_position = middle_position + 1
+        return low_position
+
+    def activity_stats(self) -> dict:
+        ''' This method will return the activity counters of the room (see RoomStats), without reading any message
+        '''
+        with self.__lock:
+            return self.__stats.to_dict()
+
+    def send_message(self, message: str, from_alias: str, mess_props: MessageProperties = None, defer_persist: bool = False) -> bool:
         ''' This method will send a message to the ChatRoom instance
             NOTE: we are assuming that message is not None or empty
             NOTE: we most likely will need to utilize the put function to put the message on the queue
             NOTE: we also need to create an instance of ChatMessage to put on the queue
-            NOTE: should we persist after putting the message on the deque.
+            NOTE: the message waits in the pending writes of the room, it is persisted right away unless defer_persist is True
+            NOTE: a message with the client_message_id of a message already sent is not sent again, True is returned like the first time
+            NOTE: in an ephemeral room the message gets a local sequence number right away and is never persisted
+            NOTE: the room is locked while the message is put in it, never while it is persisted
+            NOTE: the room sets the received time of the message, it is never earlier than the one of the message before
         '''
         logging.info(f'Attempting to send {message} with the alias {from_alias}.')
-        if from_alias in self.__member_list or self.__room_type is ROOM_TYPE_PUBLIC:
+        if from_alias in self.__member_set or self.__room_type in (ROOM_TYPE_PUBLIC, ROOM_TYPE_EPHEMERAL):
             logging.debug(f'{from_alias} was granted access to {self.__room_name} to send a message.')
             if mess_props is not None:
-                new_message = ChatMessage(message = message, mess_props = mess_props)
-                self.put(new_message)
-                logging.debug(f'New ChatMessage created with message {message} and placed in the deque.')
-                self.persist()
+                with self.__lock:
+                    if self.find_sent_message(mess_props.client_message_id) is not None:
+                        logging.debug(f'Message {mess_props.client_message_id} was already sent to {self.__room_name}, it is not sent again.')
+                        return True
+                    mess_props.rec_time = self.__receive_time()
+                    self.__version += 1
+                    new_message = ChatMessage(message = message, mess_props = mess_props)
+                    if self.ephemeral is True:
+                        self.__last_sequence_num += 1
+                        mess_props.sequence_number = self.__last_sequence_num
+                        new_message.dirty = False
+                        self.__messages_by_sequence[self.__last_sequence_num] = new_message
+                        self.__stats.record(from_alias = from_alias, rec_time = mess_props.rec_time, sequence_num = self.__last_sequence_num)
+                    else:
+                        self.__pending_writes.append(new_message)
+                        if storage_breaker.degraded is True:
+                            self.__spool_pending()
+                    self.put(new_message)
+                    if self.ephemeral is False:
+                        inbox_index.add(new_message)
+                    if mess_props.client_message_id is not None:
+                        self.__sent_messages.put(mess_props.client_message_id, new_message)
+                    logging.debug(f'New ChatMessage created with message {message} and placed in the deque.')
+                    if self.ephemeral is True:
+                        self.__evict_overflow()
+                if self.ephemeral is False and defer_persist is False:
+                    self.persist()
                 return True
             else:
                 logging.warning(f'No message properties given, cannot generate to_user for message properties. Failed to send message.')
@@ -294,67 +921,259 @@ class ChatRoom(deque):
         ''' This method will restore the metadata and the messages that a certain ChatRoom instance needs
             NOTE: a ChatRoom will contain it's own collection, if we are creating a new collection, we don't
                     need to restore
+            NOTE: the activity counters are restored from the metadata, only the messages stored after they were saved are counted again
+            NOTE: messages stored out of received time order (before the room set the received times) make time range reads scan the room
         '''
         logging.info('Beginning the restore process.')
-        room_metadata = self.__mongo_collection.find_one({ 'room_name' : self.__room_name })
+        room_metadata = self.__backend.load_room(self.__room_name)
         if room_metadata is None:
             logging.debug(f'Room name {self.__room_name} was not found in the collections.')
             return False
+        self.__apply_metadata(room_metadata)
+        self.__stats = RoomStats(room_metadata.get('stats'))
+        self.__stats_saved_num = self.__stats.sequence_num
+        if self.ephemeral is True:
+            logging.info(f'{self.__room_name} is ephemeral, it has no messages to restore.')
+            return True
+        for current_message in self.__backend.load_messages(self.__room_name):
+            new_message = self.__message_from_document(current_message)
+            message_properties = new_message.message_properties
+            new_message.dirty = False
+            self.__messages_by_sequence[message_properties.sequence_number] = new_message
+            if message_properties.client_message_id is not None:
+                self.__sent_messages.put(message_properties.client_message_id, new_message)
+            if isinstance(message_properties.sequence_number, int):
+                self.__last_sequence_num = max(self.__last_sequence_num, message_properties.sequence_number)
+                if message_properties.sequence_number > self.__stats_saved_num:
+                    self.__stats.record(from_alias = message_properties.from_user, rec_time = message_properties.rec_time, sequence_num = message_properties.sequence_number)
+            self.__restored_receive_time(message_properties.rec_time)
+            self.put(message = new_message)
+            inbox_index.add(new_message)
+            logging.debug(f'Message {message_properties.sequence_number} was placed onto the deque.')
+        logging.info('All messages restored to the deque.')
+        self.__replay_spool()
+        return True
+
+    def __apply_metadata(self, room_metadata: dict) -> None:
+        ''' This is a helper method to set the metadata of the room from its stored document
+        '''
         self.__room_name = room_metadata['room_name']
         self.__owner_alias = room_metadata['owner_alias']
         self.__room_type = room_metadata['room_type']
-        self.__member_list = room_metadata['member_list']
+        self.__member_set = set(room_metadata['member_list'])
         self.__create_time = room_metadata['create_time']
         self.__modify_time = room_metadata['modify_time']
-        for current_message in self.__mongo_collection.find({'message': {'$exists': 'true'}}):
-            message_properties = MessageProperties(room_name = current_message['mess_props']['room_name'],
-                                                    to_user = current_message['mess_props']['to_user'],
-                                                    from_user = current_message['mess_props']['from_user'],
-                                                    mess_type = current_message['mess_props']['mess_type'],
-                                                    sequence_num = current_message['mess_props']['sequence_num'],
-                                                    sent_time = current_message['mess_props']['sent_time'],
-                                                    rec_time = current_message['mess_props']['rec_time'])
-            new_message = ChatMessage(message = current_message['message'], mess_id = current_message['_id'], mess_props = message_properties)
+        self.__retention_count = room_metadata.get('retention_count')
+        self.__retention_seconds = room_metadata.get('retention_seconds')
+        self.__archive_sample_every = room_metadata.get('archive_sample_every')
+
+    def __adopt_stored_metadata(self) -> None:
+        ''' This is a helper method for a new room whose metadata another worker stored first: the stored document wins
+            NOTE: the members of the room are moved in the member index to match the stored document
+        '''
+        room_metadata = self.__backend.load_room(self.__room_name)
+        with self.__lock:
+            previous_members = set(self.__member_set)
+            self.__apply_metadata(room_metadata)
+            for current_member in previous_members - self.__member_set:
+                member_index.discard(current_member, self.__room_name)
+            for current_member in self.__member_set - previous_members:
+                member_index.add(current_member, self.__room_name)
+        logging.warning(f'Chatroom {self.__room_name} metadata was already stored by another worker, the stored metadata was kept.')
+
+    def __message_from_document(self, message_document: dict) -> ChatMessage:
+        ''' This is a helper method to build a ChatMessage from a stored message document or a spooled one
+        '''
+        message_properties = MessageProperties(room_name = message_document['mess_props']['room_name'],
+                                                to_user = message_document['mess_props']['to_user'],
+                                                from_user = message_document['mess_props']['from_user'],
+                                                mess_type = message_document['mess_props']['mess_type'],
+                                                sequence_num = message_document['mess_props']['sequence_num'],
+                                                sent_time = message_document['mess_props']['sent_time'],
+                                                rec_time = message_document['mess_props']['rec_time'],
+                                                client_message_id = message_document['mess_props'].get('client_message_id'))
+        return ChatMessage(message = unpack_message(message_document['message'], message_document.get('codec')), mess_id = message_document.get('_id'), mess_props = message_properties,
+                            deleted = message_document.get('deleted', False), edit_time = message_document.get('edit_time'))
+
+    def __replay_spool(self) -> None:
+        ''' This is a helper method to put the spooled messages that were not persisted back in the pending writes, in order
+            NOTE: they keep the sequence number they were given before, messages found in storage already are left out
+            NOTE: the spool is written again with only the replayed messages, so its persisted counts start over
+        '''
+        spooled_documents = self.__spool.load()
+        if len(spooled_documents) is EMPTY:
+            return
+        replayed_messages = list()
+        for current_document in spooled_documents:
+            new_message = self.__message_from_document(current_document)
+            if new_message.message_properties.sequence_number in self.__messages_by_sequence or self.find_sent_message(new_message.message_properties.client_message_id) is not None:
+                continue
+            self.__restored_receive_time(new_message.message_properties.rec_time)
             self.put(message = new_message)
-            logging.debug('Message', current_message['message'], 'was placed onto the deque.')
-        logging.info('All messages restored to the deque.')
-        return True
+            self.__pending_writes.append(new_message)
+            inbox_index.add(new_message)
+            if new_message.message_properties.client_message_id is not None:
+                self.__sent_messages.put(new_message.message_properties.client_message_id, new_message)
+            replayed_messages.append(new_message)
+        self.__spool.clear()
+        self.__spool.append([current_message.to_dict() for current_message in replayed_messages])
+        self.__num_spooled = len(replayed_messages)
+        logging.info(f'{len(replayed_messages)} spooled messages of {self.__room_name} are pending again.')
 
-    def persist(self):
+    def __spool_pending(self) -> None:
+        ''' This is a helper method to append the pending messages that are not in the spool yet to it
+            NOTE: the spooled messages are always the oldest pending ones, since pending messages are persisted oldest first
+        '''
+        unspooled_messages = list(islice(self.__pending_writes, self.__num_spooled, None))
+        if len(unspooled_messages) is EMPTY:
+            return
+        self.__spool.append([current_message.to_dict() for current_message in unspooled_messages])
+        self.__num_spooled += len(unspooled_messages)
+
+    def __metadata(self) -> dict:
+        ''' This is a helper method to build the metadata document of the room
+        '''
+        return {'room_name':self.__room_name,
+                'owner_alias': self.__owner_alias,
+                'room_type': self.__room_type,
+                'member_list': self.member_list,
+                'retention_count': self.__retention_count,
+                'retention_seconds': self.__retention_seconds,
+                'archive_sample_every': self.__archive_sample_every,
+                'create_time': self.__create_time,
+                'modify_time': self.__modify_time}
+
+    def persist(self) -> bool:
         ''' This method will maintain the data inside of a ChatRoom instance:  
                 - The metadata
                 - The messages in the room.
             NOTE: we want to iterate through the deque
             TODO: understand how the sequence number is assigned
+            NOTE: returns False if storage failed or the circuit breaker is open, the pending messages are then kept in the spool
         '''
         logging.info(f'Beginning the persistence process for a chat room: {self.__room_name}.')
-        if self.__mongo_collection.find_one({ 'room_name': self.__room_name }) is None:
-            self.__room_id = self.__mongo_collection.insert_one({'room_name':self.__room_name,
-                                                                'owner_alias': self.__owner_alias,
-                                                                'room_type': self.__room_type,
-                                                                'member_list': self.__member_list,
-                                                                'create_time': self.__create_time,
-                                                                'modify_time': self.__modify_time})
-            logging.debug(f'Chatroom {self.__room_name} metadata has been added to the collection.')
-        else:
-            if self.__dirty == True:
-                self.__mongo_collection.replace_one({'room_name':self.__room_name,
-                                                    'owner_alias': self.__owner_alias,
-                                                    'room_type': self.__room_type,
-                                                    'member_list': self.__member_list,
-                                                    'create_time': self.__create_time,
-                                                    'modify_time': self.__modify_time},
-                                                    upsert = True)
-                logging.debug(f'Chatroom {self.__room_name} metadata has been updated in the collection.')
-        self.__dirty = False
-        # put messages in the collection now
-        for current_message in list(self):
-            if current_message.dirty == True:
-                if current_message.message_id is None or self.__mongo_collection.find_one({ '_id' : current_message.message_id }) is None:
-                    current_message.message_properties.sequence_number = self.__get_next_sequence_num()
-                    serialized = current_message.to_dict()
-                    self.__mongo_collection.insert_one(serialized)
-                    current_message.dirty = False
+        with self.__persist_lock:
+            try:
+                if storage_breaker.allow() is False:
+                    raise StorageUnavailable(f'Storage is unavailable, {self.__room_name} was not persisted.')
+                with timed_stage('persist'):
+                    self.__persist()
+            except StorageUnavailable:
+                logging.debug(f'Storage is unavailable, {self.num_pending} messages of {self.__room_name} stay pending.')
+                with self.__lock:
+                    self.__spool_pending()
+                return False
+            except Exception:
+                storage_breaker.record_failure()
+                logging.error(f'Persisting {self.__room_name} failed, {self.num_pending} messages stay pending.')
+                with self.__lock:
+                    self.__spool_pending()
+                return False
+        storage_breaker.record_success()
+        return True
+
+    def __persist(self) -> None:
+        ''' This is a helper method that does the work of persist(), so the whole of it is timed as one stage
+            NOTE: it runs under the persist lock, the room itself is only locked to read the metadata and to take and apply batches,
+                    sends and reads go on while storage is being written
+            NOTE: a batch stays at the front of the pending writes until it is stored, so a failed batch is simply tried again
+            NOTE: the metadata is only written when it is missing, an existing document is a conflict with the worker that stored it first,
+                    whose metadata is kept (every later change of the metadata is a targeted update)
+        '''
+        with self.__lock:
+            room_fields = self.__metadata()
+            room_dirty = self.__dirty
+            self.__dirty = False
+        try:
+            if room_dirty is True or self.__backend.room_exists(self.__room_name) is False:
+                if self.__backend.insert_room(dict(room_fields)) is True:
+                    logging.debug(f'Chatroom {self.__room_name} metadata has been added to the collection.')
+                elif room_dirty is True:
+                    self.__adopt_stored_metadata()
+        except:
+            with self.__lock:
+                self.__dirty = self.__dirty or room_dirty
+            raise
+        # put the pending messages in the collection now, a batch at a time, oldest first
+        while True:
+            with self.__lock:
+                message_batch = list(islice(self.__pending_writes, PERSIST_BATCH_SIZE))
+            if len(message_batch) is EMPTY:
+                break
+            inserted_ids = self.__persist_batch(message_batch)
+            with self.__lock:
+                self.__apply_batch(message_batch, inserted_ids)
+        self.__save_stats()
+
+    def __save_stats(self, force: bool = False) -> None:
+        ''' This is a helper method to save the activity counters in the room metadata if they counted messages since the last save
+            NOTE: they are saved at most every STATS_SAVE_SECONDS unless force is True, messages stored since are counted again on restore
+        '''
+        with self.__lock:
+            if self.ephemeral is True or self.__stats.sequence_num == self.__stats_saved_num:
+                return
+            if force is False and self.__stats_saved_at is not None and time.monotonic() - self.__stats_saved_at < STATS_SAVE_SECONDS:
+                return
+            stats_document = self.__stats.to_document()
+        self.__backend.update_room(self.__room_name, set_fields = { 'stats': stats_document })
+        with self.__lock:
+            self.__stats_saved_num = max(self.__stats_saved_num, stats_document['sequence_num'])
+            self.__stats_saved_at = time.monotonic()
+        logging.debug(f'Activity counters of {self.__room_name} were saved up to message {stats_document["sequence_num"]}.')
+
+    def __persist_batch(self, message_batch: list) -> list:
+        ''' This is a helper method to insert a batch of messages with one sequence reservation and one insert, and return their ids
+            NOTE: messages that already have a sequence number (a failed batch being retried) keep it
+        '''
+        unsequenced_messages = [current_message for current_message in message_batch if current_message.message_properties.sequence_number == -1]
+        if len(unsequenced_messages) > EMPTY:
+            first_sequence_num = self.__get_next_sequence_num(count = len(unsequenced_messages)) - len(unsequenced_messages) + 1
+            for sequence_offset, current_message in enumerate(unsequenced_messages):
+                current_message.message_properties.sequence_number = first_sequence_num + sequence_offset
+        return self.__backend.insert_messages(self.__room_name, [current_message.to_dict(compress_body = True) for current_message in message_batch])
+
+    def __apply_batch(self, message_batch: list, inserted_ids: list) -> None:
+        ''' This is a helper method to take a stored batch off the pending writes and the spool, and index and count its messages
+            NOTE: it is called with the room locked
+            NOTE: messages are counted in the activity counters once they are stored, so the saved counters always match a sequence number
+        '''
+        for _ in message_batch:
+            self.__pending_writes.popleft()
+        self.__version += 1
+        for current_message, current_message_id in zip(message_batch, inserted_ids):
+            if current_message_id is None:
+                self.__drop_duplicate(current_message)
+                continue
+            current_message.message_id = current_message_id
+            current_message.dirty = False
+            self.__messages_by_sequence[current_message.message_properties.sequence_number] = current_message
+            self.__last_sequence_num = max(self.__last_sequence_num, current_message.message_properties.sequence_number)
+            self.__stats.record(from_alias = current_message.message_properties.from_user,
+                                rec_time = current_message.message_properties.rec_time,
+                                sequence_num = current_message.message_properties.sequence_number)
+        num_spooled_persisted = min(len(message_batch), self.__num_spooled)
+        if num_spooled_persisted > EMPTY:
+            self.__num_spooled -= num_spooled_persisted
+            if self.__num_spooled == EMPTY:
+                self.__spool.clear()
+            else:
+                self.__spool.mark_persisted(num_spooled_persisted)
+        logging.debug(f'{len(message_batch)} messages of {self.__room_name} were persisted.')
+
+    def __drop_duplicate(self, message: ChatMessage) -> None:
+        ''' This is a helper method to take a message back out of the room when storage already had its client_message_id
+            NOTE: this only happens when the dedupe cache forgot the first send (it was too old, or sent before a restart)
+        '''
+        logging.warning(f'Message {message.message_properties.client_message_id} of {self.__room_name} was already stored, dropping the duplicate.')
+        message.expired = True
+        message.dirty = False
+        self.__sent_messages.discard(message.message_properties.client_message_id)
+        try:
+            self.remove(message)
+        except ValueError:
+            logging.debug(f'The duplicate message was not on the deque of {self.__room_name} anymore.')
+        if message.message_properties.message_type == PRIVATE_MESSAGE:
+            inbox_index.prune(message.message_properties.to_user)
 
 
 class RoomList():
@@ -363,28 +1182,56 @@ class RoomList():
         TODO: complete this class by writing its functions.
         TODO: check out the data model to see what names should be
     """
-    def __init__(self, room_list_name: str = DEFAULT_ROOM_LIST_NAME) -> None:
+    def __init__(self, room_list_name: str = DEFAULT_ROOM_LIST_NAME, user_list: UserList = None, restore: bool = True, restore_workers: int = 1, backend: StorageBackend = None) -> None:
         """ Try to restore from mongo and establish variables for the room list
             TODO: RoomList takes a name, set the name
             TODO: inherit a list, or create an internal variable for a list of rooms
             TODO: restore the mongoDB collection
             NOTE: restore will handle putting the rooms into the room_list
+            NOTE: an existing UserList can be shared so the RoomList does not keep a stale copy of the users
+            NOTE: with restore set to False the list starts empty, and restore() has to be called to load it (e.g. in a warm-up thread)
+            NOTE: restore_workers is the number of threads used to restore the chat rooms
+            NOTE: the chat rooms of the list are kept in the same storage backend as the list
+            NOTE: the list is stored as a small header document plus a catalog with one versioned entry per room
+            NOTE: the lock only guards the rooms held in memory, rooms are never locked while the list is
         """
         logging.info(f'Creating RoomList Instance: {room_list_name}')
         self.__room_list_name = room_list_name
         self.__room_list = list()
-        self.__user_list = UserList()
-        # Set up mongo - client, db, collection
-        self.__mongo_client = MongoClient(host = MONGO_DB_HOST, port = MONGO_DB_PORT, username = MONGO_DB_USER, password = MONGO_DB_PASS, authSource = MONGO_DB_AUTH_SOURCE, authMechanism = MONGO_DB_AUTH_MECHANISM)
-        self.__mongo_db = self.__mongo_client.MONGO_DB
-        self.__mongo_collection = self.__mongo_db.get_collection(room_list_name)
-        if self.__mongo_collection is None:
-            self.__mongo_collection = self.__mongo_db.create_collection(room_list_name)
-        # Restore from mongo if possible, if not (or we're creating new) then setup properties
-        if self.__restore() is not True:
-            self.__room_list_create = datetime.now()
-            self.__room_list_modify = datetime.now()
-            self.__dirty = True
+        self.__rooms_by_name = dict()
+        # Set up the storage backend (mongo unless configured otherwise) for the room list
+        self.__backend = backend if backend is not None else get_default_backend()
+        self.__user_list = user_list if user_list is not None else UserList(backend = self.__backend)
+        self.__restore_workers = restore_workers
+        self.__num_rooms_to_restore = EMPTY
+        self.__num_rooms_restored = EMPTY
+        self.__catalog_versions = dict()
+        self.__lock = threading.Lock()
+        self.__persist_lock = threading.Lock()
+        # Restore from storage if possible, if not (or we're creating new) then setup properties
+        self.__room_list_create = datetime.now()
+        self.__room_list_modify = datetime.now()
+        self.__header_persisted = False
+        if restore is True:
+            self.restore()
+
+    # property to get the number of rooms found in the room list metadata that have to be restored
+    @property
+    def num_rooms_to_restore(self):
+        return self.__num_rooms_to_restore
+
+    # property to get the number of rooms restored so far
+    @property
+    def num_rooms_restored(self):
+        return self.__num_rooms_restored
+
+    def restore(self) -> bool:
+        ''' This method will load the room list and its chat rooms from the collection, if the room list was persisted before
+        '''
+        if self.__restore() is True:
+            self.__header_persisted = True
+            return True
+        return False
 
     def create(self, room_name: str, owner_alias: str, member_list: list = None, room_type: int = ROOM_TYPE_PRIVATE) -> ChatRoom:
         ''' This method will create a new ChatRoom given that the room_name is not already taken for the collection.
@@ -393,8 +1240,8 @@ class RoomList():
             TODO: it may not be needed to recreated an already existing Chatroom (through restore() method).
         '''
         logging.info(f'Attempting to create a ChatRoom instance with name {room_name}.')
-        if self.__mongo_db.get_collection(room_name) is None:
-            return ChatRoom(room_name = room_name, member_list = member_list, owner_alias = owner_alias, room_type = room_type, create_new = True)
+        if room_name not in self.__rooms_by_name and self.__backend.room_exists(room_name) is False:
+            return ChatRoom(room_name = room_name, member_list = member_list, owner_alias = owner_alias, room_type = room_type, create_new = True, backend = self.__backend)
         logging.debug(f'Instance of {room_name} collection already exists.')
         return None
 
@@ -402,26 +1249,97 @@ class RoomList():
         ''' This method will add a ChatRoom instance to the list of ChatRooms
             NOTE: this method will add the list if the room name does not already exist in the list
         '''
-        for current_chat_room in self.__room_list:
-            if new_room.room_name == current_chat_room.room_name:
+        with self.__lock:
+            if new_room.room_name in self.__rooms_by_name:
                 logging.debug(f'New room with name {new_room.room_name} already exists in {self.__room_list_name}.')
                 return None
-        self.__room_list.append(new_room)
+            self.__room_list.append(new_room)
+            self.__rooms_by_name[new_room.room_name] = new_room
         logging.debug(f'Chat room {new_room.room_name} added to the room list.')
         self.__persist()
+        if self.__backend.insert_catalog_entry(self.__room_list_name, self.__catalog_entry(new_room)) is True:
+            self.__catalog_versions[new_room.room_name] = 1
+            logging.debug(f'Catalog entry of {new_room.room_name} was added to {self.__room_list_name}.')
+        else:
+            catalog_entry = self.__backend.load_catalog_entry(self.__room_list_name, new_room.room_name)
+            self.__catalog_versions[new_room.room_name] = catalog_entry['version'] if catalog_entry is not None else 1
+            logging.debug(f'{new_room.room_name} was already in the catalog of {self.__room_list_name}.')
 
     def remove(self, room_name: str):
         ''' This method will remove a ChatRoom instance from the list of ChatRooms.
             NOTE: we want to make sure that the ChatRoom instance with the given room_name exists.
         '''
-        chat_room_to_remove = self.__find_pos(room_name)
+        with self.__lock:
+            chat_room_to_remove = self.__find_pos(room_name)
+            if chat_room_to_remove is not CHAT_ROOM_INDEX_NOT_FOUND:
+                self.__room_list.pop(chat_room_to_remove)
+                del self.__rooms_by_name[room_name]
+                self.__catalog_versions.pop(room_name, None)
         if chat_room_to_remove is not CHAT_ROOM_INDEX_NOT_FOUND:
-            self.__room_list.pop(chat_room_to_remove)
+            self.__backend.delete_catalog_entry(self.__room_list_name, room_name)
             logging.debug(f'ChatRoom {room_name} was removed from the room list.')
-            self.__persist()
         else:
             logging.debug(f'ChatRoom {room_name} was not found in the room list.')
 
+    def add_member(self, room_name: str, member_alias: str) -> bool:
+        ''' This method will add member_alias to the room room_name and to its catalog entry
+            NOTE: only the catalog entry of that room is changed, with a versioned delta
+            NOTE: if the catalog entry can not be updated the member is removed from the room again and False is returned
+        '''
+        chat_room = self.get(room_name = room_name)
+        if chat_room is None or chat_room.add_member(member_alias = member_alias) is False:
+            return False
+        if self.__update_catalog(room_name, set_fields = { 'modify_time': datetime.now() }, add_members = [member_alias]) is False:
+            logging.error(f'{member_alias} was not added to the catalog entry of {room_name}, they are removed from the room again.')
+            chat_room.remove_member(member_alias = member_alias)
+            return False
+        return True
+
+    def remove_member(self, room_name: str, member_alias: str) -> bool:
+        ''' This method will remove member_alias from the room room_name and from its catalog entry
+            NOTE: only the catalog entry of that room is changed, with a versioned delta
+            NOTE: if the catalog entry can not be updated the member is added to the room again and False is returned
+        '''
+        chat_room = self.get(room_name = room_name)
+        if chat_room is None or chat_room.remove_member(member_alias = member_alias) is False:
+            return False
+        if self.__update_catalog(room_name, set_fields = { 'modify_time': datetime.now() }, remove_members = [member_alias]) is False:
+            logging.error(f'{member_alias} was not removed from the catalog entry of {room_name}, they are added to the room again.')
+            chat_room.add_member(member_alias = member_alias)
+            return False
+        return True
+
+    def __catalog_entry(self, chat_room: ChatRoom) -> dict:
+        ''' This is a helper method to build the first catalog entry of a room
+        '''
+        return {'list_name': self.__room_list_name,
+                'room_name': chat_room.room_name,
+                'room_type': chat_room.room_type,
+                'owner_alias': chat_room.owner_alias,
+                'member_list': chat_room.member_list,
+                'create_time': datetime.now(),
+                'modify_time': datetime.now(),
+                'version': 1}
+
+    def __update_catalog(self, room_name: str, set_fields: dict = None, add_members: list = None, remove_members: list = None) -> bool:
+        ''' This is a helper method to apply a delta to the catalog entry of room_name at the version this list last saw
+            NOTE: if another worker changed the entry first, the version is read again and the delta is retried
+        '''
+        for _ in range(CATALOG_UPDATE_RETRIES):
+            version = self.__catalog_versions.get(room_name, 1)
+            if self.__backend.update_catalog_entry(self.__room_list_name, room_name, version, set_fields = set_fields, add_members = add_members, remove_members = remove_members) is True:
+                self.__catalog_versions[room_name] = version + 1
+                logging.debug(f'Catalog entry of {room_name} was updated to version {version + 1}.')
+                return True
+            catalog_entry = self.__backend.load_catalog_entry(self.__room_list_name, room_name)
+            if catalog_entry is None:
+                logging.warning(f'{room_name} has no catalog entry in {self.__room_list_name}.')
+                return False
+            logging.debug(f'Catalog entry of {room_name} was at version {catalog_entry["version"]}, not {version}, retrying.')
+            self.__catalog_versions[room_name] = catalog_entry['version']
+        logging.error(f'Catalog entry of {room_name} could not be updated after {CATALOG_UPDATE_RETRIES} tries.')
+        return False
+
     def find_room_in_metadata(self, room_name: str) -> dict:
         ''' This method will return a dictionary of information, relating to the metadata...?
             NOTE: most likely this method will just access the metadata and find the room
@@ -448,9 +1366,11 @@ class RoomList():
         ''' This method will return the rooms in the room list.
             NOTE: The room list can be empty
             NOTE: this may just be the room names or not
+            NOTE: a copy is returned, so it can be iterated while rooms are added in other threads
         '''
         logging.info('Returned the list of rooms.')
-        return self.__room_list
+        with self.__lock:
+            return list(self.__room_list)
 
     def get(self, room_name: str) -> ChatRoom:
         ''' This method will return a ChatRoom instance, given the name of the room, room_name.
@@ -458,12 +1378,12 @@ class RoomList():
             NOTE: do we create a new ChatRoom if the chatroom was not found?
         '''
         logging.info(f'Attemping to get a chat room with name {room_name}.')
-        for chat_room in self.__room_list:
-            if chat_room.room_name == room_name:
-                logging.debug(f'{room_name} was found in the chat room list.')
-                return chat_room
-        logging.debug(f'{room_name} was not found in the chat room list.')
-        return None
+        chat_room = self.__rooms_by_name.get(room_name)
+        if chat_room is None:
+            logging.debug(f'{room_name} was not found in the chat room list.')
+        else:
+            logging.debug(f'{room_name} was found in the chat room list.')
+        return chat_room
 
     def __find_pos(self, room_name: str) -> int:
         ''' This method is most likely a helper method for getting the position of a ChatRoom instance is in a list.
@@ -471,7 +1391,7 @@ class RoomList():
             NOTE: This is used for removing a chatroom instance in the list
         '''
         for chat_room_index in range(len(self.__room_list)):
-            if self.__room_list[chat_room_index].room_name is room_name:
+            if self.__room_list[chat_room_index].room_name == room_name:
                 logging.debug(f'{room_name} was found in the room list.')
                 return chat_room_index
         logging.debug(f'Room name {room_name} was not found in the room list.')
@@ -482,20 +1402,39 @@ class RoomList():
                 member_aliases in the ChatRoom instance.
             NOTE: it is possible for all rooms to not have a the member_alias within their instance. return a empty list
             NOTE: create a new list and append the ChatRooms to the list.
-            TODO: using the member_alias, find all rooms with a members_list that has this alias
-            TODO: check if this member_alias is valid
+            NOTE: the rooms are looked up through the member_index, so this does not scan every room
         '''
         logging.info(f'Attempting to find chat rooms for member {member_alias} in {self.__room_list_name}.')
-        if member_alias not in self.__user_list.user_aliases:
+        if self.__user_list.get(member_alias) is None:
             logging.debug(f'Alias {member_alias} was not found in the list of users!')
             return []
         found_member_chat_rooms = list()
-        for current_chat_room in self.__room_list:
-            if member_alias in current_chat_room.member_list:
-                found_member_chat_rooms.append(current_chat_room)
+        for current_room_name in member_index.rooms_for(member_alias):
+            if current_room_name in self.__rooms_by_name:
+                found_member_chat_rooms.append(self.__rooms_by_name[current_room_name])
         logging.info(f'Returning a list of chat rooms with the member alias of {member_alias}.')
         return found_member_chat_rooms
 
+    def get_feed(self, member_alias: str, before: str = None, page_size: int = FEED_PAGE_SIZE):
+        ''' This method will return up to page_size of the newest messages across every room of member_alias, newest first,
+                and the cursor to ask for the next page
+            NOTE: before is a cursor from a previous page, only messages older than it are returned (the newest messages if it is None)
+            NOTE: the rooms are merged lazily with a heap, so only about page_size messages of each room are looked at
+            NOTE: the cursor is None when there are no older messages
+        '''
+        logging.info(f'Attempting to get the feed of {member_alias} in {self.__room_list_name}.')
+        before_key = decode_feed_cursor(before) if before is not None else None
+        room_feeds = list()
+        for current_room in self.find_by_member(member_alias):
+            if before_key is None:
+                room_feeds.append(current_room.iter_newest())
+            else:
+                room_feeds.append(dropwhile(lambda current_message: feed_key(current_message) >= before_key, current_room.iter_newest()))
+        feed_messages = list(islice(heapq.merge(*room_feeds, key = feed_key, reverse = True), page_size + 1))
+        next_before = encode_feed_cursor(feed_key(feed_messages[page_size - 1])) if len(feed_messages) > page_size else None
+        logging.debug(f'{min(len(feed_messages), page_size)} feed messages were merged from {len(room_feeds)} rooms for {member_alias}.')
+        return feed_messages[:page_size], next_before
+
     def find_by_owner(self, owner_alias: str) -> list:
         ''' This method will return a list of ChatRoom instances that have an owner_alias that the user is searching for.
             NOTE: it is possible for all rooms to not have the current owner_alias.
@@ -513,25 +1452,42 @@ class RoomList():
         return found_owner_chat_rooms
 
     def __persist(self):
-        ''' This method will save the metadata of the RoomList class and push it to the collections
-            NOTE: the metadata should contain the list of room_names in the metadata where we would collect the room_names and find the room based on
-        '''
-        logging.info(f'Beginning the persistence process for the room list: {self.__room_list_name}')
-        if self.__mongo_collection.find_one({ 'list_name': self.__room_list_name }) is None:
-            logging.info(f'Persisting new room list {self.__room_list_name}.')
-            self.__room_id = self.__mongo_collection.insert_one({'list_name':self.__room_list_name,                                                            
-                                                                'create_time': self.__room_list_create,
-                                                                'modify_time': self.__room_list_modify,
-                                                                'rooms_metadata': [self.find_room_in_metadata(user_alias) for user_alias in self.__user_list.user_aliases]}) # metadata here
-        else:
-            if self.__dirty == True:
-                logging.debug(f'Updating persistence of {self.__room_list_name} metadata.')
-                self.__mongo_collection.replace_one({'list_name':self.__room_list_name,                                                   
-                                                    'create_time': self.__room_list_create,
-                                                    'modify_time': self.__room_list_modify,
-                                                    'rooms_metadata': [self.find_room_in_metadata(user_alias) for user_alias in self.__user_list.user_aliases]},
-                                                    upsert = True) # metadata here and upsert = True to update the room metadata
-        self.__dirty = False
+        ''' This method will save the header document of the RoomList class the first time the list is stored
+            NOTE: the rooms are not in the header, each room has its own catalog entry so adding a room only writes that entry
+        '''
+        with self.__persist_lock:
+            if self.__header_persisted is True:
+                return
+            logging.info(f'Beginning the persistence process for the room list: {self.__room_list_name}')
+            if self.__backend.load_room_list(self.__room_list_name) is None:
+                logging.info(f'Persisting new room list {self.__room_list_name}.')
+                self.__backend.save_room_list({'list_name':self.__room_list_name,
+                                                'create_time': self.__room_list_create,
+                                                'modify_time': self.__room_list_modify})
+            self.__header_persisted = True
+
+    def __migrate_rooms_metadata(self, rooms_metadata: list) -> list:
+        ''' This is a helper method to move the rooms of a room list stored the old way (every room in the header document) into the catalog
+        '''
+        catalog_entries = list()
+        for current_room_metadata in rooms_metadata:
+            if current_room_metadata is None or current_room_metadata['room_name'] in [current_entry['room_name'] for current_entry in catalog_entries]:
+                continue
+            catalog_entry = dict(current_room_metadata, list_name = self.__room_list_name, create_time = datetime.now(), modify_time = datetime.now(), version = 1)
+            self.__backend.insert_catalog_entry(self.__room_list_name, catalog_entry)
+            catalog_entries.append(catalog_entry)
+        logging.info(f'{len(catalog_entries)} rooms of {self.__room_list_name} were moved into its catalog.')
+        return catalog_entries
+
+    def __restore_room(self, room_metadata: dict) -> ChatRoom:
+        ''' This is a helper method to restore one chat room from its entry in the room list metadata
+            NOTE: this runs in the restore threads, so it only builds the room and does not touch the room list
+        '''
+        return ChatRoom(room_name = room_metadata['room_name'],
+                        member_list = room_metadata['member_list'],
+                        owner_alias = room_metadata['owner_alias'],
+                        room_type = room_metadata['room_type'],
+                        backend = self.__backend)
 
     def __restore(self) -> bool:
         ''' This method will load the metadata from the collection of the RoomList class and load it to the instance.
@@ -540,21 +1496,28 @@ class RoomList():
             TODO: restore all of the chat rooms through the metadata in the collections.
         '''
         logging.info('Beginning the restore process.')
-        room_metadata = self.__mongo_collection.find_one({ 'list_name' : self.__room_list_name })
-        if room_metadata is None:
+        room_metadata = self.__backend.load_room_list(self.__room_list_name)
+        catalog_entries = self.__backend.load_catalog(self.__room_list_name)
+        if room_metadata is None and len(catalog_entries) is EMPTY:
             logging.debug(f'Room name {self.__room_list_name} was not found in the collections.')
             return False
-        self.__room_list_name = room_metadata['list_name']
-        self.__room_list_create = room_metadata['create_time']
-        self.__room_list_modify = room_metadata['modify_time']
-        self.__rooms_metadata = room_metadata['rooms_metadata']
+        if room_metadata is not None:
+            self.__room_list_create = room_metadata['create_time']
+            self.__room_list_modify = room_metadata['modify_time']
+            if len(catalog_entries) is EMPTY and room_metadata.get('rooms_metadata'):
+                catalog_entries = self.__migrate_rooms_metadata(room_metadata['rooms_metadata'])
+        self.__rooms_metadata = catalog_entries
+        for current_entry in self.__rooms_metadata:
+            self.__catalog_versions[current_entry['room_name']] = current_entry.get('version', 1)
+        self.__num_rooms_to_restore = len(self.__rooms_metadata)
         logging.info(f'Attempting to load chat rooms into room list.')
-        for current_room_metadata in self.__rooms_metadata:
-            new_chatroom = ChatRoom(room_name = current_room_metadata['room_name'],
-                                    member_list = current_room_metadata['member_list'],
-                                    owner_alias = current_room_metadata['owner_alias'],
-                                    room_type = current_room_metadata['room_type'])
-            self.__room_list.append(new_chatroom)
-            logging.debug('Room', current_room_metadata['room_name'], 'has been added to the room list.')
+        with ThreadPoolExecutor(max_workers = self.__restore_workers) as restore_executor:
+            for new_chatroom in restore_executor.map(self.__restore_room, self.__rooms_metadata):
+                with self.__lock:
+                    self.__room_list.append(new_chatroom)
+                    self.__rooms_by_name[new_chatroom.room_name] = new_chatroom
+                    self.__num_rooms_restored += 1
+                logging.debug(f'Room {new_chatroom.room_name} has been added to the room list.')
+        inbox_index.sort()
         logging.info(f'All rooms in {self.__room_list_name} placed into the room list.')
         return True
\ No newline at end of file
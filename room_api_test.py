@@ -22,6 +22,17 @@ class ChatTest(unittest.TestCase):
         json_message = json_load['message']['to']
         self.assertEqual(json_message, STARTUP_TEST_DICTIONARY['to'])
 
+    def test_probes(self):
+        ''' The liveness probe should always answer and the readiness probe should report the warm-up
+            NOTE: the server should be warmed up by the time the tests run
+        '''
+        self.assertEqual(requests.get(HEALTH_URL).status_code, 200)
+        ready = requests.get(READY_URL)
+        self.assertEqual(ready.status_code, 200)
+        json_load = json.loads(ready.text)
+        self.assertTrue(json_load['message']['data']['ready'])
+        self.assertEqual(json_load['message']['data']['rooms_restored'], json_load['message']['data']['rooms_to_restore'])
+
     def test_send(self):
         """ Testing the send api
         """
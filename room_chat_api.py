@@ -1,25 +1,185 @@
+import time
+IMPORT_START = time.perf_counter()
+import os
 import socket
+import hashlib
+import asyncio
 import logging
 import json
+import math
+from contextlib import asynccontextmanager
+from datetime import datetime
 from fastapi import FastAPI, Request, status, Form
-from fastapi.responses import JSONResponse, ORJSONResponse, Response
+from urllib.parse import urlencode
+from fastapi.responses import JSONResponse, ORJSONResponse, PlainTextResponse, RedirectResponse, Response, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from room import *
 from constants import *
 from users import *
+from cursors import ReadCursors
+from archive import MessageArchive
+from limits import RateLimiter
+from message_codec import StreamCompressor, compress, negotiate_encoding
+from storage import get_default_backend
+from spool import StorageUnavailable
+from room_transfer import RoomImporter, export_room
+from wire_format import decode_body, encode_body, negotiate_media_type, read_sends
+from profiling import RequestTimer, RequestProfiler, SlowRequestLog, request_timer, timed_stage
 
 MY_IPADDRESS = ""
 
 ''' Reasons for global variables:
         - The first is the documented way to deal with running the app in uvicorn
-        - The second one handles the RoomList to access the rooms from MongoDB
-        - The third one handles the users in the UserList from MongoDB
+        - The second one handles the users in the UserList from MongoDB
+        - The third one handles the RoomList to access the rooms from MongoDB (sharing the UserList above)
+        - The fourth one handles the read cursors of every user in every room
+        - The fifth one keeps the messages that expired out of their rooms
+        - The sixth and seventh ones rate limit sending messages per alias and per room
+        - The next ones count rejected and retried sends and keep track of the rooms that are being persisted in the background
+        - The next one reports the warm-up progress and timings to /readyz
+        - The last ones profile requests that send the profiling token and log the slow requests with their stage timings
+        NOTE: the users, rooms, read cursors and archive are only set up in the lifespan, so importing this module stays cheap
 '''
 logging.basicConfig(filename='message_chat.log', level=logging.INFO, format = LOG_FORMAT)
-app = FastAPI()
-room_list = RoomList()
-users = UserList()
-templates = Jinja2Templates(directory="")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """ Warm up the users and rooms in parallel worker threads before the app is ready, then run the background jobs until shutdown
+        NOTE: /healthz and /readyz answer while the warm-up is running, every other route answers 503 until it is done
+        NOTE: rooms that replayed spooled messages on restore get them persisted as soon as the warm-up is done
+    """
+    global users, room_list, read_cursors, message_archive
+    startup_start = time.perf_counter()
+    users = UserList(restore = False)
+    room_list = RoomList(user_list = users, restore = False, restore_workers = ROOM_RESTORE_WORKERS)
+    read_cursors, message_archive, _, _ = await asyncio.gather(asyncio.to_thread(ReadCursors),
+                                                                asyncio.to_thread(MessageArchive),
+                                                                asyncio.to_thread(users.restore),
+                                                                asyncio.to_thread(room_list.restore))
+    warm_up_status['startup_seconds'] = round(time.perf_counter() - startup_start, 3)
+    warm_up_status['ready'] = True
+    logging.info(f'Warm-up finished in {warm_up_status["startup_seconds"]} seconds with {users.num_users} users and {room_list.num_rooms_restored} rooms.')
+    for current_room in room_list.get_rooms():
+        if current_room.num_pending > EMPTY:
+            schedule_persist(chat_room = current_room)
+    archive_task = asyncio.create_task(archive_expired_messages())
+    cursor_flush_task = asyncio.create_task(flush_read_cursors())
+    yield
+    archive_task.cancel()
+    cursor_flush_task.cancel()
+    await asyncio.to_thread(read_cursors.persist)
+
+app = FastAPI(lifespan = lifespan)
+users = None
+room_list = None
+read_cursors = None
+message_archive = None
+alias_send_limiter = RateLimiter(rate = ALIAS_SEND_RATE, burst = ALIAS_SEND_BURST)
+room_send_limiter = RateLimiter(rate = ROOM_SEND_RATE, burst = ROOM_SEND_BURST)
+ephemeral_room_send_limiter = RateLimiter(rate = EPHEMERAL_ROOM_SEND_RATE, burst = EPHEMERAL_ROOM_SEND_BURST)
+queue_full_rejections = EMPTY
+duplicate_sends = EMPTY
+persisting_rooms = set()
+# the names of the rooms being imported, reserved until the import is in the room list or dropped
+importing_rooms = set()
+warm_up_status = { 'ready': False, 'import_seconds': None, 'startup_seconds': None }
+request_profiler = RequestProfiler()
+slow_request_log = SlowRequestLog()
+# the compiled templates are cached and never checked for changes on disk, restart the server to pick up template edits
+templates = Jinja2Templates(directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), PAGE_TEMPLATE_DIR), auto_reload = False)
+# page ETags are salted per process, room versions start over when the server restarts
+page_etag_salt = str(time.time_ns())
+
+@app.middleware("http")
+async def require_warm_up(request: Request, call_next):
+    """ Answer 503 for every route but the probes until the warm-up in the lifespan is done
+    """
+    if warm_up_status['ready'] is False and request.url.path not in PROBE_PATHS:
+        return JSONResponse(content = { 'message': 'The chat server is still warming up.' }, status_code = 503, headers = { 'Retry-After': '1' })
+    return await call_next(request)
+
+@app.middleware("http")
+async def compress_response(request: Request, call_next):
+    """ Compress responses of at least RESPONSE_COMPRESS_MIN_BYTES (message histories, inboxes) with the best codec the client accepts
+        NOTE: streamed responses (no Content-Length, like room exports and message pages) are compressed a chunk at a time instead of being read whole
+        NOTE: responses without a body (204, 304) are never compressed
+        NOTE: zstd is used when the zstandard package is installed and the client accepts it, gzip otherwise
+        NOTE: the lowest level is used, see compression_benchmark.py, higher levels cost far more CPU than the bytes they save
+    """
+    response = await call_next(request)
+    codec = negotiate_encoding(request.headers.get('accept-encoding', ''))
+    if codec is None or 'content-encoding' in response.headers or response.status_code in (204, 304):
+        return response
+    if 'content-length' not in response.headers:
+        response.headers['content-encoding'] = codec
+        response.headers['vary'] = ', '.join(current_vary for current_vary in (response.headers.get('vary'), 'Accept-Encoding') if current_vary)
+        response.body_iterator = compress_stream(response.body_iterator, StreamCompressor(codec, RESPONSE_COMPRESS_LEVEL))
+        return response
+    body = b''.join([current_chunk async for current_chunk in response.body_iterator])
+    headers = dict(response.headers)
+    headers.pop('content-length', None)
+    if len(body) >= RESPONSE_COMPRESS_MIN_BYTES:
+        body = await asyncio.to_thread(compress, body, codec, RESPONSE_COMPRESS_LEVEL)
+        headers['content-encoding'] = codec
+        headers['vary'] = ', '.join(current_vary for current_vary in (headers.get('vary'), 'Accept-Encoding') if current_vary)
+        logging.debug(f'Response of {request.url.path} was compressed with {codec} to {len(body)} bytes.')
+    return Response(content = body, status_code = response.status_code, headers = headers, media_type = response.media_type)
+
+@app.middleware("http")
+async def time_request(request: Request, call_next):
+    """ Time every request and its stages for the slow request log, and run it under cProfile if it sends the profiling token
+        NOTE: the id of a stored profile is sent back in the X-Profile-Id header, /admin/profiles/{profile_id} shows it
+    """
+    timer = RequestTimer(method = request.method, path = request.url.path)
+    request_timer.set(timer)
+    if request_profiler.authorized(request.headers.get(PROFILE_HEADER)):
+        response, profile_id = await request_profiler.run(call_next, request)
+        if profile_id is not None:
+            response.headers[PROFILE_ID_HEADER] = profile_id
+    else:
+        response = await call_next(request)
+    slow_request_log.record(timer = timer, status_code = response.status_code)
+    return response
+
+@app.get("/admin/profiles/{profile_id}", status_code = 200)
+async def get_profile(request: Request, profile_id: str):
+    """ API for reading a stored request profile, the functions with the most cumulative time first
+        NOTE: only answers requests that send the profiling token
+    """
+    if request_profiler.authorized(request.headers.get(PROFILE_HEADER)) is False:
+        logging.warning(f'Profile {profile_id} was asked for without the profiling token.')
+        return JSONResponse(content = { 'message': 'Profiling is turned off or the profiling token is wrong.' }, status_code = 403)
+    profile_text = await asyncio.to_thread(request_profiler.load, profile_id)
+    if profile_text is None:
+        logging.debug(f'Profile {profile_id} was not found.')
+        return JSONResponse(content = { 'message': f'Profile {profile_id} was not found.' }, status_code = 404)
+    return PlainTextResponse(content = profile_text, status_code = 200)
+
+@app.get("/admin/slow", status_code = 200)
+async def get_slow_requests(request: Request):
+    """ API for getting the latest slow requests with their stage timings
+        NOTE: only answers requests that send the profiling token
+    """
+    if request_profiler.authorized(request.headers.get(PROFILE_HEADER)) is False:
+        logging.warning('The slow requests were asked for without the profiling token.')
+        return JSONResponse(content = { 'message': 'Profiling is turned off or the profiling token is wrong.' }, status_code = 403)
+    return JSONResponse(content = { 'message': { 'data': { 'slow_requests': slow_request_log.entries }}}, status_code = 200)
+
+@app.get("/healthz", status_code = 200)
+async def healthz():
+    """ Liveness probe, answers as soon as the worker accepts requests, even during the warm-up
+    """
+    return JSONResponse(content = { 'message': 'ok' }, status_code = 200)
+
+@app.get("/readyz", status_code = 200)
+async def readyz():
+    """ Readiness probe, answers 200 once the users and rooms are restored and 503 with the warm-up progress before that
+    """
+    readiness = dict(warm_up_status)
+    readiness['users_restored'] = users.num_users if users is not None else EMPTY
+    readiness['rooms_restored'] = room_list.num_rooms_restored if room_list is not None else EMPTY
+    readiness['rooms_to_restore'] = room_list.num_rooms_to_restore if room_list is not None else EMPTY
+    return JSONResponse(content = { 'message': { 'data': readiness }}, status_code = 200 if warm_up_status['ready'] is True else 503)
 
 @app.get("/")
 async def index():
@@ -28,64 +188,244 @@ async def index():
     """
     return { 'message' : { 'from' : 'kevin', 'to' : 'you :)' }}
 
-@app.get("/page/send", status_code=200)
-async def send_form(request: Request):
+@app.get("/page/send", status_code = 200)
+async def send_form(request: Request, room_choice: str = DEFAULT_PUBLIC_ROOM, alias: str = ''):
     """ HTML GET page form sending a message
+        NOTE: room_choice is the room selected in the form, alias fills in the alias of the sender
     """
-    pass
+    room_names = [current_room.room_name for current_room in room_list.get_rooms()]
+    return templates.TemplateResponse(SEND_PAGE_TEMPLATE, { 'request': request, 'room_names': room_names, 'room_choice': room_choice, 'alias': alias })
 
-@app.post("/page/send", status_code=201)
+@app.post("/page/send", status_code = 303)
 async def get_form(request: Request, room_choice: str = Form(...), message: str = Form(...), alias: str = Form(...)):
     """ HTML POST page for sending a message
+        NOTE: the message is sent publicly to room_choice, then the browser is sent to the messages page of that room
     """
-    pass
+    logging.info(f'Attempting to send "{message}" to {room_choice} from {alias} with the page form...')
+    if users.get(alias) is None:
+        logging.debug(f'{alias} was not a valid user alias in the UserList.')
+        return JSONResponse(content = { 'message': f'User {alias} was not found in UserList.'}, status_code = 412)
+    requested_chat_room = room_list.get(room_name = room_choice)
+    if requested_chat_room is None:
+        logging.debug(f'ChatRoom {room_choice} does not exists in the list of rooms.')
+        return JSONResponse(content = { 'message': f'{room_choice} room was not found in room list.'}, status_code = 409)
+    rejection = check_send_limits(chat_room = requested_chat_room, from_alias = alias)
+    if rejection is not None:
+        return rejection
+    try:
+        request_status = requested_chat_room.send_message(message = message,
+                                                        from_alias = alias,
+                                                        mess_props = MessageProperties(room_name = room_choice,
+                                                                                    to_user = room_choice,
+                                                                                    from_user = alias,
+                                                                                    mess_type = PUBLIC_MESSAGE),
+                                                        defer_persist = True)
+        if request_status is True:
+            if requested_chat_room.ephemeral is False:
+                schedule_persist(chat_room = requested_chat_room)
+            logging.debug(f'"{message}" was successfully sent to {room_choice} from {alias}.')
+            return RedirectResponse(url = f'/page/messages?{urlencode({ "room_name": room_choice, "alias": alias })}', status_code = 303)
+        else:
+            logging.warning(f'User {alias} attempted to send a message to a room they are not a member of!')
+            return JSONResponse(content = { 'message': f'{message} was not sent successfully to {room_choice}.'}, status_code = 412)
+    except:
+        logging.error(f'Unknown Error when sending {message} to {room_choice} from the page form.')
+        return JSONResponse(content = { 'message': f'Unknown Error sending {message} to {room_choice}.'}, status_code = 400)
 
-@app.get("/page/messages", status_code=200)
-async def form_messages(request: Request, room_name: str = DEFAULT_PUBLIC_ROOM):
+@app.get("/page/messages", status_code = 200)
+async def form_messages(request: Request, room_name: str = DEFAULT_PUBLIC_ROOM, alias: str = '', messages_to_get: int = GET_ALL_MESSAGES):
     """ HTML GET page for seeing messages
+        NOTE: the page is rendered PAGE_RENDER_BUFFER template pieces at a time into a streamed response, so large rooms start showing right away
+        NOTE: the ETag changes with the version of the room, a request with a matching If-None-Match gets a 304 without rendering the page
+        NOTE: alias has to be a member of the room to see the messages of a private room
     """
-    pass
+    logging.info(f'Attempting to show the messages page of {room_name}...')
+    room_requested = room_list.get(room_name = room_name)
+    if room_requested is None:
+        logging.debug(f'Room {room_name} was not found in the list of rooms.')
+        return JSONResponse(content = { 'message': f'Room {room_name} was not found in the list of rooms.'}, status_code = 409)
+    if room_requested.room_type is ROOM_TYPE_PRIVATE and (users.get(alias) is None or not room_requested.is_member(alias)):
+        logging.warning(f'User {alias} does not exist or they are not a member of the room.')
+        return JSONResponse(content = { 'message': f'User {alias} does not exist or they are not a member of the room.'}, status_code = 400)
+    try:
+        # the version is read before the messages, a change in between gives the next request a new ETag instead of keeping a stale page
+        etag = page_etag(room_name, room_requested.version, alias, messages_to_get)
+        page_headers = { 'ETag': etag, 'Cache-Control': 'no-cache' }
+        if etag_matches(request.headers.get('if-none-match'), etag):
+            logging.debug(f'The messages page of {room_name} did not change since {etag}.')
+            return Response(status_code = 304, headers = page_headers)
+        room_messages = room_requested.get_messages(user_alias = alias, num_messages = messages_to_get)[1]
+        page_stream = templates.get_template(MESSAGES_PAGE_TEMPLATE).stream({ 'room_name': room_name,
+                                                                             'alias': alias,
+                                                                             'messages_to_get': messages_to_get,
+                                                                             'room_messages': room_messages })
+        page_stream.enable_buffering(PAGE_RENDER_BUFFER)
+        logging.debug(f'Streaming the messages page of {room_name} with {len(room_messages)} messages.')
+        return StreamingResponse(page_stream, status_code = 200, media_type = MEDIA_TYPE_HTML, headers = page_headers)
+    except:
+        logging.error(f'Unknown Error showing the messages page of {room_name}.')
+        return JSONResponse(content = { 'message': f'Unknown Error showing the messages page of {room_name}.'}, status_code = 400)
 
-@app.post("/page/messages", status_code=201)
-async def form_messages(request: Request, room_name: str = Form(...)):
+@app.post("/page/messages", status_code = 303)
+async def choose_messages(request: Request, room_name: str = Form(...), alias: str = Form(''), messages_to_get: int = Form(GET_ALL_MESSAGES)):
     """ HTML POST page for seeing messages in a different room or different quantities
+        NOTE: the browser is sent to the GET page, so the page can be reloaded and revalidated with its ETag
     """
-    pass
+    page_query = urlencode({ 'room_name': room_name, 'alias': alias, 'messages_to_get': messages_to_get })
+    return RedirectResponse(url = f'/page/messages?{page_query}', status_code = 303)
 
 @app.get("/messages/", status_code = 200)
-async def get_messages(alias: str, room_name: str, messages_to_get: int = GET_ALL_MESSAGES):
+async def get_messages(request: Request, alias: str, room_name: str, messages_to_get: int = GET_ALL_MESSAGES, since: datetime = None, until: datetime = None):
     """ API for getting messages from a room
         NOTE: this user must be a valid member of the room to access the messages to the room.
+        NOTE: the messages are sent as MessagePack instead of JSON when the Accept header asks for application/msgpack
+        NOTE: since and until (ISO 8601 times) only get the messages the room received from since to until
     """
     logging.info(f'Attempting to get messages from {room_name} room...')
-    if room_name not in room_list.get(room_name = room_name):
+    with timed_stage('lookup'):
+        room_requested = room_list.get(room_name = room_name)
+    if room_requested is None:
         logging.debug(f'Room {room_name} was not found in the list of rooms.')
         return JSONResponse(content = { 'message': f'Room {room_name} was not found in the list of rooms.'}, status_code = 400)
+    with timed_stage('auth'):
+        if users.get(alias) is None or (not room_requested.is_member(alias) and room_requested.room_type is ROOM_TYPE_PRIVATE):
+            logging.warning(f'User {alias} does not exist or they are not a member of the room.')
+            return JSONResponse(content = { 'message': f'User {alias} does not exist or they are not a member of the room.'}, status_code = 400)
+    try:
+        messages_in_room = room_requested.get_messages(user_alias = alias, num_messages = messages_to_get, since = since, until = until)
+        with timed_stage('serialization'):
+            if messages_in_room[2] is EMPTY:
+                logging.debug(f'No messages found in room {room_name}.')
+                return negotiated_response(request = request, content = { 'message': 
+                                            { 'data': {
+                                                'message_texts': messages_in_room[0],
+                                                'message_objects': [current_message.to_dict() for current_message in messages_in_room[1]],
+                                                'num_messages': messages_in_room[2]
+                                            }}})
+            else:
+                logging.debug(f'{messages_in_room[2]} messages were found in {room_name} for user {alias}.')
+                return negotiated_response(request = request, content = { 'message': 
+                                            { 'data': {
+                                                'message_texts': messages_in_room[0],
+                                                'message_objects': [current_message.to_dict() for current_message in messages_in_room[1]],
+                                                'num_messages': messages_in_room[2]
+                                            }}})
+    except:
+        logging.error(f'Unknown Error obtaining the messages in room {room_name} for user {alias}.')
+        return JSONResponse(content = { 'message': f'Unknown Error obtaining the messages in room {room_name} for user {alias}.' }, status_code = 400)
+
+@app.post("/read", status_code = 201)
+async def mark_room_read(alias: str, room_name: str, sequence_num: int = MARK_ALL_READ):
+    """ API for marking the messages of a room as read by a user, up to sequence_num
+        NOTE: without a sequence_num, everything sent to the room so far is marked as read
+    """
+    logging.info(f'Attempting to mark {room_name} as read for {alias}...')
     room_requested = room_list.get(room_name = room_name)
-    if alias not in users.get_all_users_aliases() or (alias not in room_requested.member_list and room_requested.room_type is ROOM_TYPE_PRIVATE):
+    if room_requested is None:
+        logging.debug(f'Room {room_name} was not found in the list of rooms.')
+        return JSONResponse(content = { 'message': f'Room {room_name} was not found in the list of rooms.'}, status_code = 400)
+    if users.get(alias) is None or (not room_requested.is_member(alias) and room_requested.room_type is ROOM_TYPE_PRIVATE):
         logging.warning(f'User {alias} does not exist or they are not a member of the room.')
         return JSONResponse(content = { 'message': f'User {alias} does not exist or they are not a member of the room.'}, status_code = 400)
     try:
-        messages_in_room = room_requested.get_messages(user_alias = alias, num_messages = messages_to_get)
-        if messages_in_room[2] is EMPTY:
-            logging.debug(f'No messages found in room {room_name}.')
-            return JSONResponse(content = { 'message': 
-                                        { 'data': {
-                                            'message_texts': messages_in_room[0],
-                                            'message_objects': messages_in_room[1],
-                                            'num_messages': messages_in_room[2]
-                                        }}})
-        else:
-            logging.debug(f'{messages_in_room[2]} messages were found in {room_name} for user {alias}.')
-            return JSONResponse(content = { 'message': 
-                                        { 'data': {
-                                            'message_texts': messages_in_room[0],
-                                            'message_objects': messages_in_room[1],
-                                            'num_messages': messages_in_room[2]
-                                        }}})
+        if sequence_num == MARK_ALL_READ or sequence_num > room_requested.last_sequence_num:
+            sequence_num = room_requested.last_sequence_num
+        last_read = await asyncio.to_thread(mark_read_up_to, alias = alias, room_name = room_name, sequence_num = sequence_num)
+        logging.debug(f'{room_name} was marked as read up to {sequence_num} for {alias}.')
+        return JSONResponse(content = { 'message': { 'data': { 'room_name': room_name,
+                                                                'last_read': last_read }}}, status_code = 201)
     except:
-        logging.error(f'Unknown Error obtaining the messages in room {room_name} for user {alias}.')
-        return JSONResponse(content = { 'message': f'Unknown Error obtaining the messages in room {room_name} for user {alias}.' }, status_code = 400)
+        logging.error(f'Unknown Error marking {room_name} as read for {alias}.')
+        return JSONResponse(content = { 'message': f'Unknown Error marking {room_name} as read for {alias}.' }, status_code = 400)
+
+@app.get("/unread/", status_code = 200)
+async def get_unread_counts(alias: str):
+    """ API for getting the number of unread messages in every room the user is a member of
+        NOTE: this only compares the read cursor of each room with the last sequence number of the room, no messages are read
+    """
+    logging.info(f'Attempting to get the unread counts for {alias}...')
+    if users.get(alias) is None:
+        logging.debug(f'{alias} was not a valid user alias in the UserList.')
+        return JSONResponse(content = { 'message': 'Users not found in UserList.' }, status_code = 412)
+    try:
+        unread_counts = await asyncio.to_thread(unread_counts_of, alias = alias)
+        return JSONResponse(content = { 'message': { 'data': { 'unread': unread_counts }}}, status_code = 200)
+    except:
+        logging.error(f'Unknown Error obtaining the unread counts for {alias}.')
+        return JSONResponse(content = { 'message': f'Unknown Error obtaining the unread counts for {alias}.' }, status_code = 400)
+
+def mark_read_up_to(alias: str, room_name: str, sequence_num: int) -> int:
+    """ Move the read cursor of alias in room_name forward to sequence_num and return where it is now
+        NOTE: the cursors of alias may be loaded from storage, so this runs in a worker thread
+    """
+    read_cursors.mark_read(alias = alias, room_name = room_name, sequence_num = sequence_num)
+    return read_cursors.get(alias = alias, room_name = room_name)
+
+def unread_counts_of(alias: str) -> dict:
+    """ Count the unread messages of alias in every room they are a member of
+        NOTE: the cursors of alias may be loaded from storage, so this runs in a worker thread
+    """
+    return { current_room.room_name: read_cursors.unread_count(alias = alias,
+                                                              room_name = current_room.room_name,
+                                                              last_sequence_num = current_room.last_sequence_num)
+                for current_room in room_list.find_by_member(member_alias = alias) }
+
+@app.get("/inbox/{alias}", status_code = 200)
+async def get_inbox(alias: str, before: int = None, page_size: int = INBOX_PAGE_SIZE):
+    """ API for getting the private messages sent to a user, newest first, a page at a time
+        NOTE: next_before in the response is passed back as before to get the next (older) page, it is None on the last page
+    """
+    logging.info(f'Attempting to get the inbox of {alias}...')
+    if users.get(alias) is None:
+        logging.debug(f'{alias} was not a valid user alias in the UserList.')
+        return JSONResponse(content = { 'message': 'Users not found in UserList.' }, status_code = 412)
+    if page_size < 1:
+        logging.debug(f'{page_size} is not a valid inbox page size.')
+        return JSONResponse(content = { 'message': f'{page_size} is not a valid page size.' }, status_code = 400)
+    try:
+        with timed_stage('lookup'):
+            inbox_messages, next_before = inbox_index.get_page(to_alias = alias, before = before, page_size = page_size)
+        logging.debug(f'{len(inbox_messages)} inbox messages were found for {alias}.')
+        with timed_stage('serialization'):
+            return ORJSONResponse(content = { 'message':
+                                            { 'data': {
+                                                'message_objects': [current_message.to_dict() for current_message in inbox_messages],
+                                                'num_messages': len(inbox_messages),
+                                                'next_before': next_before
+                                            }}})
+    except:
+        logging.error(f'Unknown Error obtaining the inbox of {alias}.')
+        return JSONResponse(content = { 'message': f'Unknown Error obtaining the inbox of {alias}.' }, status_code = 400)
+
+@app.get("/feed/{alias}", status_code = 200)
+async def get_feed(alias: str, before: str = None, page_size: int = FEED_PAGE_SIZE):
+    """ API for getting the newest messages across every room a user is a member of, newest first, a page at a time
+        NOTE: next_before in the response is passed back as before to get the next (older) page, it is None on the last page
+    """
+    logging.info(f'Attempting to get the feed of {alias}...')
+    if users.get(alias) is None:
+        logging.debug(f'{alias} was not a valid user alias in the UserList.')
+        return JSONResponse(content = { 'message': 'Users not found in UserList.' }, status_code = 412)
+    if page_size < 1:
+        logging.debug(f'{page_size} is not a valid feed page size.')
+        return JSONResponse(content = { 'message': f'{page_size} is not a valid page size.' }, status_code = 400)
+    try:
+        with timed_stage('lookup'):
+            feed_messages, next_before = room_list.get_feed(member_alias = alias, before = before, page_size = page_size)
+        logging.debug(f'{len(feed_messages)} feed messages were found for {alias}.')
+        with timed_stage('serialization'):
+            return ORJSONResponse(content = { 'message':
+                                            { 'data': {
+                                                'message_objects': [current_message.to_dict() for current_message in feed_messages],
+                                                'num_messages': len(feed_messages),
+                                                'next_before': next_before
+                                            }}})
+    except ValueError:
+        logging.warning(f'{before} is not a valid feed cursor.')
+        return JSONResponse(content = { 'message': f'{before} is not a valid feed cursor.' }, status_code = 400)
+    except:
+        logging.error(f'Unknown Error obtaining the feed of {alias}.')
+        return JSONResponse(content = { 'message': f'Unknown Error obtaining the feed of {alias}.' }, status_code = 400)
 
 @app.get("/users/", status_code = 200)
 async def get_users():
@@ -127,41 +467,167 @@ async def create_room(room_name: str, owner_alias: str, room_type: int = ROOM_TY
         NOTE: there are edge cases to make sure no duplicates of rooms
     """
     logging.info(f'{owner_alias} is attempting to create a room with the name {room_name} to the room list...')
-    if owner_alias not in users.get_all_users_aliases():
+    if users.get(owner_alias) is None:
         logging.debug(f'{owner_alias} was not a valid user alias in the UserList.')
         return JSONResponse(content = { 'message': 'Users not found in UserList.' }, status_code = 412)
+    if room_name in importing_rooms:
+        logging.debug(f'"{room_name}" room is being imported.')
+        return JSONResponse(content = { 'message': f'"{room_name}" room already exists in the list of rooms.' }, status_code = 409)
     try:
         new_chat_room = room_list.create(room_name = room_name, owner_alias = owner_alias, room_type = room_type)
-        if new_chat_room is None and room_list.add(new_room = new_chat_room) is None:
+        if new_chat_room is None:
             logging.debug(f'"{room_name}" room already exists in the list of rooms.')
             return JSONResponse(content = { 'message': f'"{room_name}" room already exists in the list of rooms.' }, status_code = 409)
         else:
+            new_chat_room.persist()
+            room_list.add(new_room = new_chat_room)
             return JSONResponse(content = { 'message': f'"{room_name}" room has been successfully added to the list of rooms.' }, status_code = 201)
     except:
         logging.error(f'Unknown Error creating a room with name {room_name} by {owner_alias}.')
         return JSONResponse(content = { 'message': f'Unknown Error creating a room with name {room_name} by {owner_alias}.'}, status_code = 400)
 
+@app.post("/room/member", status_code = 201)
+async def add_room_member(room_name: str, member_alias: str):
+    """ API for adding a member to a room
+        NOTE: only the member list of the room and of its catalog entry are updated, the rest of the room metadata is not rewritten
+    """
+    logging.info(f'Attempting to add {member_alias} to the members of {room_name}...')
+    if users.get(member_alias) is None:
+        logging.debug(f'{member_alias} was not a valid user alias in the UserList.')
+        return JSONResponse(content = { 'message': 'Users not found in UserList.' }, status_code = 412)
+    requested_chat_room = room_list.get(room_name = room_name)
+    if requested_chat_room is None:
+        logging.debug(f'ChatRoom {room_name} does not exists in the list of rooms.')
+        return JSONResponse(content = { 'message': f'{room_name} room was not found in room list.'}, status_code = 409)
+    try:
+        if await asyncio.to_thread(room_list.add_member, room_name = room_name, member_alias = member_alias) is True:
+            logging.debug(f'{member_alias} was added to the members of {room_name}.')
+            return JSONResponse(content = { 'message': f'{member_alias} was successfully added to {room_name}.' }, status_code = 201)
+        elif requested_chat_room.is_member(member_alias) is False:
+            logging.warning(f'The catalog entry of {room_name} could not be updated, {member_alias} was not added.')
+            return JSONResponse(content = { 'message': f'{member_alias} could not be added to {room_name}, try again.' }, status_code = 409)
+        else:
+            logging.debug(f'{member_alias} is already a member of {room_name}.')
+            return JSONResponse(content = { 'message': f'{member_alias} is already a member of {room_name}.' }, status_code = 403)
+    except StorageUnavailable:
+        logging.warning(f'Storage is unavailable, the members of {room_name} could not be changed.')
+        return JSONResponse(content = { 'message': f'Storage is unavailable, the members of {room_name} can not be changed now.'}, status_code = 503,
+                            headers = { 'Retry-After': str(STORAGE_RESET_SECONDS) })
+    except:
+        logging.error(f'Unknown Error adding {member_alias} to {room_name}.')
+        return JSONResponse(content = { 'message': f'Unknown Error adding {member_alias} to {room_name}.' }, status_code = 400)
+
+@app.delete("/room/member", status_code = 200)
+async def remove_room_member(room_name: str, member_alias: str):
+    """ API for removing a member from a room
+        NOTE: the owner of a room can not be removed from it
+    """
+    logging.info(f'Attempting to remove {member_alias} from the members of {room_name}...')
+    requested_chat_room = room_list.get(room_name = room_name)
+    if requested_chat_room is None:
+        logging.debug(f'ChatRoom {room_name} does not exists in the list of rooms.')
+        return JSONResponse(content = { 'message': f'{room_name} room was not found in room list.'}, status_code = 409)
+    try:
+        if await asyncio.to_thread(room_list.remove_member, room_name = room_name, member_alias = member_alias) is True:
+            logging.debug(f'{member_alias} was removed from the members of {room_name}.')
+            return JSONResponse(content = { 'message': f'{member_alias} was successfully removed from {room_name}.' }, status_code = 200)
+        elif requested_chat_room.is_member(member_alias) is True and member_alias != requested_chat_room.owner_alias:
+            logging.warning(f'The catalog entry of {room_name} could not be updated, {member_alias} was not removed.')
+            return JSONResponse(content = { 'message': f'{member_alias} could not be removed from {room_name}, try again.' }, status_code = 409)
+        else:
+            logging.debug(f'{member_alias} is not a removable member of {room_name}.')
+            return JSONResponse(content = { 'message': f'{member_alias} is not a removable member of {room_name}.' }, status_code = 403)
+    except StorageUnavailable:
+        logging.warning(f'Storage is unavailable, the members of {room_name} could not be changed.')
+        return JSONResponse(content = { 'message': f'Storage is unavailable, the members of {room_name} can not be changed now.'}, status_code = 503,
+                            headers = { 'Retry-After': str(STORAGE_RESET_SECONDS) })
+    except:
+        logging.error(f'Unknown Error removing {member_alias} from {room_name}.')
+        return JSONResponse(content = { 'message': f'Unknown Error removing {member_alias} from {room_name}.' }, status_code = 400)
+
+@app.post("/room/retention", status_code = 201)
+async def set_room_retention(room_name: str, max_messages: int = None, max_age_seconds: int = None):
+    """ API for setting how many messages, or how old of messages, a room keeps
+        NOTE: leaving both limits out keeps every message, expired messages are moved to the archive in the background
+    """
+    logging.info(f'Attempting to set the retention of {room_name} to {max_messages} messages and {max_age_seconds} seconds...')
+    requested_chat_room = room_list.get(room_name = room_name)
+    if requested_chat_room is None:
+        logging.debug(f'ChatRoom {room_name} does not exists in the list of rooms.')
+        return JSONResponse(content = { 'message': f'{room_name} room was not found in room list.'}, status_code = 409)
+    try:
+        await asyncio.to_thread(requested_chat_room.set_retention, max_messages = max_messages, max_age_seconds = max_age_seconds)
+        return JSONResponse(content = { 'message': f'Retention of {room_name} was successfully updated.' }, status_code = 201)
+    except StorageUnavailable:
+        logging.warning(f'Storage is unavailable, the retention of {room_name} could not be changed.')
+        return JSONResponse(content = { 'message': f'Storage is unavailable, the retention of {room_name} can not be changed now.'}, status_code = 503,
+                            headers = { 'Retry-After': str(STORAGE_RESET_SECONDS) })
+    except:
+        logging.error(f'Unknown Error setting the retention of {room_name}.')
+        return JSONResponse(content = { 'message': f'Unknown Error setting the retention of {room_name}.' }, status_code = 400)
+
+@app.post("/room/sampling", status_code = 201)
+async def set_room_sampling(room_name: str, sample_every: int = None):
+    """ API for setting one in how many messages of an ephemeral room are kept in the archive once the room drops them
+        NOTE: leaving sample_every out turns sampling off
+    """
+    logging.info(f'Attempting to set the archive sampling of {room_name} to one in {sample_every} messages...')
+    requested_chat_room = room_list.get(room_name = room_name)
+    if requested_chat_room is None:
+        logging.debug(f'ChatRoom {room_name} does not exists in the list of rooms.')
+        return JSONResponse(content = { 'message': f'{room_name} room was not found in room list.'}, status_code = 409)
+    if requested_chat_room.ephemeral is False or (sample_every is not None and sample_every < 1):
+        logging.debug(f'Archive sampling of {room_name} can not be set to {sample_every}.')
+        return JSONResponse(content = { 'message': f'{room_name} is not an ephemeral room or {sample_every} is not a valid sampling.'}, status_code = 400)
+    try:
+        await asyncio.to_thread(requested_chat_room.set_archive_sampling, sample_every = sample_every)
+        return JSONResponse(content = { 'message': f'Archive sampling of {room_name} was successfully updated.' }, status_code = 201)
+    except StorageUnavailable:
+        logging.warning(f'Storage is unavailable, the archive sampling of {room_name} could not be changed.')
+        return JSONResponse(content = { 'message': f'Storage is unavailable, the archive sampling of {room_name} can not be changed now.'}, status_code = 503,
+                            headers = { 'Retry-After': str(STORAGE_RESET_SECONDS) })
+    except:
+        logging.error(f'Unknown Error setting the archive sampling of {room_name}.')
+        return JSONResponse(content = { 'message': f'Unknown Error setting the archive sampling of {room_name}.' }, status_code = 400)
+
 @app.post("/message/", status_code = 201)
-async def send_message(room_name: str, message: str, from_alias: str, to_alias: str):
+async def send_message(room_name: str, message: str, from_alias: str, to_alias: str, client_message_id: str = None):
     """ API for sending a message, for a particular room
         TODO: this may want to access the send_message feature from a chatroom
+        NOTE: a retried send with the same client_message_id gets the answer of the first send (200) and is not stored again
+        NOTE: retries are answered before the rate limits so they do not use up the tokens of the sender
     """
+    global duplicate_sends
     logging.info(f'Attempting to send "{message}" to {to_alias} from {from_alias}...')
-    if from_alias not in users.get_all_users_aliases() and to_alias not in users.get_all_users_aliases():
-        logging.debug(f'{from_alias} or {to_alias} was not a valid user alias in the UserList.')
-        return JSONResponse(content = { 'message': 'Users not found in UserList.'}, status_code = 412)
-    if room_list.get(room_name = room_name) is None:
+    with timed_stage('auth'):
+        if users.get(from_alias) is None and users.get(to_alias) is None:
+            logging.debug(f'{from_alias} or {to_alias} was not a valid user alias in the UserList.')
+            return JSONResponse(content = { 'message': 'Users not found in UserList.'}, status_code = 412)
+    with timed_stage('lookup'):
+        requested_chat_room = room_list.get(room_name = room_name)
+    if requested_chat_room is None:
         logging.debug(f'ChatRoom {room_name} does not exists in the list of rooms.')
         return JSONResponse(content = { 'message': f'{room_name} room was not found in room list.'}, status_code = 409)
-    requested_chat_room = room_list.get(room_name = room_name)
+    sent_message = requested_chat_room.find_sent_message(client_message_id)
+    if sent_message is not None:
+        duplicate_sends += 1
+        logging.debug(f'Message {client_message_id} was already sent to {room_name}.')
+        return JSONResponse(content = { 'message': f'{sent_message.message} was successfully sent to {sent_message.message_properties.to_user}.'}, status_code = 200)
+    rejection = check_send_limits(chat_room = requested_chat_room, from_alias = from_alias)
+    if rejection is not None:
+        return rejection
     try:
         request_status = requested_chat_room.send_message(message = message, 
                                                         from_alias = from_alias, 
                                                         mess_props = MessageProperties(room_name = room_name,
                                                                                     to_user = to_alias,
                                                                                     from_user = from_alias,
-                                                                                    mess_type = PRIVATE_MESSAGE))
+                                                                                    mess_type = PRIVATE_MESSAGE,
+                                                                                    client_message_id = client_message_id),
+                                                        defer_persist = True)
         if request_status is True:
+            if requested_chat_room.ephemeral is False:
+                schedule_persist(chat_room = requested_chat_room)
             logging.debug(f'"{message}" was successfully sent to {to_alias} from {from_alias}.')
             return JSONResponse(content = { 'message': f'{message} was successfully sent to {to_alias}.'}, status_code = 201)
         else:
@@ -171,11 +637,366 @@ async def send_message(room_name: str, message: str, from_alias: str, to_alias:
         logging.error(f'Unknown Error when sending {message} to {to_alias}.')
         return JSONResponse(content = { 'message': f'Unknown Error sending {message} to {to_alias}.'}, status_code = 400)
 
+@app.post("/messages/", status_code = 201)
+async def send_messages(request: Request, room_name: str):
+    """ API for sending many messages to a room at once, from a JSON or MessagePack body (picked by its Content-Type)
+        NOTE: the body is a list of messages to send (see wire_format), every one of them is checked like a send to /message/
+        NOTE: the answer has the status of each message in order: 201 sent, 200 already sent, 412 not allowed, 429 rate limited
+    """
+    global duplicate_sends
+    logging.info(f'Attempting to send a batch of messages to {room_name}...')
+    with timed_stage('lookup'):
+        requested_chat_room = room_list.get(room_name = room_name)
+    if requested_chat_room is None:
+        logging.debug(f'ChatRoom {room_name} does not exists in the list of rooms.')
+        return JSONResponse(content = { 'message': f'{room_name} room was not found in room list.'}, status_code = 409)
+    try:
+        with timed_stage('serialization'):
+            sends = read_sends(decode_body(await request.body(), request.headers.get('content-type', MEDIA_TYPE_JSON)))
+    except ValueError:
+        logging.debug(f'The batch of messages sent to {room_name} does not follow the schema.')
+        return JSONResponse(content = { 'message': 'The body is not a list of messages to send.'}, status_code = 400)
+    try:
+        send_statuses = list()
+        for current_send in sends:
+            if users.get(current_send['from_alias']) is None and users.get(current_send['to_alias']) is None:
+                send_statuses.append(412)
+                continue
+            if requested_chat_room.find_sent_message(current_send['client_message_id']) is not None:
+                duplicate_sends += 1
+                send_statuses.append(200)
+                continue
+            rejection = check_send_limits(chat_room = requested_chat_room, from_alias = current_send['from_alias'])
+            if rejection is not None:
+                send_statuses.append(rejection.status_code)
+                continue
+            sent = requested_chat_room.send_message(message = current_send['message'],
+                                                    from_alias = current_send['from_alias'],
+                                                    mess_props = MessageProperties(room_name = room_name,
+                                                                                to_user = current_send['to_alias'],
+                                                                                from_user = current_send['from_alias'],
+                                                                                mess_type = PRIVATE_MESSAGE,
+                                                                                client_message_id = current_send['client_message_id']),
+                                                    defer_persist = True)
+            send_statuses.append(201 if sent is True else 412)
+        if requested_chat_room.ephemeral is False and requested_chat_room.num_pending > EMPTY:
+            schedule_persist(chat_room = requested_chat_room)
+        logging.debug(f'{send_statuses.count(201)} of {len(sends)} messages were sent to {room_name}.')
+        with timed_stage('serialization'):
+            return negotiated_response(request = request, content = { 'message': { 'data': { 'statuses': send_statuses,
+                                                                                              'num_sent': send_statuses.count(201) }}}, status_code = 201)
+    except:
+        logging.error(f'Unknown Error sending a batch of messages to {room_name}.')
+        return JSONResponse(content = { 'message': f'Unknown Error sending a batch of messages to {room_name}.'}, status_code = 400)
+
+@app.get("/message/{room_name}/{sequence_num}", status_code = 200)
+async def get_message(request: Request, room_name: str, sequence_num: int, alias: str):
+    """ API for getting one message of a room by its sequence number
+        NOTE: a deleted message is returned as a tombstone (no text, deleted set to True)
+        NOTE: the message is sent as MessagePack instead of JSON when the Accept header asks for application/msgpack
+    """
+    logging.info(f'Attempting to get message {sequence_num} of {room_name} for {alias}...')
+    with timed_stage('lookup'):
+        requested_chat_room = room_list.get(room_name = room_name)
+    if requested_chat_room is None:
+        logging.debug(f'ChatRoom {room_name} does not exists in the list of rooms.')
+        return JSONResponse(content = { 'message': f'{room_name} room was not found in room list.'}, status_code = 409)
+    with timed_stage('auth'):
+        if users.get(alias) is None or (not requested_chat_room.is_member(alias) and requested_chat_room.room_type is ROOM_TYPE_PRIVATE):
+            logging.warning(f'User {alias} does not exist or they are not a member of the room.')
+            return JSONResponse(content = { 'message': f'User {alias} does not exist or they are not a member of the room.'}, status_code = 400)
+    found_message = requested_chat_room.get_message(sequence_num)
+    if found_message is None:
+        logging.debug(f'Message {sequence_num} was not found in {room_name}.')
+        return JSONResponse(content = { 'message': f'Message {sequence_num} was not found in {room_name}.'}, status_code = 404)
+    with timed_stage('serialization'):
+        return negotiated_response(request = request, content = { 'message': { 'data': found_message.to_dict() }}, status_code = 200)
+
+@app.put("/message/{room_name}/{sequence_num}", status_code = 200)
+async def edit_message(room_name: str, sequence_num: int, alias: str, message: str):
+    """ API for replacing the text of a message, only the user who sent it can edit it
+    """
+    logging.info(f'Attempting to edit message {sequence_num} of {room_name} for {alias}...')
+    requested_chat_room = room_list.get(room_name = room_name)
+    if requested_chat_room is None:
+        logging.debug(f'ChatRoom {room_name} does not exists in the list of rooms.')
+        return JSONResponse(content = { 'message': f'{room_name} room was not found in room list.'}, status_code = 409)
+    try:
+        if await asyncio.to_thread(requested_chat_room.edit_message, sequence_num, message, alias) is True:
+            logging.debug(f'Message {sequence_num} of {room_name} was edited.')
+            return JSONResponse(content = { 'message': f'Message {sequence_num} was successfully edited.' }, status_code = 200)
+        else:
+            logging.debug(f'{alias} can not edit message {sequence_num} of {room_name}.')
+            return JSONResponse(content = { 'message': f'Message {sequence_num} was not found or was not sent by {alias}.' }, status_code = 403)
+    except StorageUnavailable:
+        logging.warning(f'Storage is unavailable, message {sequence_num} of {room_name} could not be changed.')
+        return JSONResponse(content = { 'message': f'Storage is unavailable, message {sequence_num} of {room_name} can not be changed now.'}, status_code = 503,
+                            headers = { 'Retry-After': str(STORAGE_RESET_SECONDS) })
+    except:
+        logging.error(f'Unknown Error editing message {sequence_num} of {room_name}.')
+        return JSONResponse(content = { 'message': f'Unknown Error editing message {sequence_num} of {room_name}.' }, status_code = 400)
+
+@app.delete("/message/{room_name}/{sequence_num}", status_code = 200)
+async def delete_message(room_name: str, sequence_num: int, alias: str):
+    """ API for deleting a message, the user who sent it or the owner of the room can delete it
+        NOTE: the message stays in the room as a tombstone so the sequence numbers around it do not change
+    """
+    logging.info(f'Attempting to delete message {sequence_num} of {room_name} for {alias}...')
+    requested_chat_room = room_list.get(room_name = room_name)
+    if requested_chat_room is None:
+        logging.debug(f'ChatRoom {room_name} does not exists in the list of rooms.')
+        return JSONResponse(content = { 'message': f'{room_name} room was not found in room list.'}, status_code = 409)
+    try:
+        if await asyncio.to_thread(requested_chat_room.delete_message, sequence_num, alias) is True:
+            logging.debug(f'Message {sequence_num} of {room_name} was deleted.')
+            return JSONResponse(content = { 'message': f'Message {sequence_num} was successfully deleted.' }, status_code = 200)
+        else:
+            logging.debug(f'{alias} can not delete message {sequence_num} of {room_name}.')
+            return JSONResponse(content = { 'message': f'Message {sequence_num} was not found or can not be deleted by {alias}.' }, status_code = 403)
+    except StorageUnavailable:
+        logging.warning(f'Storage is unavailable, message {sequence_num} of {room_name} could not be changed.')
+        return JSONResponse(content = { 'message': f'Storage is unavailable, message {sequence_num} of {room_name} can not be changed now.'}, status_code = 503,
+                            headers = { 'Retry-After': str(STORAGE_RESET_SECONDS) })
+    except:
+        logging.error(f'Unknown Error deleting message {sequence_num} of {room_name}.')
+        return JSONResponse(content = { 'message': f'Unknown Error deleting message {sequence_num} of {room_name}.' }, status_code = 400)
+
+@app.get("/rooms/{room_name}/stats", status_code = 200)
+async def get_room_stats(room_name: str, alias: str):
+    """ API for getting the activity of a room: messages per minute and per hour, per sender, and the last activity time
+        NOTE: the counters are kept up to date as messages are stored, no message is read to answer
+    """
+    logging.info(f'Attempting to get the activity of {room_name} for {alias}...')
+    requested_chat_room = room_list.get(room_name = room_name)
+    if requested_chat_room is None:
+        logging.debug(f'ChatRoom {room_name} does not exists in the list of rooms.')
+        return JSONResponse(content = { 'message': f'{room_name} room was not found in room list.'}, status_code = 409)
+    if users.get(alias) is None or (not requested_chat_room.is_member(alias) and requested_chat_room.room_type is ROOM_TYPE_PRIVATE):
+        logging.warning(f'User {alias} does not exist or they are not a member of the room.')
+        return JSONResponse(content = { 'message': f'User {alias} does not exist or they are not a member of the room.'}, status_code = 400)
+    try:
+        return ORJSONResponse(content = { 'message': { 'data': requested_chat_room.activity_stats() }}, status_code = 200)
+    except:
+        logging.error(f'Unknown Error obtaining the activity of {room_name}.')
+        return JSONResponse(content = { 'message': f'Unknown Error obtaining the activity of {room_name}.'}, status_code = 400)
+
+@app.get("/rooms/{room_name}/export", status_code = 200)
+async def export_room_history(room_name: str, alias: str):
+    """ API for exporting the metadata and stored messages of a room as NDJSON (see room_transfer), streamed from the storage cursor
+        NOTE: the pending messages of the room are persisted first so the export has every message sent so far
+        NOTE: only one chunk of the export is in memory at a time, however large the room is
+    """
+    logging.info(f'Attempting to export {room_name} for {alias}...')
+    requested_chat_room = room_list.get(room_name = room_name)
+    if requested_chat_room is None:
+        logging.debug(f'ChatRoom {room_name} does not exists in the list of rooms.')
+        return JSONResponse(content = { 'message': f'{room_name} room was not found in room list.'}, status_code = 409)
+    if users.get(alias) is None or (not requested_chat_room.is_member(alias) and requested_chat_room.room_type is ROOM_TYPE_PRIVATE):
+        logging.warning(f'User {alias} does not exist or they are not a member of the room.')
+        return JSONResponse(content = { 'message': f'User {alias} does not exist or they are not a member of the room.'}, status_code = 400)
+    try:
+        if requested_chat_room.num_pending > EMPTY and await asyncio.to_thread(requested_chat_room.persist) is False:
+            logging.warning(f'{room_name} could not be persisted before its export.')
+            return JSONResponse(content = { 'message': f'Storage is unavailable, {room_name} can not be exported now.'}, status_code = 503,
+                                headers = { 'Retry-After': str(STORAGE_RESET_SECONDS) })
+        return StreamingResponse(content = export_room(room_name = room_name), media_type = MEDIA_TYPE_NDJSON,
+                                headers = { 'Content-Disposition': f'attachment; filename="{room_name}.ndjson"' })
+    except:
+        logging.error(f'Unknown Error exporting {room_name}.')
+        return JSONResponse(content = { 'message': f'Unknown Error exporting {room_name}.'}, status_code = 400)
+
+@app.post("/rooms/{room_name}/import", status_code = 201)
+async def import_room_history(request: Request, room_name: str):
+    """ API for importing an exported room (an NDJSON body, see room_transfer) as a new room room_name
+        NOTE: the body is read a chunk at a time and the messages are inserted in batches, keeping their sequence numbers
+        NOTE: the room is added to the room list once every message is imported, a failed import is dropped from storage
+        NOTE: room_name is reserved while it is imported, another import or a new room with that name gets a 409
+    """
+    logging.info(f'Attempting to import {room_name}...')
+    if room_name in importing_rooms or room_list.get(room_name = room_name) is not None:
+        logging.debug(f'"{room_name}" room already exists in the list of rooms or is being imported.')
+        return JSONResponse(content = { 'message': f'"{room_name}" room already exists in the list of rooms.' }, status_code = 409)
+    importing_rooms.add(room_name)
+    try:
+        return await import_reserved_room(request = request, room_name = room_name)
+    finally:
+        importing_rooms.discard(room_name)
+
+async def import_reserved_room(request: Request, room_name: str):
+    """ Import the body of request into room_name once the name is reserved, and answer the import request
+        NOTE: anything that fails before the room is in the room list drops what was imported, so the import can simply be sent again
+    """
+    if await asyncio.to_thread(get_default_backend().room_exists, room_name) is True:
+        logging.debug(f'"{room_name}" room already exists in storage.')
+        return JSONResponse(content = { 'message': f'"{room_name}" room already exists in the list of rooms.' }, status_code = 409)
+    room_importer = RoomImporter(room_name = room_name)
+    try:
+        async for current_chunk in request.stream():
+            await asyncio.to_thread(room_importer.feed, current_chunk)
+        await asyncio.to_thread(room_importer.finish)
+        imported_room = await asyncio.to_thread(ChatRoom, room_name)
+    except ValueError:
+        logging.warning(f'The import of {room_name} stopped at a line that is not part of an exported room.')
+        await drop_failed_import(room_importer = room_importer, room_name = room_name)
+        return JSONResponse(content = { 'message': f'The body is not an exported room, nothing was imported into {room_name}.'}, status_code = 400)
+    except:
+        logging.error(f'Unknown Error importing {room_name}.')
+        await drop_failed_import(room_importer = room_importer, room_name = room_name)
+        return JSONResponse(content = { 'message': f'Unknown Error importing {room_name}, nothing was imported.'}, status_code = 400)
+    try:
+        room_list.add(new_room = imported_room)
+        logging.debug(f'{room_importer.num_messages} messages were imported into {room_name}.')
+        return JSONResponse(content = { 'message': { 'data': { 'room_name': room_name,
+                                                                'num_messages': room_importer.num_messages,
+                                                                'last_sequence_num': room_importer.last_sequence_num }}}, status_code = 201)
+    except:
+        logging.error(f'Unknown Error adding the imported room {room_name} to the room list.')
+        return JSONResponse(content = { 'message': f'Unknown Error adding the imported room {room_name} to the room list.'}, status_code = 400)
+
+async def drop_failed_import(room_importer: RoomImporter, room_name: str) -> None:
+    """ Drop what a failed import put in storage, logging instead of raising if storage fails again
+    """
+    try:
+        await asyncio.to_thread(room_importer.abort)
+    except:
+        logging.error(f'Unknown Error dropping the failed import of {room_name}, it has to be removed from storage by hand.')
+
+@app.get("/metrics/", status_code = 200)
+async def get_metrics():
+    """ API for getting the counts of rejected sends and the number of messages waiting to be persisted
+        NOTE: storage_state is the state of the storage circuit breaker (closed, open or half_open)
+    """
+    return JSONResponse(content = { 'message': { 'data': {
+                                        'alias_rate_limited': alias_send_limiter.rejections,
+                                        'room_rate_limited': room_send_limiter.rejections,
+                                        'ephemeral_room_rate_limited': ephemeral_room_send_limiter.rejections,
+                                        'queue_full': queue_full_rejections,
+                                        'duplicate_sends': duplicate_sends,
+                                        'pending_writes': sum(current_room.num_pending for current_room in room_list.get_rooms()),
+                                        'spooled_writes': sum(current_room.num_spooled for current_room in room_list.get_rooms()),
+                                        'storage_state': storage_breaker.state,
+                                        'storage_breaker_opened': storage_breaker.num_opened
+                                    }}}, status_code = 200)
+
+def negotiated_response(request: Request, content, status_code: int = 200) -> Response:
+    """ Answer content as MessagePack when the Accept header of the request asks for it, as JSON otherwise
+        NOTE: both encodings follow the schema in wire_format, so a client gets the same values either way
+    """
+    media_type = negotiate_media_type(request.headers.get('accept'))
+    return Response(content = encode_body(content, media_type), status_code = status_code, media_type = media_type, headers = { 'Vary': 'Accept' })
+
+async def compress_stream(body_iterator, stream_compressor: StreamCompressor):
+    """ Compress the chunks of a streamed response as they are sent
+    """
+    async for current_chunk in body_iterator:
+        compressed_chunk = stream_compressor.compress(current_chunk)
+        if compressed_chunk:
+            yield compressed_chunk
+    yield stream_compressor.finish()
+
+def page_etag(room_name: str, room_version: int, alias: str, messages_to_get: int) -> str:
+    """ Make the ETag of a messages page from everything the page is rendered from
+    """
+    page_key = f'{page_etag_salt}:{room_name}:{room_version}:{alias}:{messages_to_get}'
+    return f'"{hashlib.sha1(page_key.encode(BYTE_to_STRING)).hexdigest()}"'
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """ Check if an If-None-Match header matches etag
+        NOTE: the header can be a list of ETags, weak ETags (W/) are compared like strong ones, * matches anything
+    """
+    if if_none_match is None:
+        return False
+    for current_etag in if_none_match.split(','):
+        current_etag = current_etag.strip()
+        if current_etag == '*' or current_etag.removeprefix('W/') == etag:
+            return True
+    return False
+
+def check_send_limits(chat_room: ChatRoom, from_alias: str) -> JSONResponse:
+    """ Check the sender, the pending writes of the room and the rate limits of the room and the sender before sending a message
+        NOTE: returns a 412 response if from_alias is not a user, a 429 response with a Retry-After header if the send has to be
+                rejected, None if it can go ahead
+        NOTE: the sender is checked first so only users get a bucket, and a token is only kept when every check passed
+        NOTE: ephemeral rooms do not write their messages, so they have their own (higher) room limit
+    """
+    global queue_full_rejections
+    if users.get(from_alias) is None:
+        logging.debug(f'{from_alias} was not a valid user alias in the UserList.')
+        return JSONResponse(content = { 'message': f'User {from_alias} was not found in UserList.'}, status_code = 412)
+    if chat_room.num_pending >= MAX_PENDING_WRITES:
+        queue_full_rejections += 1
+        logging.warning(f'{chat_room.room_name} has too many messages waiting to be persisted.')
+        return JSONResponse(content = { 'message': f'{chat_room.room_name} has too many messages waiting to be persisted.'}, status_code = 429,
+                            headers = { 'Retry-After': '1' })
+    current_room_limiter = ephemeral_room_send_limiter if chat_room.ephemeral is True else room_send_limiter
+    acquired, retry_after = current_room_limiter.try_acquire(chat_room.room_name)
+    if acquired is False:
+        logging.warning(f'{chat_room.room_name} is receiving messages too quickly.')
+        return JSONResponse(content = { 'message': f'{chat_room.room_name} is receiving messages too quickly.'}, status_code = 429,
+                            headers = { 'Retry-After': str(math.ceil(retry_after)) })
+    acquired, retry_after = alias_send_limiter.try_acquire(from_alias)
+    if acquired is False:
+        current_room_limiter.refund(chat_room.room_name)
+        logging.warning(f'{from_alias} is sending messages too quickly.')
+        return JSONResponse(content = { 'message': f'{from_alias} is sending messages too quickly.'}, status_code = 429,
+                            headers = { 'Retry-After': str(math.ceil(retry_after)) })
+    return None
+
+def schedule_persist(chat_room: ChatRoom) -> None:
+    """ Persist the pending writes of a room in a worker thread, unless that room is already being persisted
+        NOTE: each room has at most one persist running, so messages keep their order while different rooms are written in parallel
+    """
+    if chat_room.room_name in persisting_rooms:
+        return
+    persisting_rooms.add(chat_room.room_name)
+    asyncio.create_task(persist_pending(chat_room = chat_room))
+
+async def persist_pending(chat_room: ChatRoom) -> None:
+    """ Background job that persists the pending writes of one room without blocking the event loop
+        NOTE: the job is not part of the request that scheduled it, so its stages are not timed into that request
+    """
+    request_timer.set(None)
+    try:
+        await asyncio.to_thread(chat_room.persist)
+    except:
+        logging.error(f'Unknown Error persisting the pending messages of {chat_room.room_name}.')
+    finally:
+        persisting_rooms.discard(chat_room.room_name)
+    if chat_room.num_pending > EMPTY:
+        await asyncio.sleep(1)
+        schedule_persist(chat_room = chat_room)
+
+async def archive_expired_messages():
+    """ Background job that moves the expired messages of every room to the archive every ARCHIVE_INTERVAL_SECONDS
+        NOTE: each room is archived in a worker thread, the archive and storage writes never block the event loop
+    """
+    while True:
+        await asyncio.sleep(ARCHIVE_INTERVAL_SECONDS)
+        for current_room in room_list.get_rooms():
+            try:
+                await asyncio.to_thread(current_room.archive_expired, archive = message_archive)
+            except:
+                logging.error(f'Unknown Error archiving the expired messages of {current_room.room_name}.')
+
+async def flush_read_cursors():
+    """ Background job that writes the pending read cursors every flush_seconds of the read cursors
+        NOTE: a burst of reads is written even if no other read comes after it, the write runs in a worker thread
+    """
+    while True:
+        await asyncio.sleep(read_cursors.flush_seconds)
+        try:
+            await asyncio.to_thread(read_cursors.persist)
+        except:
+            logging.error(f'Unknown Error persisting {read_cursors.num_pending} read cursors.')
+
 def main():
     ''' Main method to get the current user alias
     '''
     MY_IPADDRESS = socket.gethostbyname(socket.gethostname())
     MY_NAME = input("Please enter your name: ")
 
+warm_up_status['import_seconds'] = round(time.perf_counter() - IMPORT_START, 3)
+logging.info(f'room_chat_api was imported in {warm_up_status["import_seconds"]} seconds.')
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,67 @@
+import logging
+from datetime import datetime, timedelta
+from constants import *
+
+logging.basicConfig(filename='message_chat.log', level=logging.DEBUG, format = LOG_FORMAT)
+
+class RoomStats():
+    """ Class for the activity counters of one room, kept up to date one message at a time so they never need the history:
+            - how many messages were sent, and by each sender
+            - how many messages were received in each of the last STATS_MINUTES minutes and STATS_HOURS hours (of activity)
+            - when the last message was received
+        NOTE: sequence_num is the highest sequence number counted, a restored room only counts the messages after it
+        NOTE: this class is not locked, the room it belongs to calls it with the room locked
+    """
+    def __init__(self, stats_document: dict = None) -> None:
+        stats_document = stats_document if stats_document is not None else dict()
+        self.__num_messages = stats_document.get('num_messages', EMPTY)
+        self.__sender_counts = { alias: count for alias, count in stats_document.get('senders', []) }
+        self.__minute_counts = { bucket_start: count for bucket_start, count in stats_document.get('minutes', []) }
+        self.__hour_counts = { bucket_start: count for bucket_start, count in stats_document.get('hours', []) }
+        self.__last_activity = stats_document.get('last_activity')
+        self.__sequence_num = stats_document.get('sequence_num', EMPTY)
+
+    # property to get the highest sequence number counted so far
+    @property
+    def sequence_num(self):
+        return self.__sequence_num
+
+    def record(self, from_alias: str, rec_time: datetime, sequence_num: int) -> None:
+        ''' This method will count one message of from_alias received at rec_time
+        '''
+        self.__num_messages += 1
+        self.__sender_counts[from_alias] = self.__sender_counts.get(from_alias, EMPTY) + 1
+        self.__count_in(self.__minute_counts, rec_time.replace(second = EMPTY, microsecond = EMPTY), STATS_MINUTES, timedelta(minutes = 1))
+        self.__count_in(self.__hour_counts, rec_time.replace(minute = EMPTY, second = EMPTY, microsecond = EMPTY), STATS_HOURS, timedelta(hours = 1))
+        if self.__last_activity is None or rec_time > self.__last_activity:
+            self.__last_activity = rec_time
+        self.__sequence_num = max(self.__sequence_num, sequence_num)
+
+    def __count_in(self, bucket_counts: dict, bucket_start: datetime, num_buckets: int, bucket_size: timedelta) -> None:
+        ''' This is a helper method to add one to a time bucket, dropping the buckets older than the newest num_buckets once there are too many
+        '''
+        bucket_counts[bucket_start] = bucket_counts.get(bucket_start, EMPTY) + 1
+        if len(bucket_counts) > num_buckets:
+            cutoff = max(bucket_counts) - num_buckets * bucket_size
+            for old_bucket in [current_bucket for current_bucket in bucket_counts if current_bucket <= cutoff]:
+                del bucket_counts[old_bucket]
+
+    def to_document(self) -> dict:
+        ''' This method will return the counters as a document to store with the room metadata
+            NOTE: senders and buckets are lists of pairs, aliases can have characters mongo does not allow in keys
+        '''
+        return { 'num_messages': self.__num_messages,
+                 'senders': [[alias, count] for alias, count in self.__sender_counts.items()],
+                 'minutes': sorted([bucket_start, count] for bucket_start, count in self.__minute_counts.items()),
+                 'hours': sorted([bucket_start, count] for bucket_start, count in self.__hour_counts.items()),
+                 'last_activity': self.__last_activity,
+                 'sequence_num': self.__sequence_num }
+
+    def to_dict(self) -> dict:
+        ''' This method will return the counters for the stats endpoint, time buckets oldest first
+        '''
+        return { 'num_messages': self.__num_messages,
+                 'senders': dict(self.__sender_counts),
+                 'per_minute': [{ 'start': bucket_start, 'num_messages': count } for bucket_start, count in sorted(self.__minute_counts.items())],
+                 'per_hour': [{ 'start': bucket_start, 'num_messages': count } for bucket_start, count in sorted(self.__hour_counts.items())],
+                 'last_activity': self.__last_activity }
@@ -0,0 +1,32 @@
+import unittest
+from datetime import datetime, timedelta
+from constants import *
+from room_stats import RoomStats
+
+class RoomStatsTest(unittest.TestCase):
+    """ This test environment will test the activity counters kept for every room
+    """
+    def test_buckets(self):
+        ''' Messages should be counted per minute and per hour, keeping only the newest buckets
+        '''
+        room_stats = RoomStats()
+        first_time = datetime(2022, 3, 1, 12, 0, 30)
+        for minute_num in range(STATS_MINUTES + 10):
+            room_stats.record(from_alias = TEST_OWNER_ALIAS, rec_time = first_time + timedelta(minutes = minute_num), sequence_num = minute_num + 1)
+        room_stats.record(from_alias = TEST_MEMBER_ALIAS, rec_time = first_time + timedelta(minutes = STATS_MINUTES + 9, seconds = 5), sequence_num = STATS_MINUTES + 11)
+        activity = room_stats.to_dict()
+        self.assertEqual(activity['num_messages'], STATS_MINUTES + 11)
+        self.assertEqual(activity['senders'], { TEST_OWNER_ALIAS: STATS_MINUTES + 10, TEST_MEMBER_ALIAS: 1 })
+        self.assertEqual(len(activity['per_minute']), STATS_MINUTES)
+        self.assertEqual(activity['per_minute'][-1], { 'start': datetime(2022, 3, 1, 13, 9), 'num_messages': 2 })
+        self.assertEqual([current_bucket['num_messages'] for current_bucket in activity['per_hour']], [60, 11])
+        self.assertEqual(activity['last_activity'], datetime(2022, 3, 1, 13, 9, 35))
+
+    def test_document(self):
+        ''' Counters saved as a document should come back the same, with the sequence number they were saved at
+        '''
+        room_stats = RoomStats()
+        room_stats.record(from_alias = TEST_OWNER_ALIAS, rec_time = datetime(2022, 3, 1, 12), sequence_num = 7)
+        restored_stats = RoomStats(room_stats.to_document())
+        self.assertEqual(restored_stats.to_dict(), room_stats.to_dict())
+        self.assertEqual(restored_stats.sequence_num, 7)
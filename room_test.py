@@ -2,8 +2,9 @@ import unittest
 from datetime import datetime
 from unittest import TestCase
 from constants import *
-from room import ChatRoom, MessageProperties, RoomList
+from room import ChatRoom, MessageProperties, RoomList, member_index, inbox_index
 from users import *
+from archive import MessageArchive
 
 class RoomTest(unittest.TestCase):
     """ This test environment will test the functionality of the room file
@@ -56,4 +57,64 @@ class RoomTest(unittest.TestCase):
                                                                 mess_type = PRIVATE_MESSAGE)))
         tuple_of_messages = self.__chat_room.get_messages(user_alias = TEST_OWNER_ALIAS)
         self.assertEqual(tuple_of_messages[2], self.__chat_room.num_messages)
-        self.assertIn(DEFAULT_FULL_CASE_TEST_MESSAGE, tuple_of_messages[0])
\ No newline at end of file
+        self.assertIn(DEFAULT_FULL_CASE_TEST_MESSAGE, tuple_of_messages[0])
+
+    def test_members(self):
+        """ Adding and removing a member should update the room and the member index
+            NOTE: the owner of the room should never be removable
+        """
+        self.__chat_room.remove_member(member_alias = TEST_MEMBER_ALIAS)
+        self.assertTrue(self.__chat_room.add_member(member_alias = TEST_MEMBER_ALIAS))
+        self.assertFalse(self.__chat_room.add_member(member_alias = TEST_MEMBER_ALIAS))
+        self.assertTrue(self.__chat_room.is_member(TEST_MEMBER_ALIAS))
+        self.assertIn(DEFAULT_TEST_ROOM, member_index.rooms_for(TEST_MEMBER_ALIAS))
+        self.assertTrue(self.__chat_room.remove_member(member_alias = TEST_MEMBER_ALIAS))
+        self.assertNotIn(DEFAULT_TEST_ROOM, member_index.rooms_for(TEST_MEMBER_ALIAS))
+        self.assertFalse(self.__chat_room.remove_member(member_alias = TEST_OWNER_ALIAS))
+
+    def test_inbox(self):
+        """ A private message should show up first in the inbox of its recipient
+        """
+        self.assertTrue(self.__chat_room.send_message(message = DEFAULT_PRIVATE_TEST_MESSAGE,
+                                    from_alias = TEST_OWNER_ALIAS,
+                                    mess_props = MessageProperties(room_name = DEFAULT_TEST_ROOM, 
+                                                                to_user = TEST_MEMBER_ALIAS, 
+                                                                from_user = TEST_OWNER_ALIAS, 
+                                                                mess_type = PRIVATE_MESSAGE)))
+        inbox_messages, next_before = inbox_index.get_page(to_alias = TEST_MEMBER_ALIAS, page_size = 1)
+        self.assertEqual(inbox_messages[0].message, DEFAULT_PRIVATE_TEST_MESSAGE)
+        if inbox_index.num_messages(TEST_MEMBER_ALIAS) > 1:
+            self.assertEqual(next_before, inbox_index.num_messages(TEST_MEMBER_ALIAS) - 1)
+
+    def test_retention(self):
+        """ Messages past the retention count should be moved to the archive, oldest first
+        """
+        self.assertTrue(self.__chat_room.send_message(message = DEFAULT_FULL_CASE_TEST_MESSAGE,
+                                    from_alias = TEST_OWNER_ALIAS,
+                                    mess_props = MessageProperties(room_name = DEFAULT_TEST_ROOM, 
+                                                                to_user = TEST_OWNER_ALIAS, 
+                                                                from_user = TEST_OWNER_ALIAS, 
+                                                                mess_type = PUBLIC_MESSAGE)))
+        newest_sequence_num = self.__chat_room.last_sequence_num
+        self.__chat_room.set_retention(max_messages = 1)
+        self.__chat_room.archive_expired(archive = MessageArchive())
+        self.__chat_room.set_retention()
+        self.assertEqual(self.__chat_room.num_messages, 1)
+        self.assertEqual(self.__chat_room.get().message_properties.sequence_number, newest_sequence_num)
+
+    def test_deferred_send(self):
+        """ Deferred messages should wait in the pending writes and get consecutive sequence numbers when persisted
+        """
+        for current_message in (DEFAULT_PRIVATE_TEST_MESSAGE, DEFAULT_PUBLIC_TEST_MESSAGE):
+            self.assertTrue(self.__chat_room.send_message(message = current_message,
+                                        from_alias = TEST_OWNER_ALIAS,
+                                        mess_props = MessageProperties(room_name = DEFAULT_TEST_ROOM, 
+                                                                    to_user = TEST_OWNER_ALIAS, 
+                                                                    from_user = TEST_OWNER_ALIAS, 
+                                                                    mess_type = PUBLIC_MESSAGE),
+                                        defer_persist = True))
+        self.assertEqual(self.__chat_room.num_pending, 2)
+        self.__chat_room.persist()
+        self.assertEqual(self.__chat_room.num_pending, EMPTY)
+        newest_messages = [self.__chat_room[0], self.__chat_room[1]]
+        self.assertEqual(newest_messages[0].message_properties.sequence_number, newest_messages[1].message_properties.sequence_number + 1)
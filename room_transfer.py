@@ -0,0 +1,158 @@
+import logging
+from bson import json_util
+from constants import *
+from storage import StorageBackend, get_default_backend
+
+logging.basicConfig(filename='message_chat.log', level=logging.DEBUG, format = LOG_FORMAT)
+
+''' The NDJSON format of an exported room, one JSON document per line:
+        - The first line is { "room": metadata document of the room }
+        - Every other line is { "message": stored message document }, oldest first
+    NOTE: the lines are MongoDB Extended JSON (bson json_util), so datetimes and compressed bodies come back exactly as they were stored
+    NOTE: ids are left out, storage gives the imported documents new ones, sequence numbers are kept
+'''
+
+def export_room(room_name: str, backend: StorageBackend = None):
+    ''' This function will iterate over the NDJSON lines of a room, in chunks of about EXPORT_CHUNK_BYTES
+        NOTE: the messages are read from the storage cursor as the chunks are sent, only one chunk is in memory at a time
+    '''
+    backend = backend if backend is not None else get_default_backend()
+    room_metadata = backend.load_room(room_name)
+    if room_metadata is None:
+        return
+    room_metadata.pop('_id', None)
+    chunk = [json_util.dumps({ 'room': room_metadata }).encode(BYTE_to_STRING) + b'\n']
+    chunk_size = len(chunk[0])
+    num_messages = EMPTY
+    for current_document in backend.load_messages(room_name):
+        current_document.pop('_id', None)
+        current_line = json_util.dumps({ 'message': current_document }).encode(BYTE_to_STRING) + b'\n'
+        chunk.append(current_line)
+        chunk_size += len(current_line)
+        num_messages += 1
+        if chunk_size >= EXPORT_CHUNK_BYTES:
+            yield b''.join(chunk)
+            chunk = list()
+            chunk_size = EMPTY
+    if chunk:
+        yield b''.join(chunk)
+    logging.info(f'{num_messages} messages of {room_name} were exported.')
+
+class RoomImporter():
+    """ Class for importing an exported room (see export_room) into room_name, from its NDJSON body fed a chunk at a time.
+        The metadata is stored as soon as its line is read, messages are inserted IMPORT_BATCH_SIZE at a time.
+        NOTE: messages keep their sequence numbers, the sequence counter of the room is moved past the last one when the import finishes
+        NOTE: a line that is not part of an exported room raises a ValueError, abort() then drops what was imported so far
+    """
+    def __init__(self, room_name: str, backend: StorageBackend = None, batch_size: int = IMPORT_BATCH_SIZE) -> None:
+        self.__room_name = room_name
+        self.__backend = backend if backend is not None else get_default_backend()
+        self.__batch_size = batch_size
+        self.__partial_line = b''
+        self.__message_batch = list()
+        self.__room_opened = False
+        self.__room_imported = False
+        self.__num_messages = EMPTY
+        self.__last_sequence_num = EMPTY
+
+    # property to get how many messages were inserted so far
+    @property
+    def num_messages(self):
+        return self.__num_messages
+
+    # property to get the highest sequence number imported so far
+    @property
+    def last_sequence_num(self):
+        return self.__last_sequence_num
+
+    def feed(self, chunk: bytes) -> None:
+        ''' This method will import every whole line of chunk, keeping a line cut by the end of the chunk for the next one
+        '''
+        lines = (self.__partial_line + chunk).split(b'\n')
+        self.__partial_line = lines.pop()
+        for current_line in lines:
+            self.__import_line(current_line)
+
+    def finish(self) -> int:
+        ''' This method will import the last line and batch, move the sequence counter and return how many messages were imported
+        '''
+        self.__import_line(self.__partial_line)
+        self.__partial_line = b''
+        if self.__room_imported is False:
+            raise ValueError('The body has no room metadata.')
+        self.__insert_batch()
+        last_reserved_num = self.__backend.next_sequence_num(self.__room_name, count = EMPTY)
+        if self.__last_sequence_num > last_reserved_num:
+            self.__backend.next_sequence_num(self.__room_name, count = self.__last_sequence_num - last_reserved_num)
+        logging.info(f'{self.__num_messages} messages were imported into {self.__room_name}, up to sequence number {self.__last_sequence_num}.')
+        return self.__num_messages
+
+    def abort(self) -> None:
+        ''' This method will drop the metadata and messages imported so far, after feed() or finish() failed
+            NOTE: the room is dropped as a whole, room_name has to be a new room that nothing else writes to during the import
+        '''
+        self.__message_batch = list()
+        if self.__room_opened is False:
+            return
+        self.__backend.drop_room(self.__room_name)
+        logging.info(f'The import of {self.__room_name} was dropped, {self.__num_messages} imported messages were removed.')
+        self.__room_opened = False
+        self.__room_imported = False
+        self.__num_messages = EMPTY
+        self.__last_sequence_num = EMPTY
+
+    def __import_line(self, line: bytes) -> None:
+        ''' This is a helper method to store the metadata or add the message of one line to the batch
+        '''
+        if len(line.strip()) is EMPTY:
+            return
+        try:
+            document = json_util.loads(line)
+        except Exception as decode_error:
+            raise ValueError(f'A line of the import of {self.__room_name} is not JSON.') from decode_error
+        if not isinstance(document, dict):
+            raise ValueError(f'A line of the import of {self.__room_name} is not a room or a message.')
+        if 'room' in document and self.__room_imported is False:
+            self.__import_room(document['room'])
+        elif 'message' in document and self.__room_imported is True:
+            self.__add_message(document['message'])
+        else:
+            raise ValueError(f'A line of the import of {self.__room_name} is out of place.')
+
+    def __import_room(self, room_metadata: dict) -> None:
+        ''' This is a helper method to store the metadata of the room under room_name
+        '''
+        if not isinstance(room_metadata, dict) or any(field_name not in room_metadata for field_name in ('owner_alias', 'room_type', 'member_list')):
+            raise ValueError(f'The metadata of the import of {self.__room_name} is not a room.')
+        room_metadata.pop('_id', None)
+        room_metadata['room_name'] = self.__room_name
+        self.__room_opened = True
+        self.__backend.open_room(self.__room_name)
+        if self.__backend.insert_room(room_metadata) is False:
+            # the room was made by someone else, it is not ours to drop
+            self.__room_opened = False
+            raise ValueError(f'{self.__room_name} already exists, nothing was imported.')
+        self.__room_imported = True
+
+    def __add_message(self, message_document: dict) -> None:
+        ''' This is a helper method to add a message to the batch, inserting the batch once it is full
+        '''
+        message_properties = message_document.get('mess_props') if isinstance(message_document, dict) else None
+        if not isinstance(message_properties, dict) or not isinstance(message_properties.get('sequence_num'), int) or message_properties['sequence_num'] < 1:
+            raise ValueError(f'A message of the import of {self.__room_name} has no sequence number.')
+        message_document.pop('_id', None)
+        message_properties['room_name'] = self.__room_name
+        self.__message_batch.append(message_document)
+        if len(self.__message_batch) >= self.__batch_size:
+            self.__insert_batch()
+
+    def __insert_batch(self) -> None:
+        ''' This is a helper method to insert the batch of messages with one insert
+        '''
+        if len(self.__message_batch) is EMPTY:
+            return
+        inserted_ids = self.__backend.insert_messages(self.__room_name, self.__message_batch)
+        self.__num_messages += sum(1 for current_id in inserted_ids if current_id is not None)
+        self.__last_sequence_num = max([self.__last_sequence_num] + [current_message['mess_props']['sequence_num'] for current_message in self.__message_batch])
+        logging.debug(f'{len(self.__message_batch)} messages were imported into {self.__room_name}.')
+        self.__message_batch = list()
@@ -0,0 +1,86 @@
+import shutil
+import tempfile
+import unittest
+from constants import *
+from room import ChatRoom, MessageProperties
+from segment_storage import SegmentLogBackend
+from room_transfer import RoomImporter, export_room
+
+class RoomTransferTest(unittest.TestCase):
+    """ This test environment will test exporting rooms as NDJSON and importing them, with the segment log backend
+    """
+    def setUp(self) -> None:
+        self.__root_path = tempfile.mkdtemp()
+        self.__backend = SegmentLogBackend(root_path = self.__root_path)
+
+    def tearDown(self) -> None:
+        self.__backend.close()
+        shutil.rmtree(self.__root_path)
+
+    def __send(self, chat_room: ChatRoom, message: str) -> None:
+        ''' This is a helper method to send a public message from the owner to the room
+        '''
+        self.assertTrue(chat_room.send_message(message = message,
+                                    from_alias = TEST_OWNER_ALIAS,
+                                    mess_props = MessageProperties(room_name = chat_room.room_name,
+                                                                to_user = TEST_MEMBER_ALIAS,
+                                                                from_user = TEST_OWNER_ALIAS,
+                                                                mess_type = PUBLIC_MESSAGE)))
+
+    def test_export_and_import(self):
+        ''' An exported room fed back in small chunks should come back under the new name with the same messages and sequence numbers
+        '''
+        chat_room = ChatRoom(room_name = DEFAULT_TEST_ROOM, owner_alias = TEST_OWNER_ALIAS, create_new = True, backend = self.__backend)
+        for message_num in range(25):
+            self.__send(chat_room, f'{DEFAULT_PUBLIC_TEST_MESSAGE} {message_num}')
+        self.__send(chat_room, DEFAULT_FULL_CASE_TEST_MESSAGE * 100)
+        self.assertTrue(chat_room.delete_message(3, TEST_OWNER_ALIAS))
+        exported = b''.join(export_room(DEFAULT_TEST_ROOM, backend = self.__backend))
+        room_importer = RoomImporter(room_name = IMPORTED_TEST_ROOM, backend = self.__backend, batch_size = 7)
+        for chunk_start in range(0, len(exported), 100):
+            room_importer.feed(exported[chunk_start:chunk_start + 100])
+        self.assertEqual(room_importer.finish(), 26)
+        self.assertEqual(room_importer.last_sequence_num, 26)
+        imported_room = ChatRoom(room_name = IMPORTED_TEST_ROOM, backend = self.__backend)
+        self.assertEqual(imported_room.owner_alias, TEST_OWNER_ALIAS)
+        self.assertEqual([current_message.message for current_message in imported_room.get_messages(user_alias = TEST_OWNER_ALIAS)[1]],
+                         [current_message.message for current_message in chat_room.get_messages(user_alias = TEST_OWNER_ALIAS)[1]])
+        self.assertTrue(imported_room.get_message(3).deleted)
+        self.assertEqual(imported_room.get().message_properties.room_name, IMPORTED_TEST_ROOM)
+        self.__send(imported_room, DEFAULT_PUBLIC_TEST_MESSAGE)
+        self.assertEqual(imported_room.last_sequence_num, 27)
+
+    def test_bad_import(self):
+        ''' A body without the room metadata first, or with a message without a sequence number, should raise a ValueError
+        '''
+        with self.assertRaises(ValueError):
+            RoomImporter(room_name = IMPORTED_TEST_ROOM, backend = self.__backend).feed(b'{"message": {"message": "hi", "mess_props": {"sequence_num": 1}}}\n')
+        with self.assertRaises(ValueError):
+            RoomImporter(room_name = IMPORTED_TEST_ROOM, backend = self.__backend).finish()
+        room_importer = RoomImporter(room_name = IMPORTED_TEST_ROOM, backend = self.__backend)
+        room_importer.feed(b'{"room": {"owner_alias": "kevin", "room_type": 100, "member_list": ["kevin"]}}\n{"message": {"message": "hi"}}')
+        with self.assertRaises(ValueError):
+            room_importer.finish()
+
+    def test_aborted_import(self):
+        ''' An import that failed part way should be dropped by abort(), so the same room can be imported again from the start
+        '''
+        chat_room = ChatRoom(room_name = DEFAULT_TEST_ROOM, owner_alias = TEST_OWNER_ALIAS, create_new = True, backend = self.__backend)
+        for message_num in range(10):
+            self.__send(chat_room, f'{DEFAULT_PUBLIC_TEST_MESSAGE} {message_num}')
+        exported = b''.join(export_room(DEFAULT_TEST_ROOM, backend = self.__backend))
+        room_importer = RoomImporter(room_name = IMPORTED_TEST_ROOM, backend = self.__backend, batch_size = 3)
+        room_importer.feed(exported)
+        with self.assertRaises(ValueError):
+            room_importer.feed(b'{"message": {"message": "hi"}}\n')
+        self.assertGreater(room_importer.num_messages, 0)
+        room_importer.abort()
+        self.assertEqual(room_importer.num_messages, 0)
+        self.assertFalse(self.__backend.room_exists(IMPORTED_TEST_ROOM))
+        self.assertEqual(list(self.__backend.load_messages(IMPORTED_TEST_ROOM)), [])
+        self.assertEqual(self.__backend.next_sequence_num(IMPORTED_TEST_ROOM, count = 0), 0)
+        self.__backend.drop_room(IMPORTED_TEST_ROOM)
+        room_importer = RoomImporter(room_name = IMPORTED_TEST_ROOM, backend = self.__backend)
+        room_importer.feed(exported)
+        self.assertEqual(room_importer.finish(), 10)
+        self.assertEqual(ChatRoom(room_name = IMPORTED_TEST_ROOM, backend = self.__backend).num_messages, 10)
@@ -0,0 +1,533 @@
+import os
+import mmap
+import shutil
+import struct
+import bisect
+import logging
+import threading
+from bson import encode, decode, json_util
+from urllib.parse import quote
+from constants import *
+from storage import StorageBackend
+
+logging.basicConfig(filename='message_chat.log', level=logging.DEBUG, format = LOG_FORMAT)
+
+# every record is a header (payload length, sequence number, record kind) followed by a BSON payload
+RECORD_HEADER = struct.Struct('>IqB')
+
+class Segment():
+    """ One append-only segment file of a room log, named after the first sequence number it holds.
+        NOTE: a sparse index keeps the file offset of every SPARSE_INDEX_INTERVAL-th record, reads bisect it and scan forward
+        NOTE: reads go through a read-only memory map of the file that is remapped when the file has grown
+    """
+    def __init__(self, segment_path: str, first_sequence_num: int) -> None:
+        self.__segment_path = segment_path
+        self.__first_sequence_num = first_sequence_num
+        self.__last_sequence_num = first_sequence_num - 1
+        self.__size = EMPTY
+        self.__num_messages = EMPTY
+        self.__num_deleted = EMPTY
+        self.__index_sequence_nums = list()
+        self.__index_offsets = list()
+        self.__memory_map = None
+        self.__mapped_size = EMPTY
+
+    @property
+    def segment_path(self):
+        return self.__segment_path
+
+    @property
+    def first_sequence_num(self):
+        return self.__first_sequence_num
+
+    @property
+    def last_sequence_num(self):
+        return self.__last_sequence_num
+
+    @property
+    def size(self):
+        return self.__size
+
+    @property
+    def num_messages(self):
+        return self.__num_messages
+
+    # property to get how many messages of this segment have a tombstone
+    @property
+    def num_deleted(self):
+        return self.__num_deleted
+
+    def message_deleted(self) -> None:
+        ''' This method will count one more message of this segment as deleted
+        '''
+        self.__num_deleted += 1
+
+    def record_appended(self, offset: int, sequence_num: int, kind: int, record_size: int) -> None:
+        ''' This method will account for a record written (or found while scanning) at offset
+        '''
+        if kind == RECORD_MESSAGE:
+            if self.__num_messages % SPARSE_INDEX_INTERVAL == EMPTY:
+                self.__index_sequence_nums.append(sequence_num)
+                self.__index_offsets.append(offset)
+            self.__num_messages += 1
+            self.__last_sequence_num = max(self.__last_sequence_num, sequence_num)
+        self.__size = offset + record_size
+
+    def scan(self, tombstones: set, updates: dict) -> None:
+        ''' This method will rebuild the sparse index from the file, adding the tombstones it finds to tombstones
+                and the newest document of every updated message to updates
+            NOTE: a torn record at the end of the file (from a crash in the middle of a write) is cut off
+        '''
+        with open(self.__segment_path, 'rb') as segment_file:
+            segment_bytes = segment_file.read()
+        offset = EMPTY
+        while offset + RECORD_HEADER.size <= len(segment_bytes):
+            payload_size, sequence_num, kind = RECORD_HEADER.unpack_from(segment_bytes, offset)
+            record_size = RECORD_HEADER.size + payload_size
+            if offset + record_size > len(segment_bytes):
+                break
+            if kind == RECORD_TOMBSTONE:
+                tombstones.add(sequence_num)
+            elif kind == RECORD_UPDATE:
+                updates[sequence_num] = decode(segment_bytes[offset + RECORD_HEADER.size:offset + record_size])
+            self.record_appended(offset = offset, sequence_num = sequence_num, kind = kind, record_size = record_size)
+            offset += record_size
+        if offset < len(segment_bytes):
+            logging.warning(f'Cutting a torn record off the end of {self.__segment_path}.')
+            with open(self.__segment_path, 'r+b') as segment_file:
+                segment_file.truncate(offset)
+        self.__size = offset
+
+    def __map(self):
+        ''' This is a helper method to return a memory map that covers every record written so far
+            NOTE: an outgrown map is not closed here, a reader in another thread may still be using it
+        '''
+        if self.__memory_map is None or self.__mapped_size < self.__size:
+            with open(self.__segment_path, 'rb') as segment_file:
+                self.__memory_map = mmap.mmap(segment_file.fileno(), 0, access = mmap.ACCESS_READ)
+            self.__mapped_size = len(self.__memory_map)
+        return self.__memory_map
+
+    def read(self, first_sequence_num: int, last_sequence_num: int):
+        ''' This method will iterate over (sequence number, message document) of the messages from first to last in this segment
+        '''
+        if self.__size is EMPTY or first_sequence_num > self.__last_sequence_num:
+            return
+        memory_map = self.__map()
+        read_limit = min(self.__size, len(memory_map))
+        index_position = max(EMPTY, bisect.bisect_right(self.__index_sequence_nums, first_sequence_num) - 1)
+        offset = self.__index_offsets[index_position] if self.__index_offsets else EMPTY
+        while offset + RECORD_HEADER.size <= read_limit:
+            payload_size, sequence_num, kind = RECORD_HEADER.unpack_from(memory_map, offset)
+            payload_start = offset + RECORD_HEADER.size
+            offset = payload_start + payload_size
+            if kind != RECORD_MESSAGE or sequence_num < first_sequence_num:
+                continue
+            if sequence_num > last_sequence_num:
+                return
+            yield sequence_num, decode(memory_map[payload_start:offset])
+
+    def close(self) -> None:
+        ''' This method will release the memory map of the segment, if there is one
+        '''
+        if self.__memory_map is not None:
+            self.__memory_map.close()
+            self.__memory_map = None
+            self.__mapped_size = EMPTY
+
+class RoomLog():
+    """ Append-only log of the messages of one room: a directory of segment files plus the reserved sequence counter.
+        NOTE: deleting a message appends a tombstone, a segment is removed once every message in it is deleted
+        NOTE: updating a message appends its whole new document, reads return that one instead of the original
+        NOTE: messages are expected to be appended in sequence order
+    """
+    def __init__(self, room_path: str) -> None:
+        self.__room_path = room_path
+        self.__lock = threading.RLock()
+        self.__segments = list()
+        self.__tombstones = set()
+        self.__updates = dict()
+        self.__client_message_ids = None
+        self.__active_file = None
+        os.makedirs(self.__room_path, exist_ok = True)
+        for segment_name in sorted(os.listdir(self.__room_path)):
+            if segment_name.endswith(SEGMENT_SUFFIX):
+                restored_segment = Segment(os.path.join(self.__room_path, segment_name), int(segment_name[:-len(SEGMENT_SUFFIX)]))
+                restored_segment.scan(self.__tombstones, self.__updates)
+                self.__segments.append(restored_segment)
+        for sequence_num in self.__tombstones:
+            deleted_segment = self.__segment_of(sequence_num)
+            if deleted_segment is not None:
+                deleted_segment.message_deleted()
+        self.__reserved_sequence_num = max([EMPTY] + [current_segment.last_sequence_num for current_segment in self.__segments])
+        sequence_path = os.path.join(self.__room_path, SEQUENCE_FILE)
+        if os.path.isfile(sequence_path):
+            with open(sequence_path) as sequence_file:
+                self.__reserved_sequence_num = max(self.__reserved_sequence_num, int(sequence_file.read() or EMPTY))
+
+    @property
+    def lock(self):
+        return self.__lock
+
+    def reserve(self, count: int = 1) -> int:
+        ''' This method will reserve count sequence numbers, write the new counter and return the last reserved number
+        '''
+        with self.__lock:
+            self.__reserved_sequence_num += count
+            with open(os.path.join(self.__room_path, SEQUENCE_FILE), 'w') as sequence_file:
+                sequence_file.write(str(self.__reserved_sequence_num))
+            return self.__reserved_sequence_num
+
+    def __append_record(self, sequence_num: int, kind: int, payload: bytes) -> None:
+        ''' This is a helper method to append one record to the active segment, starting a new segment when it is full
+            NOTE: the record is flushed before the segment accounts for it, so readers never map bytes that are not in the file yet
+        '''
+        if not self.__segments or self.__segments[-1].size >= SEGMENT_MAX_BYTES:
+            if self.__active_file is not None:
+                self.__active_file.close()
+            first_sequence_num = max(sequence_num, self.__segments[-1].last_sequence_num + 1) if self.__segments else sequence_num
+            self.__segments.append(Segment(os.path.join(self.__room_path, f'{first_sequence_num:020d}{SEGMENT_SUFFIX}'), first_sequence_num))
+            self.__active_file = None
+        if self.__active_file is None:
+            self.__active_file = open(self.__segments[-1].segment_path, 'ab')
+        active_segment = self.__segments[-1]
+        self.__active_file.write(RECORD_HEADER.pack(len(payload), sequence_num, kind) + payload)
+        self.__active_file.flush()
+        active_segment.record_appended(offset = active_segment.size, sequence_num = sequence_num, kind = kind, record_size = RECORD_HEADER.size + len(payload))
+
+    def __known_client_message_ids(self) -> dict:
+        ''' This is a helper method to return the client_message_id -> sequence number of the live messages, read from the segments the first time
+            NOTE: this is the unique index of the log, only rooms that get a message with a client_message_id pay for building it
+        '''
+        if self.__client_message_ids is None:
+            self.__client_message_ids = dict()
+            for current_message in self.read(EMPTY, SEQUENCE_NUM_MAX):
+                client_message_id = current_message['mess_props'].get('client_message_id')
+                if client_message_id is not None:
+                    self.__client_message_ids[client_message_id] = current_message['_id']
+        return self.__client_message_ids
+
+    def append(self, messages: list) -> list:
+        ''' This method will append message documents (with their sequence numbers already set) and return the sequence numbers
+            NOTE: a message with the client_message_id of a live message is not appended, None is returned for it
+        '''
+        with self.__lock:
+            sequence_nums = list()
+            for current_message in messages:
+                sequence_num = current_message['mess_props']['sequence_num']
+                client_message_id = current_message['mess_props'].get('client_message_id')
+                if client_message_id is not None and client_message_id in self.__known_client_message_ids():
+                    logging.debug(f'Message {client_message_id} is already in {self.__room_path}.')
+                    sequence_nums.append(None)
+                    continue
+                self.__append_record(sequence_num = sequence_num, kind = RECORD_MESSAGE, payload = encode(current_message))
+                self.__reserved_sequence_num = max(self.__reserved_sequence_num, sequence_num)
+                if client_message_id is not None:
+                    self.__client_message_ids[client_message_id] = sequence_num
+                sequence_nums.append(sequence_num)
+            return sequence_nums
+
+    def delete(self, sequence_nums: list) -> int:
+        ''' This method will append a tombstone for every live message in sequence_nums and drop segments with no live messages left
+        '''
+        with self.__lock:
+            deleted = [sequence_num for sequence_num in set(sequence_nums) if sequence_num not in self.__tombstones and self.__segment_of(sequence_num) is not None]
+            for sequence_num in sorted(deleted):
+                self.__segment_of(sequence_num).message_deleted()
+                self.__append_record(sequence_num = sequence_num, kind = RECORD_TOMBSTONE, payload = b'')
+                self.__tombstones.add(sequence_num)
+            for sequence_num in deleted:
+                self.__updates.pop(sequence_num, None)
+            if deleted and self.__client_message_ids:
+                deleted_set = set(deleted)
+                self.__client_message_ids = {client_message_id: sequence_num for client_message_id, sequence_num in self.__client_message_ids.items() if sequence_num not in deleted_set}
+            if deleted:
+                self.__drop_dead_segments()
+            return len(deleted)
+
+    def update(self, sequence_num: int, set_fields: dict) -> bool:
+        ''' This method will append the new document of the live message with sequence_num, with set_fields changed
+        '''
+        with self.__lock:
+            if sequence_num in self.__tombstones or self.__segment_of(sequence_num) is None:
+                return False
+            current_documents = list(self.read(sequence_num, sequence_num))
+            if len(current_documents) is EMPTY:
+                return False
+            updated_document = current_documents[0]
+            updated_document.pop('_id', None)
+            updated_document.update(set_fields)
+            self.__append_record(sequence_num = sequence_num, kind = RECORD_UPDATE, payload = encode(updated_document))
+            self.__updates[sequence_num] = updated_document
+            return True
+
+    def __segment_of(self, sequence_num: int) -> Segment:
+        ''' This is a helper method to find the segment that holds sequence_num, or None
+        '''
+        segment_position = bisect.bisect_right([current_segment.first_sequence_num for current_segment in self.__segments], sequence_num) - 1
+        if segment_position < EMPTY or sequence_num > self.__segments[segment_position].last_sequence_num:
+            return None
+        return self.__segments[segment_position]
+
+    def __drop_dead_segments(self) -> None:
+        ''' This is a helper method to remove the older segments whose messages were all deleted
+            NOTE: the active segment is never removed, and only the oldest segments are, so no tombstone of a live message is lost
+        '''
+        while len(self.__segments) > 1:
+            oldest_segment = self.__segments[0]
+            if oldest_segment.num_deleted < oldest_segment.num_messages:
+                return
+            oldest_segment.close()
+            os.remove(oldest_segment.segment_path)
+            self.__segments.pop(0)
+            self.__tombstones.difference_update(range(oldest_segment.first_sequence_num, oldest_segment.last_sequence_num + 1))
+            for sequence_num in [sequence_num for sequence_num in self.__updates if sequence_num <= oldest_segment.last_sequence_num]:
+                del self.__updates[sequence_num]
+            logging.debug(f'Removed the fully deleted segment {oldest_segment.segment_path}.')
+
+    def read(self, first_sequence_num: int, last_sequence_num: int):
+        ''' This method will iterate over the live message documents from first to last sequence number, each with an '_id'
+        '''
+        with self.__lock:
+            segments = list(self.__segments)
+            tombstones = set(self.__tombstones)
+            updates = dict(self.__updates)
+        for current_segment in segments:
+            if current_segment.last_sequence_num < first_sequence_num:
+                continue
+            if current_segment.first_sequence_num > last_sequence_num:
+                return
+            for sequence_num, message_document in current_segment.read(first_sequence_num, last_sequence_num):
+                if sequence_num not in tombstones:
+                    if sequence_num in updates:
+                        message_document = dict(updates[sequence_num])
+                    message_document['_id'] = sequence_num
+                    yield message_document
+
+    def close(self) -> None:
+        ''' This method will close the active segment file and every memory map
+        '''
+        with self.__lock:
+            if self.__active_file is not None:
+                self.__active_file.close()
+                self.__active_file = None
+            for current_segment in self.__segments:
+                current_segment.close()
+
+class SegmentLogBackend(StorageBackend):
+    """ Embedded StorageBackend for single node deployments, tests and benchmarks, with no database at all.
+        Every room is a directory under root_path/rooms with a room.json metadata file and a RoomLog of its messages.
+            Room lists, user lists and users are JSON documents under root_path/lists and root_path/users.
+            The catalog of a room list is a directory of one JSON entry per room under root_path/lists.
+            The read cursors of an alias are one JSON document under root_path/cursors,
+                the archive of a room is a file of one JSON batch per line under root_path/archive.
+        NOTE: the catalog versions are checked under a lock of this process, so the files are meant for one process
+        NOTE: appends are sequential writes and range reads are slices of memory mapped segments
+    """
+    def __init__(self, root_path: str = DEFAULT_SEGMENT_PATH) -> None:
+        self.__root_path = root_path
+        self.__room_logs = dict()
+        self.__room_logs_lock = threading.Lock()
+        self.__catalog_lock = threading.Lock()
+        self.__cursors_lock = threading.Lock()
+        self.__archive_lock = threading.Lock()
+        for directory_name in ('rooms', 'lists', 'users', 'cursors', 'archive'):
+            os.makedirs(os.path.join(self.__root_path, directory_name), exist_ok = True)
+
+    def __path(self, directory_name: str, name: str, suffix: str = '') -> str:
+        ''' This is a helper method to build the path of a file or directory named after a room, list or alias
+        '''
+        return os.path.join(self.__root_path, directory_name, quote(name, safe = '') + suffix)
+
+    def __read_document(self, document_path: str) -> dict:
+        ''' This is a helper method to read a JSON document, or None if there is no file
+        '''
+        if not os.path.isfile(document_path):
+            return None
+        with open(document_path, encoding = BYTE_to_STRING) as document_file:
+            return json_util.loads(document_file.read())
+
+    def __write_document(self, document_path: str, document: dict) -> None:
+        ''' This is a helper method to replace a JSON document atomically (write a temporary file, then rename it)
+        '''
+        temporary_path = document_path + '.tmp'
+        with open(temporary_path, 'w', encoding = BYTE_to_STRING) as document_file:
+            document_file.write(json_util.dumps(document))
+        os.replace(temporary_path, document_path)
+
+    def __room_log(self, room_name: str) -> RoomLog:
+        ''' This is a helper method to return the RoomLog of room_name, opening it the first time
+        '''
+        with self.__room_logs_lock:
+            if room_name not in self.__room_logs:
+                self.__room_logs[room_name] = RoomLog(self.__path('rooms', room_name))
+            return self.__room_logs[room_name]
+
+    def __room_document_path(self, room_name: str) -> str:
+        return os.path.join(self.__path('rooms', room_name), ROOM_DOCUMENT_FILE)
+
+    def open_room(self, room_name: str) -> None:
+        self.__room_log(room_name)
+
+    def room_exists(self, room_name: str) -> bool:
+        return os.path.isfile(self.__room_document_path(room_name))
+
+    def load_room(self, room_name: str) -> dict:
+        return self.__read_document(self.__room_document_path(room_name))
+
+    def insert_room(self, room_metadata: dict) -> bool:
+        with self.__room_log(room_metadata['room_name']).lock:
+            if self.room_exists(room_metadata['room_name']) is True:
+                return False
+            self.__write_document(self.__room_document_path(room_metadata['room_name']), room_metadata)
+            return True
+
+    def update_room(self, room_name: str, set_fields: dict = None, add_members: list = None, remove_members: list = None) -> None:
+        with self.__room_log(room_name).lock:
+            room_metadata = self.load_room(room_name)
+            if room_metadata is None:
+                return
+            room_metadata.update(set_fields or {})
+            member_list = [current_member for current_member in room_metadata.get('member_list', []) if current_member not in (remove_members or [])]
+            member_list.extend(current_member for current_member in (add_members or []) if current_member not in member_list)
+            room_metadata['member_list'] = member_list
+            self.__write_document(self.__room_document_path(room_name), room_metadata)
+
+    def drop_room(self, room_name: str) -> None:
+        with self.__room_logs_lock:
+            dropped_room_log = self.__room_logs.pop(room_name, None)
+        if dropped_room_log is not None:
+            dropped_room_log.close()
+        shutil.rmtree(self.__path('rooms', room_name), ignore_errors = True)
+
+    def next_sequence_num(self, room_name: str, count: int = 1) -> int:
+        return self.__room_log(room_name).reserve(count)
+
+    def insert_messages(self, room_name: str, messages: list) -> list:
+        return self.__room_log(room_name).append(messages)
+
+    def load_messages(self, room_name: str):
+        return self.__room_log(room_name).read(EMPTY, SEQUENCE_NUM_MAX)
+
+    def read_messages(self, room_name: str, first_sequence_num: int, last_sequence_num: int) -> list:
+        return list(self.__room_log(room_name).read(first_sequence_num, last_sequence_num))
+
+    def update_message(self, room_name: str, sequence_num: int, set_fields: dict) -> bool:
+        return self.__room_log(room_name).update(sequence_num, set_fields)
+
+    def delete_messages(self, room_name: str, sequence_nums: list) -> int:
+        return self.__room_log(room_name).delete(sequence_nums)
+
+    def load_room_list(self, list_name: str) -> dict:
+        return self.__read_document(self.__path('lists', 'room_' + list_name, '.json'))
+
+    def save_room_list(self, room_list_document: dict) -> None:
+        self.__write_document(self.__path('lists', 'room_' + room_list_document['list_name'], '.json'), room_list_document)
+
+    def __catalog_entry_path(self, list_name: str, room_name: str) -> str:
+        catalog_path = self.__path('lists', 'catalog_' + list_name)
+        os.makedirs(catalog_path, exist_ok = True)
+        return os.path.join(catalog_path, quote(room_name, safe = '') + '.json')
+
+    def load_catalog(self, list_name: str) -> list:
+        catalog_path = self.__path('lists', 'catalog_' + list_name)
+        if not os.path.isdir(catalog_path):
+            return []
+        return [self.__read_document(os.path.join(catalog_path, entry_name)) for entry_name in sorted(os.listdir(catalog_path)) if entry_name.endswith('.json')]
+
+    def load_catalog_entry(self, list_name: str, room_name: str) -> dict:
+        return self.__read_document(self.__catalog_entry_path(list_name, room_name))
+
+    def insert_catalog_entry(self, list_name: str, catalog_entry: dict) -> bool:
+        with self.__catalog_lock:
+            entry_path = self.__catalog_entry_path(list_name, catalog_entry['room_name'])
+            if os.path.isfile(entry_path):
+                return False
+            self.__write_document(entry_path, catalog_entry)
+            return True
+
+    def update_catalog_entry(self, list_name: str, room_name: str, version: int, set_fields: dict = None, add_members: list = None, remove_members: list = None) -> bool:
+        with self.__catalog_lock:
+            entry_path = self.__catalog_entry_path(list_name, room_name)
+            catalog_entry = self.__read_document(entry_path)
+            if catalog_entry is None or catalog_entry.get('version') != version:
+                return False
+            catalog_entry.update(set_fields or {})
+            member_list = [current_member for current_member in catalog_entry.get('member_list', []) if current_member not in (remove_members or [])]
+            member_list.extend(current_member for current_member in (add_members or []) if current_member not in member_list)
+            catalog_entry['member_list'] = member_list
+            catalog_entry['version'] = version + 1
+            self.__write_document(entry_path, catalog_entry)
+            return True
+
+    def delete_catalog_entry(self, list_name: str, room_name: str) -> bool:
+        with self.__catalog_lock:
+            entry_path = self.__catalog_entry_path(list_name, room_name)
+            if not os.path.isfile(entry_path):
+                return False
+            os.remove(entry_path)
+            return True
+
+    def load_user_list(self, list_name: str) -> dict:
+        return self.__read_document(self.__path('lists', 'user_' + list_name, '.json'))
+
+    def save_user_list(self, user_list_document: dict) -> None:
+        self.__write_document(self.__path('lists', 'user_' + user_list_document['list_name'], '.json'), user_list_document)
+
+    def load_users(self, aliases: list) -> list:
+        users = list()
+        for alias in aliases:
+            user_document = self.__read_document(self.__path('users', alias, '.json'))
+            if user_document is not None:
+                user_document['_id'] = alias
+                users.append(user_document)
+        return users
+
+    def insert_user(self, user_document: dict):
+        self.__write_document(self.__path('users', user_document['alias'], '.json'), user_document)
+        return user_document['alias']
+
+    def delete_user(self, alias: str) -> bool:
+        user_path = self.__path('users', alias, '.json')
+        if not os.path.isfile(user_path):
+            return False
+        os.remove(user_path)
+        return True
+
+    def load_read_cursors(self, alias: str) -> list:
+        cursors_document = self.__read_document(self.__path('cursors', alias, '.json'))
+        if cursors_document is None:
+            return []
+        return [{ 'alias': alias, 'room_name': room_name, 'last_read': last_read } for room_name, last_read in cursors_document['rooms']]
+
+    def save_read_cursors(self, cursors: list) -> None:
+        ''' NOTE: the cursors of each alias are merged into its document, keeping the highest last_read of every room
+        '''
+        cursors_by_alias = dict()
+        for current_cursor in cursors:
+            cursors_by_alias.setdefault(current_cursor['alias'], list()).append(current_cursor)
+        with self.__cursors_lock:
+            for alias, alias_cursors in cursors_by_alias.items():
+                last_reads = { current_cursor['room_name']: current_cursor['last_read'] for current_cursor in self.load_read_cursors(alias) }
+                for current_cursor in alias_cursors:
+                    last_reads[current_cursor['room_name']] = max(last_reads.get(current_cursor['room_name'], EMPTY), current_cursor['last_read'])
+                self.__write_document(self.__path('cursors', alias, '.json'), { 'alias': alias, 'rooms': [[room_name, last_read] for room_name, last_read in last_reads.items()] })
+
+    def insert_archive_batch(self, batch_document: dict) -> None:
+        with self.__archive_lock:
+            with open(self.__path('archive', batch_document['room_name'], '.ndjson'), 'a', encoding = BYTE_to_STRING) as archive_file:
+                archive_file.write(json_util.dumps(batch_document) + '\n')
+
+    def load_archive_batches(self, room_name: str) -> list:
+        archive_path = self.__path('archive', room_name, '.ndjson')
+        if not os.path.isfile(archive_path):
+            return []
+        with open(archive_path, encoding = BYTE_to_STRING) as archive_file:
+            return sorted((json_util.loads(current_line) for current_line in archive_file if current_line.strip()), key = lambda current_batch: current_batch['first_sequence_num'])
+
+    def close(self) -> None:
+        ''' This method will close every open room log
+        '''
+        with self.__room_logs_lock:
+            for current_room_log in self.__room_logs.values():
+                current_room_log.close()
@@ -0,0 +1,145 @@
+import os
+import time
+import logging
+import threading
+from bson import json_util
+from constants import *
+
+logging.basicConfig(filename='message_chat.log', level=logging.DEBUG, format = LOG_FORMAT)
+
+class StorageUnavailable(Exception):
+    """ Raised instead of calling storage while the circuit breaker is open.
+    """
+
+class CircuitBreaker():
+    """ Class for not calling storage while it is failing: after failure_threshold failures in a row the breaker opens,
+            calls are refused right away for reset_seconds, then one trial call is let through (half open).
+        NOTE: the trial closes the breaker again if it works, and opens it for another reset_seconds if it does not
+    """
+    def __init__(self, failure_threshold: int = STORAGE_FAILURE_THRESHOLD, reset_seconds: float = STORAGE_RESET_SECONDS) -> None:
+        self.__failure_threshold = failure_threshold
+        self.__reset_seconds = reset_seconds
+        self.__state = BREAKER_CLOSED
+        self.__num_failures = EMPTY
+        self.__opened_at = None
+        self.__num_opened = EMPTY
+        self.__lock = threading.Lock()
+
+    # property to get the state of the breaker (closed, open or half_open)
+    @property
+    def state(self):
+        return self.__state
+
+    # property to get if storage is failing (the breaker is not closed)
+    @property
+    def degraded(self):
+        return self.__state != BREAKER_CLOSED
+
+    # property to get how many times the breaker opened
+    @property
+    def num_opened(self):
+        return self.__num_opened
+
+    def allow(self) -> bool:
+        ''' This method will check if storage can be called now
+            NOTE: once reset_seconds passed since the breaker opened, only the first caller gets the trial call
+        '''
+        with self.__lock:
+            if self.__state == BREAKER_CLOSED:
+                return True
+            if self.__state == BREAKER_OPEN and time.monotonic() - self.__opened_at >= self.__reset_seconds:
+                self.__state = BREAKER_HALF_OPEN
+                logging.info('Storage circuit breaker is half open, trying storage again.')
+                return True
+            return False
+
+    def record_success(self) -> None:
+        ''' This method will close the breaker after a storage call worked
+        '''
+        with self.__lock:
+            if self.__state != BREAKER_CLOSED:
+                logging.info('Storage circuit breaker is closed, storage is working again.')
+            self.__state = BREAKER_CLOSED
+            self.__num_failures = EMPTY
+
+    def record_failure(self) -> None:
+        ''' This method will count a failed storage call, and open the breaker if there were too many in a row or the trial failed
+        '''
+        with self.__lock:
+            self.__num_failures += 1
+            if self.__state == BREAKER_HALF_OPEN or (self.__state == BREAKER_CLOSED and self.__num_failures >= self.__failure_threshold):
+                self.__state = BREAKER_OPEN
+                self.__opened_at = time.monotonic()
+                self.__num_opened += 1
+                logging.warning(f'Storage circuit breaker is open after {self.__num_failures} failures, not calling storage for {self.__reset_seconds} seconds.')
+
+class WriteAheadSpool():
+    """ Class for the local append-only file of the messages of one room that were accepted but not persisted yet.
+        Every line is a JSON record: a message that was spooled, or how many of the spooled messages were persisted since.
+        NOTE: messages are persisted in the order they were spooled, so the persisted counts always cover the oldest messages
+        NOTE: each record is flushed to the OS when it is written, so the messages are kept if the process dies
+    """
+    def __init__(self, spool_path: str) -> None:
+        self.__spool_path = spool_path
+        self.__spool_file = None
+        self.__lock = threading.Lock()
+
+    # property to get the path of the spool file
+    @property
+    def spool_path(self):
+        return self.__spool_path
+
+    def __write(self, record: dict) -> None:
+        ''' This is a helper method to append one record to the spool file, opening it the first time
+        '''
+        if self.__spool_file is None:
+            os.makedirs(os.path.dirname(self.__spool_path) or '.', exist_ok = True)
+            self.__spool_file = open(self.__spool_path, 'a', encoding = BYTE_to_STRING)
+        self.__spool_file.write(json_util.dumps(record) + '\n')
+        self.__spool_file.flush()
+
+    def append(self, message_documents: list) -> None:
+        ''' This method will append message documents (ChatMessage.to_dict()) to the spool, in order
+        '''
+        with self.__lock:
+            for current_document in message_documents:
+                self.__write({ 'message': current_document })
+        logging.debug(f'{len(message_documents)} messages were spooled to {self.__spool_path}.')
+
+    def mark_persisted(self, num_messages: int) -> None:
+        ''' This method will record that the oldest num_messages spooled messages not persisted before are persisted now
+        '''
+        with self.__lock:
+            self.__write({ 'persisted': num_messages })
+
+    def clear(self) -> None:
+        ''' This method will remove the spool file once every spooled message is persisted
+        '''
+        with self.__lock:
+            if self.__spool_file is not None:
+                self.__spool_file.close()
+                self.__spool_file = None
+            if os.path.exists(self.__spool_path):
+                os.remove(self.__spool_path)
+        logging.debug(f'Spool {self.__spool_path} was cleared.')
+
+    def load(self) -> list:
+        ''' This method will return the documents of the spooled messages that were not persisted yet, oldest first
+            NOTE: a last line cut short by a crash is skipped
+        '''
+        if not os.path.exists(self.__spool_path):
+            return []
+        message_documents = list()
+        num_persisted = EMPTY
+        with open(self.__spool_path, encoding = BYTE_to_STRING) as spool_file:
+            for current_line in spool_file:
+                try:
+                    record = json_util.loads(current_line)
+                except ValueError:
+                    logging.warning(f'Skipping a broken record of {self.__spool_path}.')
+                    continue
+                if 'message' in record:
+                    message_documents.append(record['message'])
+                else:
+                    num_persisted += record['persisted']
+        return message_documents[num_persisted:]
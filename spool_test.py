@@ -0,0 +1,70 @@
+import os
+import shutil
+import tempfile
+import unittest
+from constants import *
+from spool import CircuitBreaker, WriteAheadSpool
+
+class CircuitBreakerTest(unittest.TestCase):
+    """ This test environment will test the circuit breaker kept around storage
+    """
+    def test_open_and_close(self):
+        ''' The breaker should open after the failures in a row, refuse calls, then close after a trial that works
+        '''
+        breaker = CircuitBreaker(failure_threshold = 2, reset_seconds = 0)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, BREAKER_CLOSED)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, BREAKER_OPEN)
+        self.assertTrue(breaker.degraded)
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.state, BREAKER_HALF_OPEN)
+        self.assertFalse(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, BREAKER_CLOSED)
+        self.assertEqual(breaker.num_opened, 1)
+
+    def test_failed_trial(self):
+        ''' A failed trial should open the breaker again, and calls should be refused until reset_seconds pass
+        '''
+        breaker = CircuitBreaker(failure_threshold = 1, reset_seconds = 60)
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+        breaker = CircuitBreaker(failure_threshold = 1, reset_seconds = 0)
+        breaker.record_failure()
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, BREAKER_OPEN)
+        self.assertEqual(breaker.num_opened, 2)
+
+class WriteAheadSpoolTest(unittest.TestCase):
+    """ This test environment will test the spool files of the messages waiting to be persisted
+    """
+    def setUp(self) -> None:
+        self.__spool_dir = tempfile.mkdtemp()
+        self.__spool = WriteAheadSpool(spool_path = os.path.join(self.__spool_dir, DEFAULT_TEST_ROOM + SPOOL_SUFFIX))
+
+    def tearDown(self) -> None:
+        self.__spool.clear()
+        shutil.rmtree(self.__spool_dir)
+
+    def test_persisted_counts(self):
+        ''' Only the spooled messages past the persisted counts should be loaded, in order
+        '''
+        self.__spool.append([{ 'message': f'{DEFAULT_PUBLIC_TEST_MESSAGE} {message_num}' } for message_num in range(5)])
+        self.__spool.mark_persisted(2)
+        self.__spool.append([{ 'message': f'{DEFAULT_PUBLIC_TEST_MESSAGE} 5' }])
+        self.__spool.mark_persisted(1)
+        self.assertEqual([current_document['message'] for current_document in self.__spool.load()],
+                         [f'{DEFAULT_PUBLIC_TEST_MESSAGE} {message_num}' for message_num in range(3, 6)])
+        self.__spool.clear()
+        self.assertFalse(os.path.exists(self.__spool.spool_path))
+        self.assertEqual(self.__spool.load(), [])
+
+    def test_torn_record(self):
+        ''' A last record cut short by a crash should be skipped
+        '''
+        self.__spool.append([{ 'message': DEFAULT_PUBLIC_TEST_MESSAGE }])
+        with open(self.__spool.spool_path, 'a', encoding = BYTE_to_STRING) as spool_file:
+            spool_file.write('{"message": {"mess')
+        self.assertEqual(self.__spool.load(), [{ 'message': DEFAULT_PUBLIC_TEST_MESSAGE }])
@@ -0,0 +1,351 @@
+import os
+import logging
+from constants import *
+from pymongo import MongoClient, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+logging.basicConfig(filename='message_chat.log', level=logging.DEBUG, format = LOG_FORMAT)
+
+class StorageBackend():
+    """ Interface for where ChatRoom, RoomList and UserList keep their data.
+        NOTE: documents are plain dictionaries, the same ones the classes used to write to mongo directly
+        NOTE: every method here raises NotImplementedError, a backend has to implement all of them
+    """
+    # room metadata
+    def open_room(self, room_name: str) -> None:
+        ''' This method will prepare the storage of a room (collections, indexes, files) before it is used
+        '''
+        raise NotImplementedError
+
+    def room_exists(self, room_name: str) -> bool:
+        ''' This method will return True if the metadata of room_name was stored before
+        '''
+        raise NotImplementedError
+
+    def load_room(self, room_name: str) -> dict:
+        ''' This method will return the metadata document of room_name, or None if there is none
+        '''
+        raise NotImplementedError
+
+    def insert_room(self, room_metadata: dict) -> bool:
+        ''' This method will store the metadata document of a new room and return True, or False if the room already has one
+            NOTE: an existing metadata document is never overwritten
+        '''
+        raise NotImplementedError
+
+    def update_room(self, room_name: str, set_fields: dict = None, add_members: list = None, remove_members: list = None) -> None:
+        ''' This method will change only the given fields and members of the metadata document of room_name
+        '''
+        raise NotImplementedError
+
+    def drop_room(self, room_name: str) -> None:
+        ''' This method will remove the metadata, messages and sequence counter of room_name, as if it was never stored
+        '''
+        raise NotImplementedError
+
+    # messages of a room
+    def next_sequence_num(self, room_name: str, count: int = 1) -> int:
+        ''' This method will reserve count sequence numbers for room_name and return the last one of them
+        '''
+        raise NotImplementedError
+
+    def insert_messages(self, room_name: str, messages: list) -> list:
+        ''' This method will store message documents of room_name, in order, and return their ids
+            NOTE: a message with the client_message_id of a stored message of the room is not stored, its id is None
+        '''
+        raise NotImplementedError
+
+    def load_messages(self, room_name: str):
+        ''' This method will iterate over every stored message document of room_name, oldest first, each with an '_id'
+        '''
+        raise NotImplementedError
+
+    def read_messages(self, room_name: str, first_sequence_num: int, last_sequence_num: int) -> list:
+        ''' This method will return the message documents of room_name with a sequence number from first to last (both included)
+        '''
+        raise NotImplementedError
+
+    def update_message(self, room_name: str, sequence_num: int, set_fields: dict) -> bool:
+        ''' This method will change the given top level fields of the message of room_name with sequence_num and return True if there is one
+        '''
+        raise NotImplementedError
+
+    def delete_messages(self, room_name: str, sequence_nums: list) -> int:
+        ''' This method will delete the messages of room_name with the given sequence numbers and return how many were deleted
+        '''
+        raise NotImplementedError
+
+    # room lists
+    def load_room_list(self, list_name: str) -> dict:
+        ''' This method will return the document of the room list list_name, or None if there is none
+        '''
+        raise NotImplementedError
+
+    def save_room_list(self, room_list_document: dict) -> None:
+        ''' This method will replace (or insert) the document of a room list, found by its list_name
+        '''
+        raise NotImplementedError
+
+    # room catalogs, one entry document per room of a room list, each with a version
+    def load_catalog(self, list_name: str) -> list:
+        ''' This method will return every catalog entry of the room list list_name
+        '''
+        raise NotImplementedError
+
+    def load_catalog_entry(self, list_name: str, room_name: str) -> dict:
+        ''' This method will return the catalog entry of room_name in the room list list_name, or None if there is none
+        '''
+        raise NotImplementedError
+
+    def insert_catalog_entry(self, list_name: str, catalog_entry: dict) -> bool:
+        ''' This method will store a new catalog entry and return False if the room list already has an entry for that room
+        '''
+        raise NotImplementedError
+
+    def update_catalog_entry(self, list_name: str, room_name: str, version: int, set_fields: dict = None, add_members: list = None, remove_members: list = None) -> bool:
+        ''' This method will change the given fields and members of a catalog entry and add one to its version,
+                only if the entry is still at version, and return False if it is not (someone else changed it first)
+        '''
+        raise NotImplementedError
+
+    def delete_catalog_entry(self, list_name: str, room_name: str) -> bool:
+        ''' This method will delete the catalog entry of room_name and return True if there was one
+        '''
+        raise NotImplementedError
+
+    # user lists and users
+    def load_user_list(self, list_name: str) -> dict:
+        ''' This method will return the document of the user list list_name, or None if there is none
+        '''
+        raise NotImplementedError
+
+    def save_user_list(self, user_list_document: dict) -> None:
+        ''' This method will replace (or insert) the document of a user list, found by its list_name
+        '''
+        raise NotImplementedError
+
+    def load_users(self, aliases: list) -> list:
+        ''' This method will return the user documents of the given aliases that exist, each with an '_id'
+        '''
+        raise NotImplementedError
+
+    def insert_user(self, user_document: dict):
+        ''' This method will store a new user document and return its id
+        '''
+        raise NotImplementedError
+
+    def delete_user(self, alias: str) -> bool:
+        ''' This method will delete the user document of alias and return True if there was one
+        '''
+        raise NotImplementedError
+
+    # read cursors, the last read sequence number of an alias in a room
+    def load_read_cursors(self, alias: str) -> list:
+        ''' This method will return the cursor documents (alias, room_name, last_read) of alias
+        '''
+        raise NotImplementedError
+
+    def save_read_cursors(self, cursors: list) -> None:
+        ''' This method will store cursor documents (alias, room_name, last_read), a stored cursor never moves backwards
+        '''
+        raise NotImplementedError
+
+    # archive, compressed batches of the messages that expired out of their rooms
+    def insert_archive_batch(self, batch_document: dict) -> None:
+        ''' This method will store one archive batch document of a room
+        '''
+        raise NotImplementedError
+
+    def load_archive_batches(self, room_name: str) -> list:
+        ''' This method will return the archive batch documents of room_name, oldest batch (lowest first_sequence_num) first
+        '''
+        raise NotImplementedError
+
+class MongoBackend(StorageBackend):
+    """ StorageBackend keeping everything in MongoDB, through one shared client (and connection pool).
+        NOTE: the collections are the same ones the classes used before: a collection per room plus the "sequence" collection
+                in the test database, and the room and user lists in the list database
+    """
+    def __init__(self) -> None:
+        self.__mongo_client = MongoClient(host = MONGO_DB_HOST, port = MONGO_DB_PORT, username = MONGO_DB_USER, password = MONGO_DB_PASS, authSource = MONGO_DB_AUTH_SOURCE, authMechanism = MONGO_DB_AUTH_MECHANISM,
+                                        serverSelectionTimeoutMS = STORAGE_TIMEOUT_MS, socketTimeoutMS = STORAGE_TIMEOUT_MS)
+        self.__room_db = self.__mongo_client.get_database(MONGO_DB_TEST)
+        self.__list_db = self.__mongo_client.get_database(MONGO_DB_LIST_DB)
+        self.__seq_collection = self.__room_db.get_collection('sequence')
+        self.__user_collection = self.__list_db.get_collection(MONGO_DB_CLASS_USERS)
+        self.__indexed_catalogs = set()
+        # the read cursors and archive are in their own database, with their indexes made the first time they are used
+        self.__app_db = self.__mongo_client.get_database(MONGO_DB)
+        self.__indexed_collections = set()
+
+    def open_room(self, room_name: str) -> None:
+        room_collection = self.__room_db.get_collection(room_name)
+        room_collection.create_index([('mess_props.to_user', 1), ('mess_props.sequence_num', -1)], sparse = True)
+        room_collection.create_index('mess_props.sequence_num', sparse = True)
+        room_collection.create_index('mess_props.client_message_id', unique = True, sparse = True)
+
+    def room_exists(self, room_name: str) -> bool:
+        return self.load_room(room_name) is not None
+
+    def load_room(self, room_name: str) -> dict:
+        return self.__room_db.get_collection(room_name).find_one({ 'room_name': room_name })
+
+    def insert_room(self, room_metadata: dict) -> bool:
+        ''' NOTE: the upsert only sets the fields when it inserts, so a document stored first by another worker is left as it is
+        '''
+        return self.__room_db.get_collection(room_metadata['room_name']).update_one({ 'room_name': room_metadata['room_name'] },
+                                                                                     { '$setOnInsert': dict(room_metadata) }, upsert = True).upserted_id is not None
+
+    def update_room(self, room_name: str, set_fields: dict = None, add_members: list = None, remove_members: list = None) -> None:
+        room_update = dict()
+        if set_fields:
+            room_update['$set'] = set_fields
+        if add_members:
+            room_update['$addToSet'] = { 'member_list': { '$each': add_members }}
+        if remove_members:
+            room_update['$pull'] = { 'member_list': { '$in': remove_members }}
+        if room_update:
+            self.__room_db.get_collection(room_name).update_one({ 'room_name': room_name }, room_update)
+
+    def drop_room(self, room_name: str) -> None:
+        self.__room_db.drop_collection(room_name)
+        self.__seq_collection.update_one({'_id': 'userid'}, {'$unset': {room_name: ''}})
+
+    def next_sequence_num(self, room_name: str, count: int = 1) -> int:
+        sequence_num = self.__seq_collection.find_one_and_update({'_id': 'userid'},
+                                                                {'$inc': {room_name: count}},
+                                                                projection={room_name: True, '_id': False},
+                                                                upsert=True,
+                                                                return_document=ReturnDocument.AFTER)
+        return sequence_num[room_name]
+
+    def insert_messages(self, room_name: str, messages: list) -> list:
+        ''' NOTE: the insert is unordered so a duplicate client_message_id only rejects its own message, any other error is raised
+        '''
+        try:
+            return self.__room_db.get_collection(room_name).insert_many(messages, ordered = False).inserted_ids
+        except BulkWriteError as bulk_error:
+            write_errors = bulk_error.details.get('writeErrors', [])
+            if bulk_error.details.get('writeConcernErrors') or any(current_error['code'] != DUPLICATE_KEY_ERROR for current_error in write_errors):
+                raise
+            duplicate_positions = {current_error['index'] for current_error in write_errors}
+            logging.debug(f'{len(duplicate_positions)} messages of {room_name} were already stored.')
+            return [None if position in duplicate_positions else current_message['_id'] for position, current_message in enumerate(messages)]
+
+    def load_messages(self, room_name: str):
+        return self.__room_db.get_collection(room_name).find({'message': {'$exists': 'true'}}).sort('mess_props.sequence_num', 1)
+
+    def read_messages(self, room_name: str, first_sequence_num: int, last_sequence_num: int) -> list:
+        return list(self.__room_db.get_collection(room_name).find({ 'message': { '$exists': True },
+                                                                     'mess_props.sequence_num': { '$gte': first_sequence_num, '$lte': last_sequence_num }})
+                                                              .sort('mess_props.sequence_num', 1))
+
+    def update_message(self, room_name: str, sequence_num: int, set_fields: dict) -> bool:
+        return self.__room_db.get_collection(room_name).update_one({ 'message': { '$exists': True },
+                                                                      'mess_props.sequence_num': sequence_num }, { '$set': set_fields }).matched_count > EMPTY
+
+    def delete_messages(self, room_name: str, sequence_nums: list) -> int:
+        return self.__room_db.get_collection(room_name).delete_many({ 'message': { '$exists': True },
+                                                                       'mess_props.sequence_num': { '$in': sequence_nums }}).deleted_count
+
+    def load_room_list(self, list_name: str) -> dict:
+        return self.__list_db.get_collection(list_name).find_one({ 'list_name': list_name })
+
+    def save_room_list(self, room_list_document: dict) -> None:
+        self.__list_db.get_collection(room_list_document['list_name']).replace_one({ 'list_name': room_list_document['list_name'] }, room_list_document, upsert = True)
+
+    def __catalog(self, list_name: str):
+        ''' This is a helper method to return the catalog collection of a room list, with its unique index on room_name
+        '''
+        catalog_collection = self.__list_db.get_collection(list_name + CATALOG_SUFFIX)
+        if list_name not in self.__indexed_catalogs:
+            catalog_collection.create_index('room_name', unique = True)
+            self.__indexed_catalogs.add(list_name)
+        return catalog_collection
+
+    def load_catalog(self, list_name: str) -> list:
+        return list(self.__catalog(list_name).find())
+
+    def load_catalog_entry(self, list_name: str, room_name: str) -> dict:
+        return self.__catalog(list_name).find_one({ 'room_name': room_name })
+
+    def insert_catalog_entry(self, list_name: str, catalog_entry: dict) -> bool:
+        try:
+            self.__catalog(list_name).insert_one(dict(catalog_entry))
+        except DuplicateKeyError:
+            return False
+        return True
+
+    def update_catalog_entry(self, list_name: str, room_name: str, version: int, set_fields: dict = None, add_members: list = None, remove_members: list = None) -> bool:
+        ''' NOTE: the version in the filter makes the update optimistic, a concurrent writer makes it match nothing
+            NOTE: members can not be added and removed in the same update, mongo refuses two operators on member_list
+        '''
+        entry_update = { '$inc': { 'version': 1 }}
+        if set_fields:
+            entry_update['$set'] = set_fields
+        if add_members:
+            entry_update['$addToSet'] = { 'member_list': { '$each': add_members }}
+        if remove_members:
+            entry_update['$pull'] = { 'member_list': { '$in': remove_members }}
+        return self.__catalog(list_name).update_one({ 'room_name': room_name, 'version': version }, entry_update).modified_count > EMPTY
+
+    def delete_catalog_entry(self, list_name: str, room_name: str) -> bool:
+        return self.__catalog(list_name).delete_one({ 'room_name': room_name }).deleted_count > EMPTY
+
+    def load_user_list(self, list_name: str) -> dict:
+        return self.__user_collection.find_one({ 'list_name': list_name })
+
+    def save_user_list(self, user_list_document: dict) -> None:
+        self.__user_collection.replace_one({ 'list_name': user_list_document['list_name'] }, user_list_document, upsert = True)
+
+    def load_users(self, aliases: list) -> list:
+        return list(self.__user_collection.find({ 'alias': { '$in': aliases }}))
+
+    def insert_user(self, user_document: dict):
+        return self.__user_collection.insert_one(dict(user_document)).inserted_id
+
+    def delete_user(self, alias: str) -> bool:
+        return self.__user_collection.delete_one({ 'alias': alias }).deleted_count > EMPTY
+
+    def __indexed(self, collection_name: str, index_keys: list, unique: bool = False):
+        ''' This is a helper method to return a collection of the app database, with its index made the first time it is asked for
+        '''
+        app_collection = self.__app_db.get_collection(collection_name)
+        if collection_name not in self.__indexed_collections:
+            app_collection.create_index(index_keys, unique = unique)
+            self.__indexed_collections.add(collection_name)
+        return app_collection
+
+    def load_read_cursors(self, alias: str) -> list:
+        return list(self.__indexed(MONGO_DB_READ_CURSORS, [('alias', 1), ('room_name', 1)], unique = True).find({ 'alias': alias }))
+
+    def save_read_cursors(self, cursors: list) -> None:
+        ''' NOTE: $max is used so a slower writer can never move a stored cursor backwards, the writes go in one unordered bulk write
+        '''
+        cursor_updates = [UpdateOne({ 'alias': current_cursor['alias'], 'room_name': current_cursor['room_name'] },
+                                    { '$max': { 'last_read': current_cursor['last_read'] }},
+                                    upsert = True) for current_cursor in cursors]
+        if cursor_updates:
+            self.__indexed(MONGO_DB_READ_CURSORS, [('alias', 1), ('room_name', 1)], unique = True).bulk_write(cursor_updates, ordered = False)
+
+    def insert_archive_batch(self, batch_document: dict) -> None:
+        self.__indexed(MONGO_DB_ARCHIVE, [('room_name', 1), ('first_sequence_num', 1)]).insert_one(dict(batch_document))
+
+    def load_archive_batches(self, room_name: str) -> list:
+        return list(self.__indexed(MONGO_DB_ARCHIVE, [('room_name', 1), ('first_sequence_num', 1)]).find({ 'room_name': room_name }).sort('first_sequence_num', 1))
+
+default_storage_backend = None
+
+def get_default_backend() -> StorageBackend:
+    ''' This function will return the process-wide StorageBackend, creating it the first time it is asked for
+        NOTE: CHAT_STORAGE_BACKEND picks the backend ("mongo" by default, or "segment"), CHAT_STORAGE_PATH is where the segment backend keeps its files
+    '''
+    global default_storage_backend
+    if default_storage_backend is None:
+        if os.environ.get(STORAGE_BACKEND_ENV, STORAGE_BACKEND_MONGO) == STORAGE_BACKEND_SEGMENT:
+            from segment_storage import SegmentLogBackend
+            default_storage_backend = SegmentLogBackend(root_path = os.environ.get(STORAGE_PATH_ENV, DEFAULT_SEGMENT_PATH))
+        else:
+            default_storage_backend = MongoBackend()
+        logging.info(f'Using {type(default_storage_backend).__name__} for storage.')
+    return default_storage_backend
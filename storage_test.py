@@ -0,0 +1,617 @@
+import os
+import gzip
+import asyncio
+import json
+import room
+import storage
+import room_chat_api
+import time
+import shutil
+import tempfile
+import unittest
+import threading
+from datetime import datetime
+from urllib.parse import quote
+from concurrent.futures import ThreadPoolExecutor
+from constants import *
+from room import ChatRoom, InboxIndex, MessageProperties, RoomList
+from users import UserList
+from segment_storage import SegmentLogBackend
+from archive import MessageArchive
+from spool import CircuitBreaker, StorageUnavailable
+from cursors import ReadCursors
+from fastapi.testclient import TestClient
+
+class FlakyBackend(SegmentLogBackend):
+    """ SegmentLogBackend that fails to reserve sequence numbers, insert messages and update rooms or messages while failing is True, like a database that is down
+    """
+    failing = False
+
+    def next_sequence_num(self, room_name: str, count: int = 1) -> int:
+        if self.failing is True:
+            raise ConnectionError('Storage is down.')
+        return super().next_sequence_num(room_name, count = count)
+
+    def insert_messages(self, room_name: str, message_documents: list) -> list:
+        if self.failing is True:
+            raise ConnectionError('Storage is down.')
+        return super().insert_messages(room_name, message_documents)
+
+    def update_message(self, room_name: str, sequence_num: int, set_fields: dict) -> None:
+        if self.failing is True:
+            raise ConnectionError('Storage is down.')
+        return super().update_message(room_name, sequence_num, set_fields)
+
+    def update_room(self, room_name: str, set_fields: dict = None, add_members: list = None, remove_members: list = None) -> None:
+        if self.failing is True:
+            raise ConnectionError('Storage is down.')
+        return super().update_room(room_name, set_fields = set_fields, add_members = add_members, remove_members = remove_members)
+
+class FailingArchive(MessageArchive):
+    """ MessageArchive that can not store anything, like an archive collection that is down
+    """
+    def store(self, room_name: str, messages: list) -> int:
+        raise ConnectionError('The archive is down.')
+
+def unreachable_mongo_client(*args, **kwargs):
+    ''' MongoClient stand-in for a deployment without mongo, making a client fails the test
+    '''
+    raise AssertionError('A mongo client was made with the segment backend.')
+
+class SegmentStorageTest(unittest.TestCase):
+    """ This test environment will test the segment log storage backend in a temporary directory, without mongo
+    """
+    def setUp(self) -> None:
+        ''' This setup method will make a backend in an empty temporary directory
+        '''
+        self.__root_path = tempfile.mkdtemp()
+        self.__backend = SegmentLogBackend(root_path = self.__root_path)
+
+    def tearDown(self) -> None:
+        self.__backend.close()
+        shutil.rmtree(self.__root_path)
+
+    def __message(self, sequence_num: int) -> dict:
+        ''' This is a helper method to build a message document with the given sequence number
+        '''
+        return { 'message': f'{DEFAULT_PUBLIC_TEST_MESSAGE} {sequence_num}',
+                 'mess_props': MessageProperties(room_name = DEFAULT_TEST_ROOM,
+                                                to_user = TEST_OWNER_ALIAS,
+                                                from_user = TEST_OWNER_ALIAS,
+                                                mess_type = PUBLIC_MESSAGE,
+                                                sequence_num = sequence_num,
+                                                sent_time = datetime(2022, 3, 1),
+                                                rec_time = datetime(2022, 3, 1)).to_dict() }
+
+    def __send_deferred(self, chat_room: ChatRoom, message: str) -> None:
+        ''' This is a helper method to send a public message from the owner without persisting it
+        '''
+        self.assertTrue(chat_room.send_message(message = message,
+                                    from_alias = TEST_OWNER_ALIAS,
+                                    mess_props = MessageProperties(room_name = chat_room.room_name,
+                                                                to_user = TEST_OWNER_ALIAS,
+                                                                from_user = TEST_OWNER_ALIAS,
+                                                                mess_type = PUBLIC_MESSAGE),
+                                    defer_persist = True))
+
+    def test_append_and_read(self):
+        ''' Appended messages should come back in order, by range, and after reopening the backend
+        '''
+        last_sequence_num = self.__backend.next_sequence_num(DEFAULT_TEST_ROOM, count = 200)
+        self.assertEqual(last_sequence_num, 200)
+        self.__backend.insert_messages(DEFAULT_TEST_ROOM, [self.__message(sequence_num) for sequence_num in range(1, 201)])
+        range_messages = self.__backend.read_messages(DEFAULT_TEST_ROOM, 70, 75)
+        self.assertEqual([current_message['mess_props']['sequence_num'] for current_message in range_messages], list(range(70, 76)))
+        self.assertEqual(range_messages[0]['mess_props']['sent_time'], datetime(2022, 3, 1))
+        self.__backend.close()
+        reopened_backend = SegmentLogBackend(root_path = self.__root_path)
+        self.assertEqual(len(list(reopened_backend.load_messages(DEFAULT_TEST_ROOM))), 200)
+        self.assertEqual(reopened_backend.next_sequence_num(DEFAULT_TEST_ROOM), 201)
+        reopened_backend.close()
+
+    def test_delete(self):
+        ''' Deleted messages should not be read back, even after reopening the backend
+        '''
+        self.__backend.insert_messages(DEFAULT_TEST_ROOM, [self.__message(sequence_num) for sequence_num in range(1, 11)])
+        self.assertEqual(self.__backend.delete_messages(DEFAULT_TEST_ROOM, [2, 3, 3, 42]), 2)
+        self.__backend.close()
+        reopened_backend = SegmentLogBackend(root_path = self.__root_path)
+        self.assertEqual([current_message['_id'] for current_message in reopened_backend.read_messages(DEFAULT_TEST_ROOM, 1, 5)], [1, 4, 5])
+        reopened_backend.close()
+
+    def test_duplicate_client_message_id(self):
+        ''' A message with the client_message_id of a stored message should not be appended, even after reopening the backend
+        '''
+        first_message = self.__message(1)
+        first_message['mess_props']['client_message_id'] = TEST_CLIENT_MESSAGE_ID
+        self.assertEqual(self.__backend.insert_messages(DEFAULT_TEST_ROOM, [first_message]), [1])
+        self.__backend.close()
+        reopened_backend = SegmentLogBackend(root_path = self.__root_path)
+        retried_message = self.__message(2)
+        retried_message['mess_props']['client_message_id'] = TEST_CLIENT_MESSAGE_ID
+        self.assertEqual(reopened_backend.insert_messages(DEFAULT_TEST_ROOM, [retried_message, self.__message(3)]), [None, 3])
+        self.assertEqual(len(reopened_backend.read_messages(DEFAULT_TEST_ROOM, 1, 3)), 2)
+        reopened_backend.close()
+
+    def test_idempotent_send(self):
+        ''' Sending the same client_message_id twice should keep and store one message
+        '''
+        chat_room = ChatRoom(room_name = DEFAULT_TEST_ROOM, owner_alias = TEST_OWNER_ALIAS, create_new = True, backend = self.__backend)
+        for _ in range(2):
+            self.assertTrue(chat_room.send_message(message = DEFAULT_FULL_CASE_TEST_MESSAGE,
+                                        from_alias = TEST_OWNER_ALIAS,
+                                        mess_props = MessageProperties(room_name = DEFAULT_TEST_ROOM, 
+                                                                    to_user = TEST_OWNER_ALIAS, 
+                                                                    from_user = TEST_OWNER_ALIAS, 
+                                                                    mess_type = PUBLIC_MESSAGE,
+                                                                    client_message_id = TEST_CLIENT_MESSAGE_ID)))
+        self.assertEqual(chat_room.num_messages, 1)
+        self.assertIs(chat_room.find_sent_message(TEST_CLIENT_MESSAGE_ID), chat_room.get())
+        restored_room = ChatRoom(room_name = DEFAULT_TEST_ROOM, backend = self.__backend)
+        self.assertEqual(restored_room.num_messages, 1)
+        self.assertIsNotNone(restored_room.find_sent_message(TEST_CLIENT_MESSAGE_ID))
+
+    def test_compressed_body(self):
+        ''' A long message body should be stored compressed, with its codec, and restored as text
+        '''
+        chat_room = ChatRoom(room_name = DEFAULT_TEST_ROOM, owner_alias = TEST_OWNER_ALIAS, create_new = True, backend = self.__backend)
+        long_message = DEFAULT_FULL_CASE_TEST_MESSAGE * 100
+        self.assertTrue(chat_room.send_message(message = long_message,
+                                    from_alias = TEST_OWNER_ALIAS,
+                                    mess_props = MessageProperties(room_name = DEFAULT_TEST_ROOM, 
+                                                                to_user = TEST_OWNER_ALIAS, 
+                                                                from_user = TEST_OWNER_ALIAS, 
+                                                                mess_type = PUBLIC_MESSAGE)))
+        stored_message = self.__backend.read_messages(DEFAULT_TEST_ROOM, 1, 1)[0]
+        self.assertIn('codec', stored_message)
+        self.assertLess(len(stored_message['message']), len(long_message))
+        restored_room = ChatRoom(room_name = DEFAULT_TEST_ROOM, backend = self.__backend)
+        self.assertEqual(restored_room.get().message, long_message)
+
+    def test_feed(self):
+        ''' The feed of a member should merge the messages of every room of the member, newest first, a page at a time
+        '''
+        user_list = UserList(list_name = TEST_USER_LIST, backend = self.__backend)
+        user_list.append(user_list.register(TEST_OWNER_ALIAS))
+        room_list = RoomList(room_list_name = TEST_LIST_NAME, user_list = user_list, backend = self.__backend)
+        for room_number in range(3):
+            feed_room = room_list.create(room_name = f'{DEFAULT_TEST_ROOM}_{room_number}', owner_alias = TEST_OWNER_ALIAS)
+            room_list.add(feed_room)
+        for message_number in range(9):
+            feed_room = room_list.get(f'{DEFAULT_TEST_ROOM}_{message_number % 3}')
+            self.assertTrue(feed_room.send_message(message = f'{DEFAULT_PUBLIC_TEST_MESSAGE} {message_number}',
+                                        from_alias = TEST_OWNER_ALIAS,
+                                        mess_props = MessageProperties(room_name = feed_room.room_name, 
+                                                                    to_user = TEST_OWNER_ALIAS, 
+                                                                    from_user = TEST_OWNER_ALIAS, 
+                                                                    mess_type = PUBLIC_MESSAGE)))
+        feed_texts = list()
+        feed_messages, next_before = room_list.get_feed(member_alias = TEST_OWNER_ALIAS, page_size = 4)
+        while True:
+            feed_texts.extend(current_message.message for current_message in feed_messages)
+            if next_before is None:
+                break
+            feed_messages, next_before = room_list.get_feed(member_alias = TEST_OWNER_ALIAS, before = next_before, page_size = 4)
+        self.assertEqual(feed_texts, [f'{DEFAULT_PUBLIC_TEST_MESSAGE} {message_number}' for message_number in range(8, -1, -1)])
+
+    def test_iter_newest_while_sending(self):
+        ''' Messages sent while the messages of a room are being read newest first should not be read, nor make a message be read twice
+        '''
+        chat_room = ChatRoom(room_name = DEFAULT_TEST_ROOM, owner_alias = TEST_OWNER_ALIAS, create_new = True, backend = self.__backend)
+        for message_number in range(FEED_READ_CHUNK * 2 + 5):
+            self.__send_deferred(chat_room, f'{DEFAULT_PUBLIC_TEST_MESSAGE} {message_number}')
+        newest_messages = chat_room.iter_newest()
+        read_texts = [next(newest_messages).message for _ in range(10)]
+        for message_number in range(FEED_READ_CHUNK + 1):
+            self.__send_deferred(chat_room, DEFAULT_FULL_CASE_TEST_MESSAGE)
+        read_texts.extend(current_message.message for current_message in newest_messages)
+        self.assertEqual(read_texts, [f'{DEFAULT_PUBLIC_TEST_MESSAGE} {message_number}' for message_number in range(FEED_READ_CHUNK * 2 + 4, -1, -1)])
+
+    def test_inbox_restore(self):
+        ''' The inboxes filled by rooms restored in parallel should still be newest first, whatever order the rooms were restored in
+        '''
+        user_list = UserList(list_name = TEST_USER_LIST, backend = self.__backend)
+        room_list = RoomList(room_list_name = TEST_LIST_NAME, user_list = user_list, backend = self.__backend)
+        for room_number in range(3):
+            room_list.add(room_list.create(room_name = f'{DEFAULT_TEST_ROOM}_{room_number}', owner_alias = TEST_OWNER_ALIAS))
+        for message_number in range(9):
+            inbox_room = room_list.get(f'{DEFAULT_TEST_ROOM}_{message_number % 3}')
+            self.assertTrue(inbox_room.send_message(message = f'{DEFAULT_PRIVATE_TEST_MESSAGE} {message_number}',
+                                        from_alias = TEST_OWNER_ALIAS,
+                                        mess_props = MessageProperties(room_name = inbox_room.room_name,
+                                                                    to_user = TEST_MEMBER_ALIAS,
+                                                                    from_user = TEST_OWNER_ALIAS,
+                                                                    mess_type = PRIVATE_MESSAGE,
+                                                                    sent_time = datetime(2022, 3, 1, minute = message_number))))
+        indexed_inbox = room.inbox_index
+        room.inbox_index = InboxIndex()
+        try:
+            RoomList(room_list_name = TEST_LIST_NAME, user_list = user_list, restore_workers = 3, backend = self.__backend)
+            inbox_messages, next_before = room.inbox_index.get_page(to_alias = TEST_MEMBER_ALIAS, page_size = 10)
+            self.assertEqual([current_message.message for current_message in inbox_messages],
+                             [f'{DEFAULT_PRIVATE_TEST_MESSAGE} {message_number}' for message_number in range(8, -1, -1)])
+            self.assertIsNone(next_before)
+        finally:
+            room.inbox_index = indexed_inbox
+
+    def test_catalog(self):
+        ''' Two room lists on the same catalog should both get their changes in, the second one after a version conflict
+        '''
+        user_list = UserList(list_name = TEST_USER_LIST, backend = self.__backend)
+        first_worker = RoomList(room_list_name = TEST_LIST_NAME, user_list = user_list, backend = self.__backend)
+        first_worker.add(first_worker.create(room_name = DEFAULT_TEST_ROOM, owner_alias = TEST_OWNER_ALIAS))
+        second_worker = RoomList(room_list_name = TEST_LIST_NAME, user_list = user_list, backend = self.__backend)
+        self.assertIsNotNone(second_worker.get(DEFAULT_TEST_ROOM))
+        self.assertTrue(first_worker.add_member(room_name = DEFAULT_TEST_ROOM, member_alias = TEST_MEMBER_ALIAS))
+        self.assertTrue(second_worker.add_member(room_name = DEFAULT_TEST_ROOM, member_alias = TEST_USER_LIST))
+        catalog_entry = self.__backend.load_catalog_entry(TEST_LIST_NAME, DEFAULT_TEST_ROOM)
+        self.assertEqual(catalog_entry['version'], 3)
+        self.assertEqual(set(catalog_entry['member_list']), {TEST_OWNER_ALIAS, TEST_MEMBER_ALIAS, TEST_USER_LIST})
+        self.assertFalse(self.__backend.update_catalog_entry(TEST_LIST_NAME, DEFAULT_TEST_ROOM, 1, set_fields = { 'room_type': ROOM_TYPE_PUBLIC }))
+
+    def test_catalog_failure(self):
+        ''' A member change whose catalog entry can not be updated should be undone in the room and reported as a failure
+        '''
+        user_list = UserList(list_name = TEST_USER_LIST, backend = self.__backend)
+        room_list = RoomList(room_list_name = TEST_LIST_NAME, user_list = user_list, backend = self.__backend)
+        chat_room = room_list.create(room_name = DEFAULT_TEST_ROOM, owner_alias = TEST_OWNER_ALIAS, member_list = [TEST_USER_LIST])
+        self.assertTrue(chat_room.persist())
+        room_list.add(chat_room)
+        self.assertTrue(self.__backend.delete_catalog_entry(TEST_LIST_NAME, DEFAULT_TEST_ROOM))
+        self.assertFalse(room_list.add_member(room_name = DEFAULT_TEST_ROOM, member_alias = TEST_MEMBER_ALIAS))
+        self.assertFalse(room_list.get(DEFAULT_TEST_ROOM).is_member(TEST_MEMBER_ALIAS))
+        self.assertFalse(room_list.remove_member(room_name = DEFAULT_TEST_ROOM, member_alias = TEST_USER_LIST))
+        self.assertTrue(room_list.get(DEFAULT_TEST_ROOM).is_member(TEST_USER_LIST))
+        self.assertEqual(set(self.__backend.load_room(DEFAULT_TEST_ROOM)['member_list']), {TEST_OWNER_ALIAS, TEST_USER_LIST})
+
+    def test_metadata_conflict(self):
+        ''' A new room whose metadata another worker stored first should keep the stored metadata instead of overwriting it
+        '''
+        first_room = ChatRoom(room_name = DEFAULT_TEST_ROOM, owner_alias = TEST_OWNER_ALIAS, create_new = True, backend = self.__backend)
+        self.assertTrue(first_room.persist())
+        first_room.set_retention(max_messages = 5)
+        second_room = ChatRoom(room_name = DEFAULT_TEST_ROOM, owner_alias = TEST_MEMBER_ALIAS, room_type = ROOM_TYPE_PUBLIC, create_new = True, backend = self.__backend)
+        self.assertTrue(second_room.persist())
+        stored_metadata = self.__backend.load_room(DEFAULT_TEST_ROOM)
+        self.assertEqual(stored_metadata['owner_alias'], TEST_OWNER_ALIAS)
+        self.assertEqual(stored_metadata['retention_count'], 5)
+        self.assertEqual(second_room.owner_alias, TEST_OWNER_ALIAS)
+        self.assertEqual(second_room.room_type, ROOM_TYPE_PRIVATE)
+        self.assertFalse(second_room.is_member(TEST_MEMBER_ALIAS))
+        self.assertFalse(second_room.dirty)
+
+    def test_concurrent_sends(self):
+        ''' Sends, persists and reads from many threads should keep every message, in the order each thread sent them
+        '''
+        user_list = UserList(list_name = TEST_USER_LIST, backend = self.__backend)
+        room_list = RoomList(room_list_name = TEST_LIST_NAME, user_list = user_list, backend = self.__backend)
+        room_names = [f'{DEFAULT_TEST_ROOM}_{room_num}' for room_num in range(4)]
+
+        def add_room(room_name: str) -> None:
+            new_room = room_list.create(room_name = room_name, owner_alias = TEST_OWNER_ALIAS, room_type = ROOM_TYPE_PUBLIC)
+            if new_room is not None:
+                room_list.add(new_room)
+
+        with ThreadPoolExecutor(max_workers = 8) as add_executor:
+            list(add_executor.map(add_room, room_names * 2))
+        self.assertEqual(sorted(current_room.room_name for current_room in room_list.get_rooms()), room_names)
+        sending_done = threading.Event()
+        read_errors = list()
+
+        def send_messages(sender_num: int) -> None:
+            sender_alias = f'{TEST_MEMBER_ALIAS}_{sender_num}'
+            chat_room = room_list.get(room_names[sender_num % len(room_names)])
+            for message_num in range(200):
+                chat_room.send_message(message = f'{sender_alias} {message_num}',
+                                        from_alias = sender_alias,
+                                        mess_props = MessageProperties(room_name = chat_room.room_name,
+                                                                    to_user = TEST_OWNER_ALIAS,
+                                                                    from_user = sender_alias,
+                                                                    mess_type = PRIVATE_MESSAGE if message_num % 2 else PUBLIC_MESSAGE),
+                                        defer_persist = message_num % 10 != 0)
+
+        def read_messages() -> None:
+            while not sending_done.is_set():
+                for current_room in room_list.get_rooms():
+                    message_texts, message_objects, num_messages = current_room.get_messages(user_alias = TEST_OWNER_ALIAS, num_messages = 50)
+                    if message_texts != [current_message.message for current_message in message_objects] or num_messages != len(message_objects):
+                        read_errors.append(current_room.room_name)
+                    room.inbox_index.get_page(TEST_OWNER_ALIAS)
+
+        readers = [threading.Thread(target = read_messages) for _ in range(4)]
+        for current_reader in readers:
+            current_reader.start()
+        with ThreadPoolExecutor(max_workers = 16) as send_executor:
+            list(send_executor.map(send_messages, range(16)))
+        sending_done.set()
+        for current_reader in readers:
+            current_reader.join()
+        self.assertEqual(read_errors, [])
+        for current_room in room_list.get_rooms():
+            self.assertTrue(current_room.persist())
+            self.assertEqual(current_room.num_pending, 0)
+            self.assertEqual(current_room.num_messages, 4 * 200)
+            self.assertEqual(current_room.last_sequence_num, 4 * 200)
+            stored_messages = list(self.__backend.load_messages(current_room.room_name))
+            self.assertEqual(sorted(current_message['mess_props']['sequence_num'] for current_message in stored_messages), list(range(1, 4 * 200 + 1)))
+            sent_by_alias = dict()
+            for current_message in sorted(stored_messages, key = lambda current_message: current_message['mess_props']['sequence_num']):
+                sent_by_alias.setdefault(current_message['mess_props']['from_user'], list()).append(int(current_message['message'].split()[-1]))
+            for current_sent in sent_by_alias.values():
+                self.assertEqual(current_sent, list(range(200)))
+
+    def test_edit_and_delete(self):
+        ''' Edits and deletes should be found by sequence number, and be restored from the targeted updates
+        '''
+        chat_room = ChatRoom(room_name = DEFAULT_TEST_ROOM, owner_alias = TEST_OWNER_ALIAS, member_list = [TEST_MEMBER_ALIAS], create_new = True, backend = self.__backend)
+        for current_message in (DEFAULT_PUBLIC_TEST_MESSAGE, DEFAULT_PRIVATE_TEST_MESSAGE):
+            self.assertTrue(chat_room.send_message(message = current_message,
+                                        from_alias = TEST_MEMBER_ALIAS,
+                                        mess_props = MessageProperties(room_name = DEFAULT_TEST_ROOM, 
+                                                                    to_user = TEST_OWNER_ALIAS, 
+                                                                    from_user = TEST_MEMBER_ALIAS, 
+                                                                    mess_type = PUBLIC_MESSAGE)))
+        self.assertEqual(chat_room.get_message(1).message, DEFAULT_PUBLIC_TEST_MESSAGE)
+        sent_version = chat_room.version
+        self.assertFalse(chat_room.edit_message(1, DEFAULT_FULL_CASE_TEST_MESSAGE, editor_alias = TEST_OWNER_ALIAS))
+        self.assertEqual(chat_room.version, sent_version)
+        self.assertTrue(chat_room.edit_message(1, DEFAULT_FULL_CASE_TEST_MESSAGE, editor_alias = TEST_MEMBER_ALIAS))
+        self.assertTrue(chat_room.delete_message(2, deleter_alias = TEST_OWNER_ALIAS))
+        self.assertFalse(chat_room.delete_message(2, deleter_alias = TEST_OWNER_ALIAS))
+        self.assertEqual(chat_room.version, sent_version + 2)
+        self.__backend.close()
+        reopened_backend = SegmentLogBackend(root_path = self.__root_path)
+        restored_room = ChatRoom(room_name = DEFAULT_TEST_ROOM, backend = reopened_backend)
+        self.assertEqual(restored_room.num_messages, 2)
+        self.assertEqual(restored_room.get_message(1).message, DEFAULT_FULL_CASE_TEST_MESSAGE)
+        self.assertIsNotNone(restored_room.get_message(1).edit_time)
+        self.assertTrue(restored_room.get_message(2).deleted)
+        self.assertEqual(restored_room.get_message(2).message, '')
+        reopened_backend.close()
+
+    def test_failed_archive(self):
+        ''' Expired messages should stay in the room and in storage when the archive fails, and be archived on the next pass
+        '''
+        chat_room = ChatRoom(room_name = DEFAULT_TEST_ROOM, owner_alias = TEST_OWNER_ALIAS, create_new = True, backend = self.__backend)
+        for current_message_num in range(5):
+            self.assertTrue(chat_room.send_message(message = f'{DEFAULT_PUBLIC_TEST_MESSAGE} {current_message_num}',
+                                        from_alias = TEST_OWNER_ALIAS,
+                                        mess_props = MessageProperties(room_name = DEFAULT_TEST_ROOM,
+                                                                    to_user = TEST_OWNER_ALIAS,
+                                                                    from_user = TEST_OWNER_ALIAS,
+                                                                    mess_type = PUBLIC_MESSAGE)))
+        chat_room.set_retention(max_messages = 2)
+        with self.assertRaises(ConnectionError):
+            chat_room.archive_expired(archive = FailingArchive(archive_file = f'{self.__root_path}/archive.gz'))
+        self.assertEqual(chat_room.num_messages, 5)
+        self.assertFalse(chat_room.get_message(1).expired)
+        self.assertEqual(len(list(self.__backend.load_messages(DEFAULT_TEST_ROOM))), 5)
+        self.assertEqual(chat_room.archive_expired(archive = MessageArchive(archive_file = f'{self.__root_path}/archive.gz')), 3)
+        self.assertEqual(chat_room.num_messages, 2)
+        self.assertIsNone(chat_room.get_message(3))
+        self.assertEqual([current_message['mess_props']['sequence_num'] for current_message in self.__backend.load_messages(DEFAULT_TEST_ROOM)], [4, 5])
+        with gzip.open(f'{self.__root_path}/archive.gz', 'rt') as archive_file:
+            self.assertEqual([json.loads(current_line)['mess_props']['sequence_num'] for current_line in archive_file], [1, 2, 3])
+
+    def test_ephemeral_room(self):
+        ''' An ephemeral room should number its messages locally, keep only the ring buffer, archive its samples and store no messages
+        '''
+        chat_room = ChatRoom(room_name = EPHEMERAL_TEST_ROOM, owner_alias = TEST_OWNER_ALIAS, room_type = ROOM_TYPE_EPHEMERAL, create_new = True, backend = self.__backend)
+        chat_room.persist()
+        chat_room.set_archive_sampling(sample_every = 100)
+        num_indexed = room.inbox_index.num_messages(TEST_OWNER_ALIAS)
+        for current_message_num in range(EPHEMERAL_BUFFER_SIZE + 250):
+            self.assertTrue(chat_room.send_message(message = f'{DEFAULT_PUBLIC_TEST_MESSAGE} {current_message_num}',
+                                        from_alias = TEST_MEMBER_ALIAS,
+                                        mess_props = MessageProperties(room_name = EPHEMERAL_TEST_ROOM, 
+                                                                    to_user = TEST_OWNER_ALIAS, 
+                                                                    from_user = TEST_MEMBER_ALIAS, 
+                                                                    mess_type = PRIVATE_MESSAGE if current_message_num % 2 else PUBLIC_MESSAGE)))
+        self.assertEqual(chat_room.num_messages, EPHEMERAL_BUFFER_SIZE)
+        self.assertEqual(room.inbox_index.num_messages(TEST_OWNER_ALIAS), num_indexed)
+        self.assertEqual(chat_room.num_pending, 0)
+        self.assertEqual(chat_room.last_sequence_num, EPHEMERAL_BUFFER_SIZE + 250)
+        self.assertIsNone(chat_room.get_message(250))
+        self.assertEqual(chat_room.get_message(251).message, f'{DEFAULT_PUBLIC_TEST_MESSAGE} 250')
+        self.assertEqual(len(list(self.__backend.load_messages(EPHEMERAL_TEST_ROOM))), 0)
+        archive = MessageArchive(archive_file = f'{self.__root_path}/archive.gz')
+        self.assertEqual(chat_room.archive_expired(archive = archive), 2)
+        with gzip.open(f'{self.__root_path}/archive.gz', 'rt') as archive_file:
+            self.assertEqual([json.loads(current_line)['mess_props']['sequence_num'] for current_line in archive_file], [100, 200])
+        restored_room = ChatRoom(room_name = EPHEMERAL_TEST_ROOM, backend = self.__backend)
+        self.assertTrue(restored_room.ephemeral)
+        self.assertEqual(restored_room.num_messages, 0)
+        self.assertEqual(restored_room.archive_sample_every, 100)
+
+    def test_time_range_and_stats(self):
+        ''' Messages should be read by the time the room received them, and the activity counters should count every message once, even after a restore
+        '''
+        chat_room = ChatRoom(room_name = DEFAULT_TEST_ROOM, owner_alias = TEST_OWNER_ALIAS, room_type = ROOM_TYPE_PUBLIC, create_new = True, backend = self.__backend)
+        for current_message_num in range(5):
+            if current_message_num == 3:
+                time.sleep(0.01)
+                middle_time = datetime.now()
+                time.sleep(0.01)
+            self.assertTrue(chat_room.send_message(message = f'{DEFAULT_PUBLIC_TEST_MESSAGE} {current_message_num}',
+                                        from_alias = TEST_MEMBER_ALIAS if current_message_num % 2 else TEST_OWNER_ALIAS,
+                                        mess_props = MessageProperties(room_name = DEFAULT_TEST_ROOM,
+                                                                    to_user = TEST_OWNER_ALIAS,
+                                                                    from_user = TEST_MEMBER_ALIAS if current_message_num % 2 else TEST_OWNER_ALIAS,
+                                                                    mess_type = PUBLIC_MESSAGE)))
+        self.assertEqual(chat_room.get_messages(user_alias = TEST_OWNER_ALIAS, since = middle_time)[0], [f'{DEFAULT_PUBLIC_TEST_MESSAGE} {message_num}' for message_num in (4, 3)])
+        self.assertEqual(chat_room.get_messages(user_alias = TEST_OWNER_ALIAS, until = middle_time, num_messages = 2)[0], [f'{DEFAULT_PUBLIC_TEST_MESSAGE} {message_num}' for message_num in (0, 1)])
+        self.assertEqual(chat_room.get_messages(user_alias = TEST_OWNER_ALIAS, since = datetime.now())[2], 0)
+        restored_room = ChatRoom(room_name = DEFAULT_TEST_ROOM, backend = self.__backend)
+        for current_room in (chat_room, restored_room):
+            activity = current_room.activity_stats()
+            self.assertEqual(activity['num_messages'], 5)
+            self.assertEqual(activity['senders'], { TEST_OWNER_ALIAS: 3, TEST_MEMBER_ALIAS: 2 })
+            self.assertEqual(sum(current_bucket['num_messages'] for current_bucket in activity['per_minute']), 5)
+            self.assertEqual(activity['last_activity'], chat_room.get_message(5).message_properties.rec_time)
+        self.assertEqual(restored_room.get_messages(user_alias = TEST_OWNER_ALIAS, since = middle_time)[2], 2)
+
+    def test_storage_outage(self):
+        ''' Messages sent while storage is down should be accepted, spooled, and persisted in order once it is back or after a restart
+        '''
+        healthy_breaker = room.storage_breaker
+        room.storage_breaker = CircuitBreaker(failure_threshold = 1, reset_seconds = 0)
+        flaky_backend = FlakyBackend(root_path = os.path.join(self.__root_path, 'flaky'))
+        spool_dir = os.path.join(self.__root_path, SPOOL_DIR)
+        try:
+            chat_room = ChatRoom(room_name = DEFAULT_TEST_ROOM, owner_alias = TEST_OWNER_ALIAS, create_new = True, backend = flaky_backend, spool_dir = spool_dir)
+            self.assertTrue(chat_room.persist())
+            flaky_backend.failing = True
+            for current_message_num in range(6):
+                self.assertTrue(chat_room.send_message(message = f'{DEFAULT_PUBLIC_TEST_MESSAGE} {current_message_num}',
+                                            from_alias = TEST_OWNER_ALIAS,
+                                            mess_props = MessageProperties(room_name = DEFAULT_TEST_ROOM, 
+                                                                        to_user = TEST_OWNER_ALIAS, 
+                                                                        from_user = TEST_OWNER_ALIAS, 
+                                                                        mess_type = PUBLIC_MESSAGE)))
+                if current_message_num == 2:
+                    flaky_backend.failing = False
+                    self.assertTrue(chat_room.persist())
+                    self.assertEqual(chat_room.num_spooled, 0)
+                    flaky_backend.failing = True
+            self.assertTrue(room.storage_breaker.degraded)
+            self.assertEqual(chat_room.num_pending, 3)
+            self.assertEqual(chat_room.num_spooled, 3)
+            flaky_backend.failing = False
+            restarted_room = ChatRoom(room_name = DEFAULT_TEST_ROOM, backend = flaky_backend, spool_dir = spool_dir)
+            self.assertEqual(restarted_room.num_pending, 3)
+            self.assertTrue(restarted_room.persist())
+            self.assertFalse(room.storage_breaker.degraded)
+            self.assertEqual(restarted_room.num_spooled, 0)
+            self.assertEqual(os.listdir(spool_dir), [])
+            self.assertEqual([current_message['message'] for current_message in flaky_backend.load_messages(DEFAULT_TEST_ROOM)],
+                             [f'{DEFAULT_PUBLIC_TEST_MESSAGE} {current_message_num}' for current_message_num in range(6)])
+            self.assertEqual(restarted_room.last_sequence_num, 6)
+        finally:
+            room.storage_breaker = healthy_breaker
+            flaky_backend.close()
+
+    def test_storage_outage_changes(self):
+        ''' Edits, deletes, members and retention should be refused while storage is down, and leave the room in memory as it was
+        '''
+        healthy_breaker = room.storage_breaker
+        room.storage_breaker = CircuitBreaker(failure_threshold = 1, reset_seconds = 60)
+        flaky_backend = FlakyBackend(root_path = os.path.join(self.__root_path, 'flaky'))
+        try:
+            chat_room = ChatRoom(room_name = DEFAULT_TEST_ROOM, owner_alias = TEST_OWNER_ALIAS, create_new = True, backend = flaky_backend)
+            self.__send_deferred(chat_room, DEFAULT_PUBLIC_TEST_MESSAGE)
+            self.assertTrue(chat_room.persist())
+            sent_version = chat_room.version
+            flaky_backend.failing = True
+            with self.assertRaises(StorageUnavailable):
+                chat_room.edit_message(1, DEFAULT_FULL_CASE_TEST_MESSAGE, editor_alias = TEST_OWNER_ALIAS)
+            self.assertTrue(room.storage_breaker.degraded)
+            with self.assertRaises(StorageUnavailable):
+                chat_room.delete_message(1, deleter_alias = TEST_OWNER_ALIAS)
+            with self.assertRaises(StorageUnavailable):
+                chat_room.add_member(TEST_MEMBER_ALIAS)
+            with self.assertRaises(StorageUnavailable):
+                chat_room.set_retention(max_messages = 1)
+            self.assertEqual(chat_room.get_message(1).message, DEFAULT_PUBLIC_TEST_MESSAGE)
+            self.assertIsNone(chat_room.get_message(1).edit_time)
+            self.assertFalse(chat_room.get_message(1).deleted)
+            self.assertFalse(chat_room.is_member(TEST_MEMBER_ALIAS))
+            self.assertEqual(chat_room.version, sent_version)
+            flaky_backend.failing = False
+            room.storage_breaker = CircuitBreaker(failure_threshold = 1, reset_seconds = 60)
+            self.assertTrue(chat_room.edit_message(1, DEFAULT_FULL_CASE_TEST_MESSAGE, editor_alias = TEST_OWNER_ALIAS))
+            self.assertTrue(chat_room.add_member(TEST_MEMBER_ALIAS))
+            restored_room = ChatRoom(room_name = DEFAULT_TEST_ROOM, backend = flaky_backend)
+            self.assertEqual(restored_room.get_message(1).message, DEFAULT_FULL_CASE_TEST_MESSAGE)
+            self.assertEqual(restored_room.get_message(1).edit_time, chat_room.get_message(1).edit_time)
+            self.assertTrue(restored_room.is_member(TEST_MEMBER_ALIAS))
+        finally:
+            room.storage_breaker = healthy_breaker
+            flaky_backend.close()
+
+    def test_spool_path(self):
+        ''' A room named with path separators should still keep its spool file in the spool directory
+        '''
+        healthy_breaker = room.storage_breaker
+        room.storage_breaker = CircuitBreaker(failure_threshold = 1, reset_seconds = 60)
+        flaky_backend = FlakyBackend(root_path = os.path.join(self.__root_path, 'flaky'))
+        spool_parent = os.path.join(self.__root_path, 'spool_parent')
+        try:
+            chat_room = ChatRoom(room_name = ESCAPING_TEST_ROOM, owner_alias = TEST_OWNER_ALIAS, create_new = True, backend = flaky_backend, spool_dir = os.path.join(spool_parent, SPOOL_DIR))
+            flaky_backend.failing = True
+            self.__send_deferred(chat_room, DEFAULT_PUBLIC_TEST_MESSAGE)
+            self.assertFalse(chat_room.persist())
+            self.assertEqual(os.listdir(spool_parent), [SPOOL_DIR])
+            self.assertEqual(os.listdir(os.path.join(spool_parent, SPOOL_DIR)), [quote(ESCAPING_TEST_ROOM, safe = '') + SPOOL_SUFFIX])
+        finally:
+            room.storage_breaker = healthy_breaker
+            flaky_backend.close()
+
+    def test_read_cursor_flush(self):
+        ''' A pending read cursor should be stored by the flush job once the flush interval passed, with no further marks
+        '''
+        read_cursors = ReadCursors(flush_seconds = 0.05, backend = self.__backend)
+        self.assertTrue(read_cursors.mark_read(alias = TEST_OWNER_ALIAS, room_name = DEFAULT_TEST_ROOM, sequence_num = 1))
+        self.assertEqual(read_cursors.num_pending, 1)
+        app_read_cursors = room_chat_api.read_cursors
+        room_chat_api.read_cursors = read_cursors
+        try:
+            with self.assertRaises(asyncio.TimeoutError):
+                asyncio.run(asyncio.wait_for(room_chat_api.flush_read_cursors(), timeout = 0.3))
+        finally:
+            room_chat_api.read_cursors = app_read_cursors
+        self.assertEqual(read_cursors.num_pending, 0)
+        self.assertEqual(ReadCursors(backend = self.__backend).get(alias = TEST_OWNER_ALIAS, room_name = DEFAULT_TEST_ROOM), 1)
+
+    def test_chat_room(self):
+        ''' A ChatRoom on the segment backend should persist its metadata and messages and restore them
+        '''
+        chat_room = ChatRoom(room_name = DEFAULT_TEST_ROOM, owner_alias = TEST_OWNER_ALIAS, create_new = True, backend = self.__backend)
+        self.assertTrue(chat_room.send_message(message = DEFAULT_FULL_CASE_TEST_MESSAGE,
+                                    from_alias = TEST_OWNER_ALIAS,
+                                    mess_props = MessageProperties(room_name = DEFAULT_TEST_ROOM, 
+                                                                to_user = TEST_OWNER_ALIAS, 
+                                                                from_user = TEST_OWNER_ALIAS, 
+                                                                mess_type = PUBLIC_MESSAGE)))
+        self.assertTrue(chat_room.add_member(member_alias = TEST_MEMBER_ALIAS))
+        restored_room = ChatRoom(room_name = DEFAULT_TEST_ROOM, backend = self.__backend)
+        self.assertEqual(restored_room.num_messages, 1)
+        self.assertTrue(restored_room.is_member(TEST_MEMBER_ALIAS))
+        self.assertEqual(restored_room.last_sequence_num, 1)
+
+class SegmentLifespanTest(unittest.TestCase):
+    """ This test environment will start the API on the segment log backend, in a temporary directory, with no mongo to reach
+    """
+    def setUp(self) -> None:
+        self.__root_path = tempfile.mkdtemp()
+        self.__environment = { current_name: os.environ.get(current_name) for current_name in (STORAGE_BACKEND_ENV, STORAGE_PATH_ENV) }
+        os.environ[STORAGE_BACKEND_ENV] = STORAGE_BACKEND_SEGMENT
+        os.environ[STORAGE_PATH_ENV] = self.__root_path
+        self.__default_backend = storage.default_storage_backend
+        self.__mongo_client = storage.MongoClient
+        storage.default_storage_backend = None
+        storage.MongoClient = unreachable_mongo_client
+
+    def tearDown(self) -> None:
+        if storage.default_storage_backend is not None:
+            storage.default_storage_backend.close()
+        storage.default_storage_backend = self.__default_backend
+        storage.MongoClient = self.__mongo_client
+        for current_name, current_value in self.__environment.items():
+            if current_value is None:
+                os.environ.pop(current_name, None)
+            else:
+                os.environ[current_name] = current_value
+        shutil.rmtree(self.__root_path)
+
+    def test_lifespan(self):
+        ''' The app should warm up and keep its users, rooms, read cursors and archive in the segment backend without mongo
+        '''
+        with TestClient(room_chat_api.app) as test_client:
+            self.assertEqual(test_client.get('/readyz').status_code, 200)
+            self.assertEqual(test_client.post('/alias', params = { 'client_alias': TEST_OWNER_ALIAS }).status_code, 201)
+            self.assertEqual(test_client.post('/room', params = { 'room_name': DEFAULT_TEST_ROOM, 'owner_alias': TEST_OWNER_ALIAS }).status_code, 201)
+            self.assertTrue(room_chat_api.read_cursors.mark_read(alias = TEST_OWNER_ALIAS, room_name = DEFAULT_TEST_ROOM, sequence_num = 1))
+            self.assertEqual(room_chat_api.message_archive.load(DEFAULT_TEST_ROOM), [])
+        self.assertIsInstance(storage.default_storage_backend, SegmentLogBackend)
+        self.assertTrue(storage.default_storage_backend.room_exists(DEFAULT_TEST_ROOM))
+        self.assertEqual(ReadCursors(backend = storage.default_storage_backend).get(alias = TEST_OWNER_ALIAS, room_name = DEFAULT_TEST_ROOM), 1)
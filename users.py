@@ -1,8 +1,9 @@
 import queue
 import logging
+import threading
 from constants import *
 from datetime import date, datetime
-from pymongo import MongoClient
+from storage import StorageBackend, get_default_backend
 from constants import *
 
 logging.basicConfig(filename='message_chat.log', level=logging.DEBUG, format = LOG_FORMAT, filemode = 'w')
@@ -46,19 +47,36 @@ class ChatUser():
 class UserList():
     """ List of users, inheriting list class
     """
-    def __init__(self, list_name: str = DEFAULT_USER_LIST_NAME) -> None:
+    def __init__(self, list_name: str = DEFAULT_USER_LIST_NAME, restore: bool = True, backend: StorageBackend = None) -> None:
+        ''' NOTE: with restore set to False the list starts empty, and restore() has to be called to load it (e.g. in a warm-up thread)
+            NOTE: the users are kept in the storage backend given, or the default one (mongo unless configured otherwise)
+            NOTE: the lock guards the users held in memory, the persist lock keeps one persist of the list running at a time
+        '''
         self.__list_name = list_name
         self.__user_list = list()
-        self.__mongo_client = MongoClient('mongodb://34.94.157.136:27017/')
-        self.__mongo_db = self.__mongo_client.MONGO_DB
-        self.__mongo_collection = self.__mongo_db.users  
+        self.__users_by_alias = dict()
+        self.__backend = backend if backend is not None else get_default_backend()
+        self.__create_time = datetime.now()
+        self.__modify_time = datetime.now()
+        self.__dirty = True
+        self.__lock = threading.Lock()
+        self.__persist_lock = threading.Lock()
+        if restore is True:
+            self.restore()
+
+    # This property is to get the number of users in the list
+    @property
+    def num_users(self):
+        return len(self.__user_list)
+
+    def restore(self) -> bool:
+        ''' This method will load the user list and its users from the collection, if the user list was persisted before
+        '''
         if self.__restore() is True:
             logging.info('UserList Document was found in the collection.')
             self.__dirty = False
-        else:
-            self.__create_time = datetime.now()
-            self.__modify_time = datetime.now()
-            self.__dirty = True
+            return True
+        return False
 
     # This property is just to the the list of users
     @property
@@ -68,7 +86,7 @@ class UserList():
     # This property is to get the list of user_aliases
     @property
     def user_aliases(self):
-        return self.get_all_users_aliases
+        return self.get_all_users_aliases()
     
     def register(self, new_alias: str) -> ChatUser:
         """ This method will just return a new ChatUser that will need to be added to the UserList
@@ -81,21 +99,22 @@ class UserList():
 
     def get(self, target_alias: str) -> ChatUser:
         ''' This method will return the user from the user_list
-            NOTE: this method will utilize the index to find the user
+            NOTE: this method will utilize the alias index to find the user
         '''
-        for user_index in range(0, len(self.__user_list)):
-            if target_alias == self.__user_list[user_index].alias:
-                logging.debug(f'User {target_alias} was found in user list {self.__list_name}.')
-                return self.__user_list[user_index]
-        logging.debug(f'User {target_alias} was not found in user list {self.__list_name}.')
-        return None
+        found_user = self.__users_by_alias.get(target_alias)
+        if found_user is None:
+            logging.debug(f'User {target_alias} was not found in user list {self.__list_name}.')
+        else:
+            logging.debug(f'User {target_alias} was found in user list {self.__list_name}.')
+        return found_user
 
     def get_all_users_aliases(self) -> list:
         ''' This method will just return the list of names as a result.
             NOTE: This list should not be empty as there should at least be an owner to the list
         '''
         logging.debug(f'Attempting to get all user aliases in {self.__list_name}.')
-        return [user.alias for user in self.__user_list]
+        with self.__lock:
+            return [user.alias for user in self.__user_list]
 
     def append(self, new_user: ChatUser) -> bool:
         ''' This method will add the user to the to the list of users
@@ -105,10 +124,14 @@ class UserList():
         if new_user is None:
             logging.warning('The user was not registered correctly. (The user may already exist and was restored)')
             return False
-        if new_user.alias in self.get_all_users_aliases():
-            logging.debug(f'Alias {new_user.alias} is an already existing user.')
-            return False
-        self.__user_list.append(new_user)
+        with self.__lock:
+            if new_user.alias in self.__users_by_alias:
+                logging.debug(f'Alias {new_user.alias} is an already existing user.')
+                return False
+            self.__user_list.append(new_user)
+            self.__users_by_alias[new_user.alias] = new_user
+            self.__modify_time = datetime.now()
+            self.__dirty = True
         logging.debug(f'Alias {new_user.alias} added to the list of users.')
         self.__persist()
         return True
@@ -119,7 +142,7 @@ class UserList():
             NOTE: we may not need the user aliases since we just want to restore all of the users            
         """
         logging.info(f'Attempting to restore user list metadata from {self.__list_name}.')
-        queue_metadata = self.__mongo_collection.find_one( { 'list_name': self.__list_name })
+        queue_metadata = self.__backend.load_user_list(self.__list_name)
         if queue_metadata is None:
             logging.debug(f'{self.__list_name} user list was not found in the mongo collection.')
             return False
@@ -128,14 +151,20 @@ class UserList():
         self.__modify_time = queue_metadata['modify_time']
         self.__user_aliases = queue_metadata['user_names']
         logging.info(f'Attempting to restore users to the {self.__list_name} list.')
+        users_metadata = { current_user_metadata['alias']: current_user_metadata
+                            for current_user_metadata in self.__backend.load_users(self.__user_aliases) }
         for current_user_alias in self.__user_aliases:
-            current_user_metadata = self.__mongo_collection.find_one({ 'alias' : current_user_alias })
+            current_user_metadata = users_metadata.get(current_user_alias)
+            if current_user_metadata is None:
+                logging.warning(f'User {current_user_alias} is in {self.__list_name} but has no document in the collection.')
+                continue
             new_chat_user = ChatUser(alias = current_user_metadata['alias'],
                                     user_id = current_user_metadata['_id'],
                                     create_time = current_user_metadata['create_time'],
                                     modify_time = current_user_metadata['modify_time'])
             logging.debug(current_user_metadata['alias'] + ' was added to the user list.')
             self.__user_list.append(new_chat_user)
+            self.__users_by_alias[new_chat_user.alias] = new_chat_user
         logging.info(f'All users in {self.__list_name} added to the user list.')
         return True
 
@@ -145,27 +174,33 @@ class UserList():
             NOTE: persisting metadata first then persisting all users in user_list        
         """
         logging.info(f'Attemping to persist user list {self.__list_name}.')
-        if self.__mongo_collection.find_one({ 'list_name': self.__list_name }) is None:
-            self.__mongo_collection.insert_one({ 'list_name': self.__list_name,
-                                                'create_time': self.__create_time,
-                                                'modify_time': self.__modify_time,
-                                                'user_names' : self.get_all_users_aliases()})
+        with self.__persist_lock:
+            self.__persist_users()
+
+    def __persist_users(self):
+        """ This is a helper method that does the work of __persist(), with the persist lock held
+        """
+        if self.__backend.load_user_list(self.__list_name) is None:
+            self.__backend.save_user_list({ 'list_name': self.__list_name,
+                                            'create_time': self.__create_time,
+                                            'modify_time': self.__modify_time,
+                                            'user_names' : self.get_all_users_aliases()})
             logging.debug(f'New user list {self.__list_name} added to the collection.')
         else:
             if self.__dirty == True:
-                self.__mongo_collection.replace_one(filter = { 'list_name': self.__list_name},
-                                                    replacement = { 'list_name': self.__list_name,
-                                                                'create_time': self.__create_time, 
-                                                                'modify_time': self.__modify_time, 
-                                                                'user_names' : self.get_all_users_aliases()},
-                                                    upsert = True)
+                self.__backend.save_user_list({ 'list_name': self.__list_name,
+                                                'create_time': self.__create_time, 
+                                                'modify_time': self.__modify_time, 
+                                                'user_names' : self.get_all_users_aliases()})
                 logging.debug(f'User list {self.__list_name} has been updated in the collection.')
         self.__dirty = False
-        for current_user in self.__user_list:
+        with self.__lock:
+            current_users = list(self.__user_list)
+        for current_user in current_users:
             if current_user.dirty == True:
-                if current_user.user_id is None or self.__mongo_collection.find_one({ 'alias' : current_user.alias }) is None:
+                if current_user.user_id is None or len(self.__backend.load_users([current_user.alias])) is EMPTY:
                     serialized = current_user.to_dict()
-                    self.__mongo_collection.insert_one(serialized)
+                    self.__backend.insert_user(serialized)
                     logging.debug(f'User {current_user.alias} has been added to the collection.')
                     current_user.dirty = False
     
@@ -175,11 +210,13 @@ class UserList():
         '''
         logging.info(f'Attempting to remove all users from the user collection.')
         for current_user in self.__user_list:
-            if self.__mongo_collection.find_one({ 'alias' : current_user.alias }) is not None:
-                self.__mongo_collection.delete_one({ 'alias' : current_user.alias })
+            if self.__backend.delete_user(current_user.alias) is True:
                 logging.debug(f'{current_user.alias} was removed from the collection of users.')
             else:
                 logging.debug(f'{current_user.alias} was not found in the user collection. Failed to remove the user.')
-        self.__user_list.clear()
+        with self.__lock:
+            self.__user_list.clear()
+            self.__users_by_alias.clear()
+            self.__dirty = True
         self.__persist()
         return True
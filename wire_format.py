@@ -0,0 +1,96 @@
+import orjson
+import logging
+from datetime import datetime
+from constants import *
+
+logging.basicConfig(filename='message_chat.log', level=logging.DEBUG, format = LOG_FORMAT)
+
+''' msgpack is optional, without it every request and response is JSON
+'''
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+''' The schema shared by the JSON and MessagePack bodies of the message endpoints:
+        - A message is ChatMessage.to_dict(), its datetimes are ISO 8601 strings in both encodings
+        - A message to send is a map of SEND_FIELDS, message, from_alias and to_alias are required
+    NOTE: the same content encodes to the same values either way, only the bytes differ
+'''
+SEND_FIELDS = ('message', 'from_alias', 'to_alias', 'client_message_id')
+REQUIRED_SEND_FIELDS = ('message', 'from_alias', 'to_alias')
+
+def available_media_types() -> tuple:
+    ''' This function will return the media types the message endpoints can use here, binary first
+    '''
+    if msgpack is not None:
+        return (MEDIA_TYPE_MSGPACK, MEDIA_TYPE_JSON)
+    return (MEDIA_TYPE_JSON,)
+
+def is_msgpack(media_type: str) -> bool:
+    ''' This function will check if a Content-Type or media type is one of the MessagePack ones
+    '''
+    return media_type is not None and media_type.split(';')[0].strip().lower() in MSGPACK_MEDIA_TYPES
+
+def negotiate_media_type(accept: str) -> str:
+    ''' This function will pick MessagePack if the Accept header asks for it and msgpack is installed, JSON otherwise
+        NOTE: media types with q=0 are refused, JSON is the answer to everything else (*/* or no Accept header)
+    '''
+    if msgpack is None or accept is None:
+        return MEDIA_TYPE_JSON
+    for current_type in accept.split(','):
+        media_type, _, quality = current_type.partition(';')
+        quality = quality.replace(' ', '')
+        if quality.startswith('q='):
+            try:
+                if float(quality[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        if is_msgpack(media_type):
+            return MEDIA_TYPE_MSGPACK
+    return MEDIA_TYPE_JSON
+
+def __encode_extra(value):
+    ''' This is a helper function for the values msgpack can not encode by itself, datetimes become the same strings orjson makes
+    '''
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} can not be encoded.')
+
+def encode_body(content, media_type: str = MEDIA_TYPE_JSON) -> bytes:
+    ''' This function will encode the content of a response as media_type
+    '''
+    if media_type == MEDIA_TYPE_MSGPACK:
+        return msgpack.packb(content, default = __encode_extra, use_bin_type = True)
+    return orjson.dumps(content)
+
+def decode_body(body: bytes, content_type: str = MEDIA_TYPE_JSON):
+    ''' This function will decode the body of a request by its Content-Type (JSON unless it is a MessagePack type)
+        NOTE: a body that can not be decoded raises a ValueError
+    '''
+    try:
+        if is_msgpack(content_type):
+            if msgpack is None:
+                raise ValueError('msgpack is not installed.')
+            return msgpack.unpackb(body, raw = False)
+        return orjson.loads(body)
+    except ValueError:
+        raise
+    except Exception as decode_error:
+        raise ValueError(f'The body could not be decoded as {content_type}.') from decode_error
+
+def read_sends(content) -> list:
+    ''' This function will check the decoded body of a bulk send against the schema and return its messages to send
+        NOTE: the body is a list of maps of SEND_FIELDS, anything else raises a ValueError
+    '''
+    if not isinstance(content, list):
+        raise ValueError('A bulk send is a list of messages.')
+    sends = list()
+    for current_send in content:
+        if not isinstance(current_send, dict) or any(not isinstance(current_send.get(field_name), str) for field_name in REQUIRED_SEND_FIELDS):
+            raise ValueError(f'{current_send} is not a message to send.')
+        if current_send.get('client_message_id') is not None and not isinstance(current_send['client_message_id'], str):
+            raise ValueError(f'{current_send["client_message_id"]} is not a client message id.')
+        sends.append({ field_name: current_send.get(field_name) for field_name in SEND_FIELDS })
+    return sends
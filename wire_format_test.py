@@ -0,0 +1,50 @@
+import unittest
+from datetime import datetime
+from constants import *
+from room import ChatMessage, MessageProperties
+from wire_format import available_media_types, decode_body, encode_body, negotiate_media_type, read_sends
+
+class WireFormatTest(unittest.TestCase):
+    """ This test environment will test the JSON and MessagePack bodies of the message endpoints
+    """
+    def __message(self) -> dict:
+        ''' This is a helper method to build the response content of one message
+        '''
+        return { 'message': { 'data': ChatMessage(message = DEFAULT_PUBLIC_TEST_MESSAGE,
+                                                  mess_props = MessageProperties(room_name = DEFAULT_TEST_ROOM,
+                                                                                to_user = TEST_MEMBER_ALIAS,
+                                                                                from_user = TEST_OWNER_ALIAS,
+                                                                                mess_type = PUBLIC_MESSAGE,
+                                                                                sequence_num = 1,
+                                                                                sent_time = datetime(2022, 3, 1, 12, 30, 15, 250),
+                                                                                rec_time = datetime(2022, 3, 1))).to_dict() }}
+
+    def test_same_values(self):
+        ''' Both encodings of a message should decode to the same values, datetimes included
+        '''
+        for media_type in available_media_types():
+            decoded = decode_body(encode_body(self.__message(), media_type), media_type)
+            self.assertEqual(decoded, decode_body(encode_body(self.__message())))
+            self.assertEqual(decoded['message']['data']['mess_props']['sent_time'], '2022-03-01T12:30:15.000250')
+
+    def test_negotiate_media_type(self):
+        ''' MessagePack should only be picked when it is asked for and installed
+        '''
+        self.assertEqual(negotiate_media_type(None), MEDIA_TYPE_JSON)
+        self.assertEqual(negotiate_media_type('*/*'), MEDIA_TYPE_JSON)
+        self.assertEqual(negotiate_media_type(f'{MEDIA_TYPE_MSGPACK};q=0, {MEDIA_TYPE_JSON}'), MEDIA_TYPE_JSON)
+        self.assertEqual(negotiate_media_type(f'application/x-msgpack, {MEDIA_TYPE_JSON};q=0.5'), available_media_types()[0])
+
+    def test_read_sends(self):
+        ''' A bulk send should follow the schema, and a body that does not should raise a ValueError
+        '''
+        sends = read_sends([{ 'message': DEFAULT_PUBLIC_TEST_MESSAGE, 'from_alias': TEST_OWNER_ALIAS, 'to_alias': TEST_MEMBER_ALIAS }])
+        self.assertIsNone(sends[0]['client_message_id'])
+        with self.assertRaises(ValueError):
+            read_sends({ 'message': DEFAULT_PUBLIC_TEST_MESSAGE })
+        with self.assertRaises(ValueError):
+            read_sends([{ 'message': DEFAULT_PUBLIC_TEST_MESSAGE, 'from_alias': TEST_OWNER_ALIAS }])
+        with self.assertRaises(ValueError):
+            decode_body(b'\xc1', MEDIA_TYPE_MSGPACK)
+        with self.assertRaises(ValueError):
+            decode_body(b'{not json')